@@ -1,58 +1,99 @@
 """
 Pipeline for final film
+
+Submodules (and the managers) are only imported when
+first used, so loading the shelf stays cheap; see
+importReport() for what that costs. Set SNP_DEV_RELOAD
+to reload everything on each shelf click (when working
+on the pipeline itself)
 """
 import os
-import inspect
+import sys
+import time
+_start = time.time()
 
-import utilities
-reload(utilities)
-import dataTypes
-reload(dataTypes)
-import core
-reload(core)
+import importlib
+import importtimer
 
 PROJECT_ROOT_VAR="FINAL_FILM_ROOT"
-ROOT_DIR = os.path.normpath(os.environ[PROJECT_ROOT_VAR])
 
-BLENDER_DIR = os.path.normpath(os.environ["BLENDER_DIR"]).replace('"', '')
-BLENDER_SCRIPTS_DIR = os.path.normpath(os.path.join(os.path.dirname(inspect.getfile(core)), "blender"))
+# (None if the environment isn't set up, so the package still imports)
+ROOT_DIR = os.path.normpath(os.environ[PROJECT_ROOT_VAR]) if PROJECT_ROOT_VAR in os.environ else None
+
+BLENDER_DIR = os.path.normpath(os.environ["BLENDER_DIR"]).replace('"', '') if "BLENDER_DIR" in os.environ else None
+BLENDER_SCRIPTS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "blender"))
+
+DEV_RELOAD = bool(os.environ.get("SNP_DEV_RELOAD"))
+
+# Submodules, dependencies before the modules using them (for reloadAll)
+MODULES = ["mayaadapter", "utilities", "dataTypes", "copyengine", "deepcheck", "archive",
+           "deltastore", "assetindex", "watcher", "mafile", "depgraph", "core", "shellinterop",
+           "backupman", "renderqueue", "renderjournal", "footage", "rendermetrics", "rendercore",
+           "blenderinterop", "seq_rendercore",
+           "gui.misc", "gui.assetManager", "gui.renderManager"]
+
+
+def load(name):
+    """
+    Import a submodule (like "core" or "gui.assetManager"),
+    timing whatever that pulls in the first time
+
+    @RETURNS
+        the module
+    """
+    fullname = __name__ + "." + name
+
+    if fullname in sys.modules:
+        return sys.modules[fullname]
+
+    with importtimer.timed():
+        return importlib.import_module(fullname)
 
-import backupman
-reload(backupman)
-import blenderinterop
-reload(blenderinterop)
-import rendercore
-reload(rendercore)
-import seq_rendercore
-reload(seq_rendercore)
 
-import gui
-reload(gui)
+def reloadAll():
+    """
+    Reload the submodules that have been imported so far
+    """
+    for name in MODULES:
+        module = sys.modules.get(__name__ + "." + name)
+
+        if module is not None:
+            reload(module)
+
+
+def importReport():
+    """
+    Print how long importing the pipeline took, per module (in ms)
+    """
+    print "%10.1f %10s  %s (package)" % (_initTime * 1000.0, "", __name__)
+    importtimer.report()
 
 
 def createAssetManager(atype):
     # Make Manager
-    manager = gui.assetManager.AssetManager(atype)
+    manager = load("gui.assetManager").AssetManager(atype)
 
     return manager
 
 def createShotManager():
     # Make Manager
-    manager = gui.assetManager.ShotManager()
+    manager = load("gui.assetManager").ShotManager()
 
     return manager
 
 def createRenderManager():
     # Make Manager
-    manager = gui.renderManager.RenderManagerUI()
+    manager = load("gui.renderManager").RenderManagerUI()
 
     return manager
 
 def backupProject():
-    backupman.backupProject(ROOT_DIR)
+    load("backupman").backupProject(ROOT_DIR)
 
 def syncToUSB():
-    gui.misc.DialogBoxUI("Sync TO flash drive?",
+    backupman = load("backupman")
+
+    load("gui.misc").DialogBoxUI("Sync TO flash drive?",
                          message="Sync TO the flash drive? (PC -> USB)",
                          hasField=False,
                          requireField=False,
@@ -61,8 +102,11 @@ def syncToUSB():
                          yesAction=lambda x: backupman.syncToUSB(ROOT_DIR))
 
 def syncFromUSB():
+    backupman = load("backupman")
+    misc = load("gui.misc")
+
     def callback(*args):
-        gui.misc.DialogBoxUI("Are you sure?",
+        misc.DialogBoxUI("Are you sure?",
                      message="Have you backed everything up?",
                      hasField=False,
                      requireField=False,
@@ -70,7 +114,7 @@ def syncFromUSB():
                      noLabel="No",
                      yesAction=lambda x: backupman.syncFromUSB(ROOT_DIR))
 
-    gui.misc.DialogBoxUI("Sync FROM flash drive?",
+    misc.DialogBoxUI("Sync FROM flash drive?",
                          message="Sync FROM the flash drive? (USB -> PC)",
                          hasField=False,
                          requireField=False,
@@ -93,7 +137,7 @@ def saveAsVersion():
 def testShotClass():
     path = "C:\\_testing\\pipelineTest\\1_3DCG\\Scenes\\C20"
 
-    shot = dataTypes.Shot(path)
+    shot = load("dataTypes").Shot(path)
 
     assets = shot.assets
 
@@ -103,4 +147,11 @@ def testShotClass():
         print "versions: " + str(asset.versions)
         print "latest: " + str(asset.latest)
         print "master status: " + str(asset.masterstatus)
-        print "--"
\ No newline at end of file
+        print "--"
+
+
+# (reload(snpPipeline) from the shelf runs this again)
+if DEV_RELOAD:
+    reloadAll()
+
+_initTime = time.time() - _start
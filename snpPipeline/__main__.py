@@ -0,0 +1,101 @@
+"""
+Command line for the pipeline (works without Maya)
+
+    python -m snpPipeline status [--deep] [shot|rig|prop|env]
+    python -m snpPipeline imports [module ...]
+    python -m snpPipeline recover [--workers N]
+"""
+import sys
+import argparse
+
+import snpPipeline
+
+STAGES = ("Layout", "Animation", "Lighting")
+
+
+def _statusCell(info):
+    """
+    What to show for a master's status
+        MASTER 004   : master is up to date with the latest version
+        old 003/004  : master points to 003, latest is 004
+        stale 004    : master points to 004 but is older than it
+        004          : no (valid) master, latest is 004
+    """
+    if info is None or not info.latest:
+        return "-"
+
+    if info.status == 2:
+        return "MASTER " + info.latest
+    elif info.status == 1 and info.pointedver == info.latest:
+        return "stale " + info.latest
+    elif info.status == 1:
+        return "old " + str(info.pointedver) + "/" + info.latest
+    else:
+        return info.latest
+
+
+def _printTable(header, rows):
+    widths = [max(len(x) for x in column) for column in zip(header, *rows)]
+
+    for row in [header] + rows:
+        print "  ".join(x.ljust(w) for x, w in zip(row, widths)).rstrip()
+
+
+def status(atype, deep=False):
+    statuses = snpPipeline.load("core").masterStatuses(atype, deep=deep)
+
+    if atype == "shot":
+        header = ["SHOT"] + [x.upper() for x in STAGES]
+        rows = [[name] + [_statusCell(statuses[name].get(x)) for x in STAGES]
+                for name in sorted(statuses)]
+    else:
+        header = [atype.upper(), "MASTER"]
+        rows = [[name, _statusCell(statuses[name])] for name in sorted(statuses)]
+
+    _printTable(header, rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m snpPipeline")
+    commands = parser.add_subparsers(dest="command")
+
+    statusparser = commands.add_parser("status", help="master status of every shot (or asset)")
+    statusparser.add_argument("atype", nargs="?", default="shot", choices=["shot", "rig", "prop", "env"])
+    statusparser.add_argument("--deep", action="store_true",
+                              help="compare masters by contents instead of dates")
+
+    importsparser = commands.add_parser("imports", help="time importing pipeline modules (per module, in ms)")
+    importsparser.add_argument("modules", nargs="*", default=["core"],
+                               help='like "core" or "gui.assetManager" (core by default)')
+
+    recoverparser = commands.add_parser("recover", help="render again the jobs a crash left unfinished")
+    recoverparser.add_argument("--workers", type=int, help="renders at once")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "imports":
+        for name in args.modules:
+            snpPipeline.load(name)
+
+        snpPipeline.importReport()
+        return 0
+
+    if snpPipeline.ROOT_DIR is None:
+        sys.stderr.write("'" + snpPipeline.PROJECT_ROOT_VAR + "' is not set\n")
+        return 2
+
+    if args.command == "status":
+        status(args.atype, args.deep)
+    elif args.command == "recover":
+        queue = snpPipeline.load("rendercore").recoverRenders(workers=args.workers)
+
+        if queue is None:
+            print "Nothing to recover"
+        elif not queue.wait():
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""
+Archiving of old scene versions
+
+Each asset directory gets an Archive folder with one
+zip of its archived scenes and a JSON index of what's in
+it, so archived versions can be listed without opening
+the zip:
+
+    Archive/[name].zip
+    Archive/[name].json
+        { filename : { "atype", "version", "descriptor",
+                       "size", "mtime", "crc" (, "member") } }
+
+("member" is the file's name in the zip, when it isn't
+the filename anymore because the asset was renamed)
+"""
+import os
+import json
+import time
+import zlib
+import zipfile
+import warnings
+
+import snpPipeline.dataTypes as dty
+from snpPipeline.copyengine import replaceFile
+
+ARCHIVE_DIR = "Archive"
+
+# Versions to leave out of the archive by default
+KEEP_LATEST = 5
+
+
+def archivePaths(assetdir, name=None):
+    """
+    (zip path, index path) for an asset directory
+    (of the asset 'name', by default the directory's name)
+    """
+    name = name or os.path.basename(os.path.normpath(assetdir))
+    archivedir = os.path.join(assetdir, ARCHIVE_DIR)
+
+    return (os.path.join(archivedir, name + ".zip"),
+            os.path.join(archivedir, name + ".json"))
+
+
+def readIndex(assetdir, name=None):
+    """
+    The archive index of an asset directory ({} if it has none)
+    """
+    try:
+        with open(archivePaths(assetdir, name)[1], mode="r") as file:
+            index = json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+    # (json hands back unicode on Python 2)
+    return dict((str(k), dict((str(a), str(b) if isinstance(b, basestring) else b)
+                              for a, b in v.iteritems()))
+                for k, v in index.iteritems())
+
+
+def _writeIndex(assetdir, index, name=None):
+    indexpath = archivePaths(assetdir, name)[1]
+    temp = indexpath + ".tmp"
+
+    with open(temp, mode="w") as file:
+        json.dump(index, file, indent=1, sort_keys=True)
+
+    replaceFile(temp, indexpath)
+
+
+def _crc32(path):
+    crc = 0
+    with open(path, mode="rb") as file:
+        while True:
+            chunk = file.read(1024 * 1024)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+
+    return crc & 0xffffffff
+
+
+def archiveFiles(files):
+    """
+    Move scene files into the archive of the asset
+    directory they're in
+
+    The zip and index are written before anything gets
+    removed, so an interrupted archive leaves the files
+    in both places at worst
+
+    @PARAMS
+        files: full paths of version scenes
+
+    @RETURNS
+        list of the files that were archived
+    """
+    bydir = {}
+    for path in files:
+        bydir.setdefault(os.path.dirname(path), []).append(path)
+
+    archived = []
+
+    for assetdir, paths in bydir.iteritems():
+        zippath = archivePaths(assetdir)[0]
+        index = readIndex(assetdir)
+
+        if not os.path.isdir(os.path.dirname(zippath)):
+            os.mkdir(os.path.dirname(zippath))
+
+        moved = []
+
+        with zipfile.ZipFile(zippath, mode="a", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            for path in paths:
+                filename = os.path.basename(path)
+                parsed = dty.parseSceneFilename(filename)
+
+                if parsed is None or parsed.isMaster:
+                    print "Not archiving '" + filename + "' (not a version scene)"
+                    continue
+
+                st = os.stat(path)
+                crc = _crc32(path)
+
+                old = index.get(filename)
+                if not old or old["crc"] != crc or old["size"] != st.st_size:
+                    # (a file archived again after being changed
+                    #  shadows the old member, zipfile reads the last one)
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")
+                        zf.write(path, arcname=filename)
+
+                    member = filename
+                else:
+                    member = old.get("member", filename)
+
+                index[filename] = {"atype": parsed.atype,
+                                   "version": parsed.version,
+                                   "descriptor": parsed.descriptor,
+                                   "size": st.st_size,
+                                   "mtime": st.st_mtime,
+                                   "crc": crc}
+
+                if member != filename:
+                    index[filename]["member"] = member
+
+                moved.append(path)
+
+        _writeIndex(assetdir, index)
+
+        for path in moved:
+            os.remove(path)
+
+        archived += moved
+
+    return archived
+
+
+def oldVersions(asset, keep=KEEP_LATEST):
+    """
+    Version scenes of an asset that can be archived: all but
+    the 'keep' latest ones and the one the master points to
+    """
+    numbers = asset.versions.numbers
+    latest = set(numbers[-keep:]) if keep > 0 else set()
+
+    pointedver = asset.getPointedVersion()
+
+    old = []
+    for ver in asset.versions.keys():
+        if ver == "MASTER" or ver == pointedver:
+            continue
+
+        if int(ver) in latest:
+            continue
+
+        old.append(ver)
+
+    return old
+
+
+def archiveVersions(asset, keep=KEEP_LATEST):
+    """
+    Archive the old versions of an Asset (or of every
+    shot stage of a Shot)
+
+    @RETURNS
+        list of the files that were archived
+    """
+    # (LazyShots too)
+    if hasattr(asset, "shotstages"):
+        assets = asset.shotstages.values()
+    else:
+        assets = [asset]
+
+    files = []
+    for a in assets:
+        files += [a.fileFromVersion(ver) for ver in oldVersions(a, keep)]
+
+    return archiveFiles(files)
+
+
+def archivedVersions(assetdir, name, atype):
+    """
+    Archived versions of one asset type in a directory,
+    from the index (the zip isn't opened)
+
+    @RETURNS
+        { version : descriptor }
+    """
+    versions = {}
+    for filename, info in readIndex(assetdir).iteritems():
+        parsed = dty.parseSceneFilename(filename)
+
+        if parsed and parsed.name == name and parsed.atype == atype:
+            versions[info["version"]] = info["descriptor"]
+
+    return versions
+
+
+def extractVersion(assetdir, filename, toDir=None):
+    """
+    Extract a single archived scene (back into the asset
+    directory by default), with its original mtime
+
+    @RETURNS
+        path of the extracted file
+    """
+    index = readIndex(assetdir)
+
+    if filename not in index:
+        raise Exception("'" + filename + "' is not in the archive of '" + assetdir + "'")
+
+    toDir = toDir or assetdir
+    path = os.path.join(toDir, filename)
+    temp = path + ".tmp"
+
+    member = index[filename].get("member", filename)
+
+    with zipfile.ZipFile(archivePaths(assetdir)[0], mode="r") as zf:
+        with zf.open(member) as src:
+            with open(temp, mode="wb") as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+
+    mtime = index[filename]["mtime"]
+    os.utime(temp, (time.time(), mtime))
+    replaceFile(temp, path)
+
+    return path
+
+
+def renameArchive(assetdir, name, toName):
+    """
+    Make the archive of asset 'name' in 'assetdir' the one
+    of 'toName' (when the asset gets renamed or duplicated):
+    the zip and index are renamed and the index lists the
+    new filenames (the zip itself isn't rewritten)
+    """
+    zippath, indexpath = archivePaths(assetdir, name)
+    if not os.path.exists(indexpath):
+        return
+
+    index = {}
+    for filename, info in readIndex(assetdir, name).iteritems():
+        parsed = dty.parseSceneFilename(filename)
+
+        if parsed and parsed.name == name:
+            info.setdefault("member", filename)
+            filename = parsed.renamed(toName).filename()
+
+            if info["member"] == filename:
+                del info["member"]
+
+        index[filename] = info
+
+    # (the new index first, an interrupted rename leaves both)
+    _writeIndex(assetdir, index, toName)
+
+    if os.path.exists(zippath):
+        os.rename(zippath, archivePaths(assetdir, toName)[0])
+
+    os.remove(indexpath)
@@ -0,0 +1,270 @@
+"""
+Persistent index of asset directories
+
+Keeps each asset's versions, descriptors, pointer version
+and scene mtimes in a SQLite database under _temp, so that
+an asset directory only gets listed and parsed again when
+its mtime changes (or one of the files the master status
+depends on got saved over)
+"""
+import os
+import stat
+import json
+import sqlite3
+import threading
+
+import snpPipeline.dataTypes as dty
+
+INDEX_FILENAME = "asset_index.db"
+
+# Seconds to wait on another artist's write before doing
+# without the index (it's on the shared project drive)
+LOCK_TIMEOUT = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    data TEXT NOT NULL
+)
+"""
+
+
+def _native(text):
+    # json hands back unicode on Python 2
+    if text is not None and not isinstance(text, str):
+        text = text.encode("utf8")
+
+    return text
+
+
+def _readPointer(path, name, atype):
+    pointerpath = os.path.join(path, name + "_" + atype + ".pointer")
+
+    try:
+        with open(pointerpath, mode="r") as file:
+            return file.read()
+    except IOError:
+        return None
+
+
+def _stamp(path):
+    # (None if the file isn't there)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return [dty.mtimeNs(st), st.st_size]
+
+
+def scanDir(path, atypes):
+    """
+    Parse an asset directory into what the index stores
+
+    @RETURNS
+        { "versions" : { atype : [[version, descriptor], ...] },
+          "pointers" : { atype : pointed version or None },
+          "mtimes" : { atype : { filename : mtime } },
+          "stamps" : { filename : [mtime_ns, size] or None } }
+    """
+    name = os.path.basename(path)
+    tables = dty.scanVersions(path, atypes)
+
+    data = {"versions": {}, "pointers": {}, "mtimes": {}, "stamps": {}}
+
+    for atype, versions in tables.iteritems():
+        # (taken before reading it, so a write in between shows up next time)
+        pointername = name + "_" + atype + ".pointer"
+        data["stamps"][pointername] = _stamp(os.path.join(path, pointername))
+
+        pointedver = _readPointer(path, name, atype)
+        mtimes = {}
+
+        if "MASTER" in versions:
+            # only the MASTER and the pointed scene matter for the status
+            for ver in ("MASTER", pointedver):
+                if ver not in versions:
+                    continue
+
+                filename = dty.sceneFilename(name, atype, ver, versions[ver])
+                data["stamps"][filename] = _stamp(os.path.join(path, filename))
+                mtimes[filename] = os.path.getmtime(os.path.join(path, filename))
+
+        data["versions"][atype] = [[v, d] for v, d in versions.iteritems()]
+        data["pointers"][atype] = pointedver
+        data["mtimes"][atype] = mtimes
+
+    return data
+
+
+def stampsCurrent(path, stamps):
+    """
+    Are the pointers, MASTER and pointed scenes 'stamps'
+    (see scanDir) were taken of still the same (saving over
+    a file in place leaves the directory's mtime as it was)
+    """
+    if stamps is None:
+        return False
+
+    for filename, stamp in stamps.iteritems():
+        if _stamp(os.path.join(path, filename)) != stamp:
+            return False
+
+    return True
+
+
+class AssetIndex(object):
+    """
+    SQLite-backed cache of parsed asset directories
+
+    Entries are keyed on the directory path and are only
+    valid for as long as the directory's st_mtime_ns stays
+    the same (adding, removing or renaming a scene or the
+    .pointer changes it) and so do the (st_mtime_ns, size)
+    of its .pointer files and of the MASTER and pointed
+    scenes (which can be saved over in place)
+
+    The index only ever speeds things up: when the database
+    is locked, corrupt or can't be opened, directories get
+    parsed (see scanDir) as if it wasn't there
+    """
+
+    def __init__(self, dbpath):
+        self.dbpath = dbpath
+
+        # Directories that had to be parsed again / were served from the index
+        self.misses = 0
+        self.hits = 0
+
+        self._lock = threading.Lock()
+        self._warned = False
+
+        try:
+            dbdir = os.path.dirname(dbpath)
+            if not os.path.exists(dbdir):
+                os.makedirs(dbdir)
+
+            self._db = sqlite3.connect(dbpath, timeout=LOCK_TIMEOUT, check_same_thread=False)
+            self._db.execute(_SCHEMA)
+            self._db.commit()
+        except (sqlite3.Error, OSError) as e:
+            self._db = None
+            self._failed(e)
+
+    def _failed(self, error):
+        # (once, it'd say the same for every asset)
+        if not self._warned:
+            self._warned = True
+            print("Asset index not used (" + self.dbpath + "): " + str(error))
+
+    def _get(self, path):
+        if self._db is None:
+            return None
+
+        with self._lock:
+            try:
+                return self._db.execute("SELECT mtime_ns, data FROM assets WHERE path = ?",
+                                        (path,)).fetchone()
+            except sqlite3.Error as e:
+                self._failed(e)
+                return None
+
+    def _put(self, path, mtime, data):
+        # (committed straight away, assets can get parsed one
+        #  at a time long after a manager opens)
+        if self._db is None:
+            return
+
+        with self._lock:
+            try:
+                self._db.execute("INSERT OR REPLACE INTO assets (path, mtime_ns, data) VALUES (?, ?, ?)",
+                                 (path, mtime, json.dumps(data)))
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._failed(e)
+
+                try:
+                    self._db.rollback()
+                except sqlite3.Error:
+                    pass
+
+    def lookup(self, path, atypes, st=None):
+        """
+        Returns the parsed data (see scanDir) of an asset
+        directory, only parsing it if it (or a file its
+        master status depends on) changed since it was indexed
+        """
+        if st is None:
+            st = os.stat(path)
+
+        mtime = dty.mtimeNs(st)
+        row = self._get(path)
+
+        if row and row[0] == mtime:
+            try:
+                data = json.loads(row[1])
+            except ValueError:
+                data = {"versions": {}}
+
+            if all(atype in data["versions"] for atype in atypes) and stampsCurrent(path, data.get("stamps")):
+                self.hits += 1
+                return data
+
+        self.misses += 1
+        data = scanDir(path, atypes)
+        self._put(path, mtime, data)
+
+        return data
+
+    def load(self, path, atype):
+        """
+        Make an Asset (or Shot) for the directory at 'path'
+
+        Returns None if 'path' isn't a directory
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        if not stat.S_ISDIR(st.st_mode):
+            # Don't try to make an asset based on a file
+            return None
+
+        if atype == "shot":
+            atypes = dty.SHOT_STAGE_TYPES.keys()
+        else:
+            atypes = [atype]
+
+        data = self.lookup(path, atypes, st)
+
+        tables = {}
+        fileinfos = {}
+        for t in atypes:
+            tables[t] = dty.VersionTable((_native(v), _native(d)) for v, d in data["versions"][t])
+
+            mtimes = dict((_native(f), m) for f, m in data["mtimes"][t].iteritems())
+            fileinfos[t] = dty.FileInfo(_native(data["pointers"][t]), mtimes)
+
+        if atype == "shot":
+            return dty.Shot(path, tables, fileinfos)
+        else:
+            return dty.Asset(path, atype, tables[atype], fileinfos[atype])
+
+
+_index = None
+
+def getIndex():
+    """
+    The project's asset index (ROOT_DIR/_temp/asset_index.db)
+    """
+    from snpPipeline import ROOT_DIR
+    global _index
+
+    dbpath = os.path.join(ROOT_DIR, "_temp", INDEX_FILENAME)
+
+    if _index is None or _index.dbpath != dbpath:
+        _index = AssetIndex(dbpath)
+
+    return _index
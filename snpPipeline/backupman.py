@@ -7,10 +7,13 @@ import platform
 from snpPipeline.shellinterop import *
 
 BACKUP_DIR_VAR = "BACKUP_DIR"
-BACKUP_DIR = os.path.normpath(os.environ[BACKUP_DIR_VAR]).replace('\\', '/')
+BACKUP_DIR = os.path.normpath(os.environ[BACKUP_DIR_VAR]).replace('\\', '/') if BACKUP_DIR_VAR in os.environ else None
 
 
 def backupProject(root):
+    if BACKUP_DIR is None:
+        raise Exception("'" + BACKUP_DIR_VAR + "' is not set")
+
     if not os.path.exists(BACKUP_DIR):
         os.makedirs(BACKUP_DIR)
 
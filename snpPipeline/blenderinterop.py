@@ -1,6 +1,6 @@
 import os
 import subprocess
-import maya.cmds as cmds
+from snpPipeline.mayaadapter import cmds
 
 import snpPipeline.utilities as utilities
 import snpPipeline.shellinterop as shinterop
@@ -13,6 +13,18 @@ def chunk(xs,n):
     return [xs[index::n] for index in range(n)]
 
 def parallel_render(scenes):
+    """
+    Render Blender scenes, PARALLELNESS Blenders at once, on
+    a render queue (so their output gets logged and read
+    for render metrics, see rendermetrics)
+
+    @RETURNS
+        the RenderQueue
+    """
+    import snpPipeline.rendercore as rendercore
+    from snpPipeline.renderqueue import RenderJob
+
+    queue = rendercore.newRenderQueue(PARALLELNESS)
     chunked_scenes = chunk(scenes, PARALLELNESS)
 
     for scenes in chunked_scenes:
@@ -27,12 +39,26 @@ def parallel_render(scenes):
 
         cmd += ')'
 
-        run((cmd, ), background=True, shell=True, parallel=True)
+        path = writeScript((cmd, ), parallel=True)
+        name = "blender_" + "_".join(os.path.splitext(os.path.basename(x))[0] for x in scenes)
 
+        # (the shots and layers come from the frames' paths)
+        queue.add(RenderJob(name, commandLine(path, background=True)))
 
-def run(commands, background=False, shell=False, parallel=True, blend_file=''):
+    queue.start()
+
+    return queue
+
+
+def writeScript(commands, parallel=True):
+    """
+    Write the script Blender runs on startup (the startup
+    scripts, then 'commands')
+
+    @RETURNS
+        its path
+    """
     script = ""
-    bg_flag = "--background --factory-startup " if background else ""
 
     # compose script file
     for start_script in STARTUP_SCRIPTS:
@@ -61,8 +87,22 @@ def run(commands, background=False, shell=False, parallel=True, blend_file=''):
     with open(path, mode="w") as file:
         file.write(script.encode("utf8"))
 
+    return path
+
+
+def commandLine(path, background=False, blend_file=''):
+    """
+    Command line running Blender with the script at 'path'
+    """
+    bg_flag = "--background --factory-startup " if background else ""
+
     bl = os.path.normpath(os.path.join(BLENDER_DIR, "blender"))
-    cmd = '"' + bl + '" ' + bg_flag + "--python " + path + ' ' + blend_file
+    return '"' + bl + '" ' + bg_flag + "--python " + path + ' ' + blend_file
+
+
+def run(commands, background=False, shell=False, parallel=True, blend_file=''):
+    path = writeScript(commands, parallel)
+    cmd = commandLine(path, background, blend_file)
     
     if shell:
         shinterop.run(cmd, force_posix=False)
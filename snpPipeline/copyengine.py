@@ -0,0 +1,251 @@
+"""
+Fast file copies for publishing and transferring scenes
+
+Tries the cheapest way the filesystem allows, in order:
+    reflink (FICLONE, copy-on-write filesystems like btrfs/XFS)
+    copy_file_range / sendfile (in-kernel copy)
+    buffered copy
+
+Copies are written to a temp file next to the destination
+and then renamed over it, so the destination is never
+missing or half written
+"""
+import os
+import sys
+import stat
+import shutil
+import errno
+import ctypes
+import ctypes.util
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # (Windows)
+    fcntl = None
+
+# linux/fs.h _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Bytes per buffered read / in-kernel copy call
+CHUNK_SIZE = 1024 * 1024
+
+# Errors that mean a method isn't supported here (and to try the next one)
+_UNSUPPORTED = set([errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF,
+                    errno.EPERM, errno.ENOTTY, errno.EMLINK,
+                    getattr(errno, "EOPNOTSUPP", errno.EINVAL),
+                    getattr(errno, "ENOTSUP", errno.EINVAL)])
+
+
+class CopyUnsupported(IOError):
+    """
+    None of the copy methods asked for work here
+    """
+
+
+_libc = None
+
+def _getLibc():
+    global _libc
+
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+    return _libc
+
+
+def replaceFile(src, dst):
+    """
+    Rename 'src' over 'dst', atomically where the OS allows it
+    """
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    elif sys.platform == "win32":
+        # (os.rename won't overwrite on Windows)
+        MOVEFILE_REPLACE_EXISTING = 0x1
+        MOVEFILE_WRITE_THROUGH = 0x8
+
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(src), unicode(dst),
+                                                   MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH):
+            raise ctypes.WinError()
+    else:
+        os.rename(src, dst)
+
+
+def _reflink(infd, outfd, size):
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+
+    fcntl.ioctl(outfd, FICLONE, infd)
+    return True
+
+
+def _kernelCopy(call, infd, outfd, size):
+    copied = 0
+    while copied < size:
+        count = call(infd, outfd, min(CHUNK_SIZE, size - copied))
+
+        if count == 0:
+            break
+
+        copied += count
+
+    return copied >= size
+
+
+def _copyFileRange(infd, outfd, size):
+    if hasattr(os, "copy_file_range"):
+        call = lambda i, o, n: os.copy_file_range(i, o, n)
+    elif sys.platform.startswith("linux"):
+        func = getattr(_getLibc(), "copy_file_range", None)
+        if func is None:
+            # (glibc older than 2.27)
+            return False
+
+        func.restype = ctypes.c_ssize_t
+        func.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+                         ctypes.c_size_t, ctypes.c_uint]
+
+        def call(i, o, n):
+            count = func(i, None, o, None, n, 0)
+            if count < 0:
+                e = ctypes.get_errno()
+                raise OSError(e, os.strerror(e))
+            return count
+    else:
+        return False
+
+    return _kernelCopy(call, infd, outfd, size)
+
+
+def _sendfile(infd, outfd, size):
+    if hasattr(os, "sendfile"):
+        call = lambda i, o, n: os.sendfile(o, i, None, n)
+    elif sys.platform.startswith("linux"):
+        func = _getLibc().sendfile
+        func.restype = ctypes.c_ssize_t
+        func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]
+
+        def call(i, o, n):
+            count = func(o, i, None, n)
+            if count < 0:
+                e = ctypes.get_errno()
+                raise OSError(e, os.strerror(e))
+            return count
+    else:
+        return False
+
+    return _kernelCopy(call, infd, outfd, size)
+
+
+def _buffered(infd, outfd, size):
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+
+    with os.fdopen(os.dup(infd), "rb") as infile:
+        while True:
+            count = infile.readinto(buf)
+            if not count:
+                break
+
+            written = 0
+            while written < count:
+                written += os.write(outfd, view[written:count])
+
+    return True
+
+
+METHODS = [("reflink", _reflink),
+           ("copy_file_range", _copyFileRange),
+           ("sendfile", _sendfile),
+           ("buffered", _buffered)]
+
+
+def _copyFd(infd, outfd, size, methods):
+    """
+    Copy between two file descriptors with the first
+    method that works, returns its name
+    """
+    for name, method in methods:
+        try:
+            if method(infd, outfd, size):
+                return name
+        except (OSError, IOError) as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+        # (start over on whatever a failed method left behind)
+        os.lseek(infd, 0, os.SEEK_SET)
+        os.lseek(outfd, 0, os.SEEK_SET)
+        os.ftruncate(outfd, 0)
+
+    raise CopyUnsupported("None of " + ", ".join(x[0] for x in methods) + " work here")
+
+
+def copyFile(src, dst, methods=None, keepStat=False):
+    """
+    Copy 'src' to 'dst' (replacing it), like shutil.copyfile
+    but through the fastest method available and atomically
+
+    @PARAMS
+        methods: (name, function) pairs to try, defaults to METHODS
+        keepStat: also copy the times and mode (like shutil.copy2)
+
+    @RETURNS
+        name of the method used
+    """
+    dstdir, dstname = os.path.split(os.path.abspath(dst))
+
+    infd = os.open(src, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        st = os.fstat(infd)
+
+        outfd, temp = tempfile.mkstemp(prefix="." + dstname + ".", suffix=".tmp", dir=dstdir)
+        try:
+            try:
+                method = _copyFd(infd, outfd, st.st_size, methods or METHODS)
+            finally:
+                os.close(outfd)
+
+            # (mkstemp makes it owner only)
+            os.chmod(temp, stat.S_IMODE(st.st_mode))
+
+            if keepStat:
+                shutil.copystat(src, temp)
+
+            replaceFile(temp, dst)
+        except:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+    finally:
+        os.close(infd)
+
+    return method
+
+
+def linkFile(src, dst, hardlink=True):
+    """
+    Make 'dst' without copying the data of 'src' if we can,
+    through a reflink (separate copy-on-write file), then a
+    hardlink (same file, edits show up in both), and only
+    then a full copy
+
+    @RETURNS
+        name of the method used
+    """
+    try:
+        return copyFile(src, dst, METHODS[:1], keepStat=True)
+    except CopyUnsupported:
+        pass
+
+    if hardlink and hasattr(os, "link"):
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+    return copyFile(src, dst, keepStat=True)
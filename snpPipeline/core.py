@@ -6,19 +6,48 @@ import sys
 import subprocess
 import time
 import shutil
-import maya.cmds as cmds
-import maya.mel as mel
+import itertools
+from snpPipeline.mayaadapter import cmds, mel
 
 import snpPipeline.dataTypes
 dty = snpPipeline.dataTypes
+import snpPipeline.copyengine as copyengine
+import snpPipeline.deepcheck as deepcheck
+import snpPipeline.archive as archive
+import snpPipeline.deltastore as deltastore
 
 from send2trash import send2trash
 
+# concurrent.futures is only in Python 3 (or the 'futures' backport)
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+# Asset subdirectories that duplicates link to instead of copying
+# (the Archive's zips and stores get added to in place, so it's
+#  only ever reflinked)
+LINKED_DIRS = ("Textures", "Renders", "Ref", "Blasts", "Reference", archive.ARCHIVE_DIR)
+
+# Of those, the ones files only get added to (never edited or
+# saved over), so a duplicate can share them through a hardlink
+# when they can't be reflinked (the others get copied then)
+HARDLINKED_DIRS = ("Ref", "Reference")
+
+# Number of threads for scanning asset directories
+# (on a network share most of the time is spent waiting
+#  on each listing/stat, so these overlap well)
+SCAN_WORKERS = 8
+
 #reload(dty)
 #reload(assetManager)
 
 def archiveFiles(files):
-    pass
+    """
+    Move version scenes into their asset's archive
+    (see archive.archiveFiles)
+    """
+    return archive.archiveFiles(files)
 
 def openInFileManager(path):
     if sys.platform=='win32':
@@ -30,7 +59,11 @@ def openInFileManager(path):
     else:
         subprocess.Popen(['xdg-open', path])
 
-def getAssets(atype):
+def _listAssets(atype, dirsOnly=False):
+    """
+    getAssets without the warning (safe to call from
+    worker threads, maya.cmds isn't)
+    """
     # get the dir where these assets are stored
     path = dty.pathOfAssetType(atype)
 
@@ -41,14 +74,158 @@ def getAssets(atype):
 
     # list directory
     try:
-    	assets = sorted(os.listdir(path))
+    	if dirsOnly:
+    		assets = sorted(dty.listSubdirs(path))
+    	else:
+    		assets = sorted(os.listdir(path))
     except OSError:
-    	cmds.warning("No assets")
     	return None
 
     # return list of assets
     return assets
 
+def getAssets(atype, dirsOnly=False):
+    assets = _listAssets(atype, dirsOnly)
+    if assets is None:
+        cmds.warning("No assets")
+
+    return assets
+
+def isAssetDirName(name):
+    """
+    Whether a folder in a category directory is an asset
+    (and not a temporary/hidden folder)
+    """
+    return not ("_TEMP_" in name or name.startswith("_") or name.startswith("."))
+
+def parallelMap(func, items, workers=None):
+    """
+    map() over a bounded pool of threads, with the
+    results in the same order as 'items'
+    """
+    items = list(items)
+    workers = min(workers or SCAN_WORKERS, len(items))
+
+    if workers <= 1:
+        return [func(x) for x in items]
+
+    if ThreadPoolExecutor:
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            return list(pool.map(func, items))
+        finally:
+            pool.shutdown()
+    else:
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+def scanCategories(atypes=("rig", "prop", "env", "shot"), workers=None):
+    """
+    Lists the asset directories of several asset types at once
+
+    @RETURNS
+        { atype : sorted asset names }
+    """
+    names = parallelMap(lambda x: _listAssets(x, dirsOnly=True), atypes, workers)
+
+    # (warn from this thread, once the workers are done)
+    for atype, listed in zip(atypes, names):
+        if listed is None:
+            cmds.warning("No assets")
+
+    return dict(zip(atypes, names))
+
+def lazyAsset(path, atype):
+    """
+    LazyAsset (or LazyShot) for an asset directory, parsed
+    through the asset index once it's used
+    """
+    import snpPipeline.assetindex
+    index = snpPipeline.assetindex.getIndex()
+
+    if atype == "shot":
+        return dty.LazyShot(path, loader=index.load)
+    else:
+        return dty.LazyAsset(path, atype, loader=index.load)
+
+def iterAssets(atype, prefix="", offset=0, limit=None, lazy=False):
+    """
+    Yields the assets of 'atype' one at a time, sorted by
+    name, only parsing each one once it's reached (so the
+    first few can be used before the rest are looked at)
+
+    @PARAMS
+        prefix: only assets whose name starts with this
+        offset: number of (matching) assets to skip
+        limit: most assets to yield (None for all)
+        lazy: yield LazyAsset/LazyShot instead of parsing
+    """
+    import snpPipeline.assetindex
+    index = snpPipeline.assetindex.getIndex()
+
+    names = (x for x in getAssets(atype, dirsOnly=True) or []
+             if isAssetDirName(x) and x.startswith(prefix))
+
+    stop = None if limit is None else offset + limit
+
+    for name in itertools.islice(names, offset, stop):
+        path = dty.pathOfAssetType(atype, named=name)
+
+        if lazy:
+            yield lazyAsset(path, atype)
+        else:
+            asset = index.load(path, atype)
+
+            # (it went away since the listing)
+            if asset:
+                yield asset
+
+def loadAssets(atype, workers=None):
+    """
+    Makes (fully parsed) Asset or Shot objects for every
+    asset of 'atype', parsing the asset directories in
+    parallel (through the asset index)
+
+    @RETURNS
+        list of Asset/Shot, sorted by name
+    """
+    import snpPipeline.assetindex
+    index = snpPipeline.assetindex.getIndex()
+
+    names = getAssets(atype, dirsOnly=True) or []
+    paths = [dty.pathOfAssetType(atype, named=x) for x in names if isAssetDirName(x)]
+
+    assets = parallelMap(lambda x: index.load(x, atype), paths, workers)
+
+    return [x for x in assets if x]
+
+def masterStatuses(atype, names=None, workers=None, deep=False):
+    """
+    dataTypes.computeMasterStatuses, with the asset
+    directories split between a pool of threads
+    """
+    if names is None:
+        names = getAssets(atype, dirsOnly=True) or []
+
+    names = list(names)
+    workers = workers or SCAN_WORKERS
+
+    # a few chunks per worker so slow directories even out
+    size = max(1, len(names) // (workers * 4))
+    chunks = [names[i:i + size] for i in xrange(0, len(names), size)]
+
+    statuses = {}
+    for chunk in parallelMap(lambda x: dty.computeMasterStatuses(atype, x, deep), chunks, workers):
+        statuses.update(chunk)
+
+    return statuses
+
 def getOpenAssetInfo():
     # get root directory of pipeline
     from snpPipeline import ROOT_DIR
@@ -72,18 +249,21 @@ def getOpenAssetInfo():
     assetcategorydir = os.path.split(os.path.split(splitdir[0])[0])[1]
     atype = dty.getAssetTypeFromDir(assetcategorydir)
 
-    # remove the file extension
-    scenefilename = os.path.splitext(scenefilename)[0]
+    # parse the scene filename
+    parsed = dty.parseSceneFilename(scenefilename)
 
-    # parse the scene filename (TODO: make part of dataTypes.py)
-    splitname = scenefilename.split('_')
+    if parsed is None or parsed.ext != ".ma":
+        raise Exception("Current scene is invalid asset: Filename does not follow the naming conventions")
 
-    file_aname = splitname[0]
-    file_atype = splitname[1]
-    version = splitname[2]
+    file_aname = parsed.name
+    file_atype = parsed.atype
+    version = parsed.version
 
     # if this is a shot, make sure we have the shot stage type
     if assetcategorydir == "Scenes":
+        if file_atype not in dty.SHOT_STAGE_TYPES:
+            raise Exception("Current scene is invalid asset: Unknown shot stage '" + file_atype + "'")
+
         atype = "shot"
         shotstage = dty.shotstageFor(file_atype)
         file_atype = "shot"
@@ -125,19 +305,45 @@ def checkIfAlreadyOpen(asset, version=None):
         # check
         return scene == filename
 
-def renameAssetFiles(files, inDir, toName):
+def renameAssetFiles(files, inDir, toName, fromName=None):
+    """
+    Rename an asset's scene files (with their deepcheck
+    sidecars), its archive and its directory (the asset is
+    called 'fromName' in the files, by default the directory's
+    name)
+    """
+    fromName = fromName or os.path.basename(os.path.normpath(inDir))
+
     # Rename all the files
     for file in files:
-        splitname = file.split('_')
-        splitname[0] = toName
+        parsed = dty.parseSceneFilename(file)
+
+        if parsed is None:
+            print "Not renaming '" + file + "' (does not follow the naming conventions)"
+            continue
 
-        newname = '_'.join(splitname)
+        newname = parsed.renamed(toName).filename()
 
         oldpath = os.path.join(inDir, file)
         newpath = os.path.join(inDir, newname)
 
         os.rename(oldpath, newpath)
 
+        # (the hash still holds, renaming keeps the size and mtime)
+        if os.path.exists(deepcheck.sidecarFor(oldpath)):
+            os.rename(deepcheck.sidecarFor(oldpath), deepcheck.sidecarFor(newpath))
+
+    # (and the sidecars of scenes that aren't there anymore go)
+    for filename in os.listdir(inDir):
+        scene = os.path.join(inDir, filename[:-len(deepcheck.SIDECAR_EXT)])
+
+        if filename.endswith(deepcheck.SIDECAR_EXT) and not os.path.exists(scene):
+            os.remove(os.path.join(inDir, filename))
+
+    # (the archived and stored versions go with them)
+    archive.renameArchive(inDir, fromName, toName)
+    deltastore.renameStores(inDir, fromName, toName)
+
     # Rename directory
     splitdir = os.path.split(inDir)
     newdir = os.path.join(splitdir[0], toName)
@@ -151,9 +357,55 @@ def renameAsset(asset, name):
     allfiles = asset.getAllFiles(asFullpath=False, includingPointer=True)
     assetdir = asset.getBaseDir()
 
-    renameAssetFiles(allfiles, inDir=assetdir, toName=name)
+    renameAssetFiles(allfiles, inDir=assetdir, toName=name, fromName=asset.name)
 
-def duplicateAsset(asset, name):
+def _duplicateJobs(olddir, newdir):
+    """
+    Makes the directories of a duplicate of 'olddir' at
+    'newdir' and lists the files to put in them
+
+    @RETURNS
+        [(source, destination, link, hardlink), ...]
+    """
+    jobs = []
+
+    for root, dirs, files in os.walk(olddir):
+        relative = os.path.relpath(root, olddir)
+        destroot = os.path.normpath(os.path.join(newdir, relative))
+
+        os.mkdir(destroot)
+
+        # (anything under a heavy top folder, like Textures)
+        top = relative.split(os.sep)[0]
+        link = top in LINKED_DIRS
+        hardlink = top in HARDLINKED_DIRS
+
+        for filename in files:
+            # (hash sidecars are named after the old scenes)
+            if filename.endswith(deepcheck.SIDECAR_EXT):
+                continue
+
+            jobs.append((os.path.join(root, filename), os.path.join(destroot, filename), link, hardlink))
+
+    return jobs
+
+def duplicateAsset(asset, name, linkHeavy=True, progress=None, workers=None):
+    """
+    Duplicate an asset's directory as 'name'
+
+    Scenes and pointers are copied, everything in LINKED_DIRS
+    is reflinked instead (see copyengine.linkFile), or hardlinked
+    if it's in HARDLINKED_DIRS (a hardlinked file is the same
+    file in both, so editing a texture would change the original's).
+    Files get copied in parallel into a staging directory, which
+    is renamed into place once everything in it is renamed
+
+    @PARAMS
+        linkHeavy: False to copy the LINKED_DIRS too
+        progress: called as progress(done, total) after each batch
+                  of files (from the calling thread, so it can
+                  update the UI)
+    """
     # check if asset already exists before leaping
     existingassets = getAssets(asset.atype)
 
@@ -171,10 +423,32 @@ def duplicateAsset(asset, name):
 
     newdir = os.path.join(olddir_base[0], newdirname)
 
-    shutil.copytree(olddir, newdir)
+    def duplicate(job):
+        src, dst, link, hardlink = job
+
+        # (keep the times, the master status depends on them)
+        if link and linkHeavy:
+            copyengine.linkFile(src, dst, hardlink=hardlink)
+        else:
+            copyengine.copyFile(src, dst, keepStat=True)
+
+    # (a few files per worker at a time, to report in between)
+    batch = (workers or SCAN_WORKERS) * 4
+
+    try:
+        jobs = _duplicateJobs(olddir, newdir)
+
+        for i in xrange(0, len(jobs), batch):
+            parallelMap(duplicate, jobs[i:i + batch], workers)
+
+            if progress:
+                progress(min(i + batch, len(jobs)), len(jobs))
+    except:
+        shutil.rmtree(newdir, ignore_errors=True)
+        raise
 
     # rename asset
-    newdir = renameAssetFiles(allfiles, inDir=newdir, toName=name)
+    newdir = renameAssetFiles(allfiles, inDir=newdir, toName=name, fromName=asset.name)
 
     if asset.atype == "shot":
         return dty.Shot(newdir)
@@ -189,32 +463,28 @@ def deleteAsset(asset):
     send2trash(path)
 
 def publishAsset(asset, version):
-    # delete master if exists
-    if asset.masterstatus != 0:
-        master = asset.fileFromVersion("MASTER")
-        pointerfile = asset.getPointerFile()
-
-        if os.path.exists(master):
-            os.remove(master)
-
-        if pointerfile:
-            os.remove(pointerfile)
+    # (bring it back first if it was archived or stored)
+    if version not in asset.versions and version in asset.archivedVersions():
+        asset.extractVersion(version)
+    elif version not in asset.versions and version in asset.storedVersions():
+        asset.unstoreVersion(version)
 
     # get version path
     versionfile = asset.fileFromVersion(version)
 
     # duplicate version into master
+    # (replaces the old master in one go, so there's always one)
     splitdir = os.path.split(versionfile)
     master = os.path.join(splitdir[0], asset.filenameFromVersion("MASTER"))
 
-    shutil.copyfile(versionfile, master)
+    copyengine.copyFile(versionfile, master)
 
     # make pointer file
     pointerpath = os.path.join(splitdir[0],
         asset.filenameFromVersion("MASTER", ".pointer"))
 
-    with open(pointerpath, mode="w") as file:
-        file.write(str(version))
+    # (through the pointer cache so the next read doesn't go to disk)
+    dty.POINTER_CACHE.write(pointerpath, str(version))
 
 def exploreAsset(asset):
     if not asset:
@@ -250,20 +520,22 @@ def transferVersion(version, ofShot, ofStage):
     assetpath = os.path.split(fullpath)[0]
     filename = os.path.split(fullpath)[1]
 
+    parsed = dty.parseSceneFilename(filename)
+    if parsed is None or parsed.isMaster:
+        raise Exception("Cannot transfer '" + filename + "' (not a version scene)")
+
     # get the latest version of the next stage
-    latest = ofShot.shotstages[nextstage].latest
-    latest = 000 if not latest else int(latest)
+    latest = ofShot.shotstages[nextstage].versions.latestNumber
 
     # increment version and add _FROM-{stage}
     newver = dty._addPadding(str(latest + 1))
 
-    newfilename = '_'.join([ofShot.name, nextstage_type, newver, desc])
-    newfilename += ".ma"
+    newfilename = dty.sceneFilename(ofShot.name, nextstage_type, newver, desc)
 
     # copy file
     newfullpath = os.path.join(assetpath, newfilename)
 
-    shutil.copyfile(fullpath, newfullpath)
+    copyengine.copyFile(fullpath, newfullpath)
 
 def createAssetDir(name, atype):
     # make asset directory
@@ -6,14 +6,32 @@ BaseData -> Asset (Env, Prop, Rig)
          -> Shot
 """
 import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import OrderedDict
 from collections import namedtuple
+from operator import itemgetter
 
-import maya.cmds as cmds
-import maya.mel as mel
+from snpPipeline.mayaadapter import cmds, mel
 
 import snpPipeline.utilities as utilities
 
+try:
+    intern
+except NameError:
+    from sys import intern
+
+# os.scandir is only in Python 3.5+, use the backport if installed
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
 ASSET_TYPES={
     "rig" : "Rigs",
     "prop" : "Props",
@@ -29,6 +47,17 @@ SceneInfo = namedtuple('SceneInfo', ['name',
                                     'atype',
                                     'shotstage'])
 
+# Cached file info for an asset (see snpPipeline.assetindex)
+#   pointedver : version written in the .pointer file (None if missing)
+#   mtimes : { filename : mtime } of the MASTER and pointed scenes
+FileInfo = namedtuple('FileInfo', ['pointedver',
+                                   'mtimes'])
+
+# Master status of an asset (see computeMasterStatuses)
+MasterInfo = namedtuple('MasterInfo', ['status',
+                                       'pointedver',
+                                       'latest'])
+
 SHOT_STAGE_TYPES={
     "1-LO" : "Layout",
     "2-anim" : "Animation",
@@ -93,12 +122,590 @@ def pathOfAssetType(atype, named=None, isRelative=False):
     return path
 
 
+def listSubdirs(path):
+    """
+    Lists the names of the directories in 'path'
+    (without a stat per entry where scandir is available)
+    """
+    if _scandir is None:
+        return [x for x in os.listdir(path) if os.path.isdir(os.path.join(path, x))]
+
+    return [entry.name for entry in _scandir(path) if entry.is_dir()]
+
+def _listSceneFiles(path):
+    """
+    Lists the names of the .ma files in a directory
+    with a single directory read
+    """
+    if _scandir is None:
+        return [x for x in os.listdir(path) if x.endswith(".ma")]
+
+    return [entry.name for entry in _scandir(path)
+            if entry.name.endswith(".ma") and entry.is_file()]
+
+def _listEntries(path):
+    """
+    Lists a directory once
+
+    @RETURNS
+        { filename : DirEntry } (None instead of the
+        DirEntry when scandir isn't available)
+    """
+    if _scandir is None:
+        return dict.fromkeys(os.listdir(path))
+
+    return dict((entry.name, entry) for entry in _scandir(path))
+
+def _entryMtime(path, entry):
+    if entry is None:
+        return os.path.getmtime(path)
+
+    return entry.stat().st_mtime
+
+def scanVersions(path, atypes):
+    """
+    Lists an asset directory once and sorts the scene
+    files into a version table for each asset type
+    (Shots keep all three shot stages in the same folder)
+
+    @RETURNS
+        { atype : VersionTable }
+    """
+    return _parseScenes(os.path.basename(path), _listSceneFiles(path), atypes)
+
+# Scene/pointer filenames
+#   [name]_[atype]{_[version]{_[descriptor]}}.[ext]
+#   (no version is the MASTER, see folder-file-naming-conventions.txt)
+SCENE_FILENAME_RE = re.compile(r"^(?P<name>[^_]+)"
+                               r"_(?P<atype>[^_.]+)"
+                               r"(?:_(?P<version>[0-9]+)"
+                               r"(?:_(?P<descriptor>[^_]+))?)?"
+                               r"(?P<ext>\.[^._]+)$")
+
+class SceneName(tuple):
+    """
+    A parsed scene (or pointer) filename
+    (see parseSceneFilename)
+
+    (name, atype, version, descriptor, ext)
+    """
+    __slots__ = ()
+
+    def __new__(cls, name, atype, version, descriptor, ext):
+        return tuple.__new__(cls, (name, atype, version, descriptor, ext))
+
+    name = property(itemgetter(0))
+    atype = property(itemgetter(1))
+    version = property(itemgetter(2))
+    descriptor = property(itemgetter(3))
+    ext = property(itemgetter(4))
+
+    @property
+    def isMaster(self):
+        return self.version == "MASTER"
+
+    def filename(self):
+        return sceneFilename(self.name, self.atype, self.version, self.descriptor, self.ext)
+
+    def renamed(self, name):
+        """
+        Same file for an asset called 'name'
+        """
+        return SceneName(_intern(name), self.atype, self.version, self.descriptor, self.ext)
+
+    def __repr__(self):
+        return "SceneName(" + repr(self.filename()) + ")"
+
+def parseSceneFilename(filename, _match=SCENE_FILENAME_RE.match, _new=tuple.__new__, _internStr=intern):
+    """
+    Parses a scene or pointer filename
+
+    (not cached: the asset index already keeps unchanged
+    directories from being parsed again)
+
+    @RETURNS
+        SceneName (version is "MASTER" for the master scene)
+        or None if the filename doesn't follow the naming conventions
+    """
+    m = _match(filename)
+
+    if m is None:
+        return None
+
+    name, atype, version, descriptor, ext = m.groups()
+
+    # (the builtin straight away for str, the usual case)
+    intern_ = _internStr if type(filename) is str else _intern
+
+    return _new(SceneName, (intern_(name),
+                            intern_(atype),
+                            version or "MASTER",
+                            intern_(descriptor) if descriptor else "",
+                            ext))
+
+def _parseScenes(name, filenames, atypes):
+    """
+    Sorts the scene files of asset 'name' into a
+    version table for each asset type
+    """
+    tables = {}
+    for atype in atypes:
+        tables[atype] = VersionTable()
+
+    for scene in sorted(filenames):
+        parsed = parseSceneFilename(scene)
+
+        # skip if not a scene of one of the right types
+        if parsed is None or parsed.ext != ".ma" or parsed.name != name:
+            continue
+
+        versions = tables.get(parsed.atype)
+
+        if versions is not None:
+            versions[parsed.version] = parsed.descriptor
+
+    return tables
+
+def sceneFilename(name, atype, version, descriptor="", ext=".ma"):
+    """
+    Puts together the filename of a version
+    """
+    if version == "MASTER":
+        return name + "_" + atype + ext
+    elif descriptor != "":
+        return name + "_" + atype + "_" + version + "_" + descriptor + ext
+    else:
+        return name + "_" + atype + "_" + version + ext
+
+def _masterStatus(versions, pointedver, current):
+    """
+    Status of a master scene (see Asset.getMasterStatus)
+
+    @PARAMS
+        current: whether the MASTER is up to date with the
+                 pointed scene (by date or contents)
+    """
+    if not "MASTER" in versions or not pointedver in versions:
+        return 0
+
+    if not current:
+        return 1
+
+    return 2 if pointedver == versions.latest else 1
+
+def mtimeNs(st):
+    """
+    st_mtime_ns of a stat result (Python 2 only has the float)
+    """
+    try:
+        return st.st_mtime_ns
+    except AttributeError:
+        return int(st.st_mtime * 1000000000)
+
+class PointerCache(object):
+    """
+    Process-wide cache of .pointer file contents
+
+    Entries are only used while the file's
+    (st_mtime_ns, st_size) stays the same, and the least
+    recently used ones are dropped past 'maxsize'
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+
+        # Reads served from the cache / from disk
+        self.hits = 0
+        self.misses = 0
+
+        #   path : ((mtime_ns, size), contents)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, path, st, contents):
+        with self._lock:
+            self._entries.pop(path, None)
+            self._entries[path] = ((mtimeNs(st), st.st_size), contents)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def read(self, path):
+        """
+        Contents of the pointer file at 'path' (None if missing)
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return None
+
+        with self._lock:
+            entry = self._entries.pop(path, None)
+
+            if entry and entry[0] == (mtimeNs(st), st.st_size):
+                # (most recently used goes to the end)
+                self._entries[path] = entry
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+
+        try:
+            with open(path, mode="r") as file:
+                contents = file.read()
+        except IOError:
+            return None
+
+        self._store(path, st, contents)
+
+        return contents
+
+    def readMany(self, paths):
+        """
+        Reads a batch of pointer files
+
+        @RETURNS
+            { path : contents } (missing files are left out)
+        """
+        contents = {}
+        for path in paths:
+            pointed = self.read(path)
+            if pointed is not None:
+                contents[path] = pointed
+
+        return contents
+
+    def write(self, path, contents):
+        """
+        Write a pointer file, keeping the cache up to date
+        """
+        with open(path, mode="w") as file:
+            file.write(contents)
+
+        self._store(path, os.stat(path), contents)
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries)}
+
+POINTER_CACHE = PointerCache()
+
+def computeMasterStatuses(atype, names=None, deep=False):
+    """
+    Works out the status of the master scene for every
+    asset of 'atype' (or just the ones in 'names') with
+    one listing per asset directory, reading the pointer
+    files in one batch
+
+    @PARAMS
+        deep: compare the contents of the MASTER and pointed
+              scenes instead of their dates (see deepcheck)
+
+    @RETURNS
+        { name : MasterInfo }
+        or for shots:
+        { name : { shotstage : MasterInfo } }
+    """
+    root = pathOfAssetType(atype)
+
+    if atype == "shot":
+        atypes = SHOT_STAGE_TYPES.keys()
+    else:
+        atypes = [atype]
+
+    if names is None:
+        try:
+            names = listSubdirs(root)
+        except OSError:
+            return {}
+
+    # list each asset directory once
+    listed = []
+    pointerpaths = []
+
+    for name in names:
+        path = os.path.join(root, name)
+
+        try:
+            entries = _listEntries(path)
+        except OSError:
+            continue
+
+        tables = _parseScenes(name, entries.keys(), atypes)
+        listed.append((name, path, entries, tables))
+
+        for t in atypes:
+            pointer = sceneFilename(name, t, "MASTER", ext=".pointer")
+            if pointer in entries:
+                pointerpaths.append(os.path.join(path, pointer))
+
+    pointers = POINTER_CACHE.readMany(pointerpaths)
+
+    if deep:
+        from snpPipeline.deepcheck import sameContents
+
+    # stat only the scenes the status depends on
+    statuses = {}
+
+    for name, path, entries, tables in listed:
+        infos = {}
+
+        for t in atypes:
+            versions = tables[t]
+            pointedver = pointers.get(os.path.join(path, sceneFilename(name, t, "MASTER", ext=".pointer")))
+
+            status = 0
+            if "MASTER" in versions and pointedver in versions:
+                master = sceneFilename(name, t, "MASTER")
+                pointed = sceneFilename(name, t, pointedver, versions[pointedver])
+
+                masterpath = os.path.join(path, master)
+                pointedpath = os.path.join(path, pointed)
+
+                if deep:
+                    current = sameContents(masterpath, pointedpath)
+                else:
+                    current = (_entryMtime(masterpath, entries[master]) >=
+                               _entryMtime(pointedpath, entries[pointed]))
+
+                status = _masterStatus(versions, pointedver, current)
+
+            infos[t] = MasterInfo(status, pointedver, versions.latest)
+
+        if atype == "shot":
+            statuses[name] = dict((shotstageFor(t), info) for t, info in infos.iteritems())
+        else:
+            statuses[name] = infos[atype]
+
+    return statuses
+
+def _intern(text):
+    """
+    intern() that also takes unicode (what Maya hands back):
+    ASCII text is interned as a str, anything else is
+    returned as it is
+    """
+    if type(text) is str:
+        return intern(text)
+
+    try:
+        return intern(str(text))
+    except UnicodeError:
+        return text
+
 def _addPadding(string):
         while len(string) < 3:
             string = "0" + string
 
         return string
 
+class VersionTable(object):
+    """
+    Sorted table of an asset's versions
+
+    Version numbers are kept in a sorted array next to their
+    (interned) descriptors, so the latest version is O(1) and
+    lookups are a bisect. Works as a mapping of
+    version string -> descriptor for compatibility,
+    iterating like the old OrderedDict (MASTER first, then
+    the versions in order)
+
+    Spellings of the same number ("001", "0001") are kept
+    as versions of their own, like the old OrderedDict did
+    """
+    __slots__ = ("_nums", "_descs", "_spellings", "hasMaster")
+
+    def __init__(self, items=()):
+        # Version numbers (sorted) and their descriptors
+        self._nums = array('L')
+        self._descs = []
+
+        # Version strings, None where it's the 3-digit padded
+        # number (only "12", "0042"... are kept)
+        self._spellings = []
+
+        # Whether there is a MASTER scene
+        self.hasMaster = False
+
+        for version, descriptor in items:
+            self[version] = descriptor
+
+    def _find(self, version):
+        """
+        Index of 'version' in the table (or None)
+        """
+        try:
+            num = int(version)
+        except (TypeError, ValueError):
+            return None
+
+        if num < 0:
+            return None
+
+        i = bisect_left(self._nums, num)
+
+        while i < len(self._nums) and self._nums[i] == num:
+            if self._spell(i) == version:
+                return i
+            i += 1
+
+        return None
+
+    def _spell(self, i):
+        return self._spellings[i] or _addPadding(str(self._nums[i]))
+
+    def add(self, version, descriptor=""):
+        """
+        Add a version (replacing the descriptor if it exists)
+        """
+        if version == "MASTER":
+            self.hasMaster = True
+            return
+
+        # (anything that isn't a number isn't a version)
+        try:
+            num = int(version)
+        except ValueError:
+            return
+
+        if num < 0:
+            return
+
+        descriptor = _intern(descriptor)
+        spelling = _intern(version) if version != _addPadding(str(num)) else None
+
+        # (the spellings of a number in the order sorted() gives)
+        i = bisect_left(self._nums, num)
+        while i < len(self._nums) and self._nums[i] == num:
+            if self._spell(i) == version:
+                self._descs[i] = descriptor
+                return
+
+            if self._spell(i) > version:
+                break
+            i += 1
+
+        try:
+            self._nums.insert(i, num)
+        except OverflowError:
+            # (a number too big for a version, like a date stamp
+            # on a 32-bit long, isn't one)
+            return
+
+        self._descs.insert(i, descriptor)
+        self._spellings.insert(i, spelling)
+
+    @property
+    def numbers(self):
+        """
+        Sorted array of the version numbers
+        """
+        return self._nums
+
+    @property
+    def latest(self):
+        """
+        Latest version string ("" if there are none)
+        """
+        if not self._nums:
+            return ""
+
+        return self._spell(len(self._nums) - 1)
+
+    @property
+    def latestNumber(self):
+        return self._nums[-1] if self._nums else 0
+
+    def neighbours(self, version):
+        """
+        The versions before and after 'version'
+        (None where there isn't one)
+        """
+        try:
+            num = int(version)
+        except ValueError:
+            return None, None
+
+        i = bisect_left(self._nums, num)
+        j = bisect_right(self._nums, num)
+
+        before = self._spell(i - 1) if i > 0 else None
+        after = self._spell(j) if j < len(self._nums) else None
+
+        return before, after
+
+    # mapping interface
+    def __contains__(self, version):
+        if version == "MASTER":
+            return self.hasMaster
+
+        return self._find(version) is not None
+
+    def __getitem__(self, version):
+        if version == "MASTER" and self.hasMaster:
+            return ""
+
+        i = self._find(version)
+
+        if i is None:
+            raise KeyError(version)
+
+        return self._descs[i]
+
+    def __setitem__(self, version, descriptor):
+        self.add(version, descriptor)
+
+    def get(self, version, default=None):
+        try:
+            return self[version]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return len(self._nums) + (1 if self.hasMaster else 0)
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    __bool__ = __nonzero__
+
+    def iteritems(self):
+        if self.hasMaster:
+            yield "MASTER", ""
+
+        for i, descriptor in enumerate(self._descs):
+            yield self._spell(i), descriptor
+
+    def __iter__(self):
+        for version, _ in self.iteritems():
+            yield version
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [descriptor for _, descriptor in self.iteritems()]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __eq__(self, other):
+        try:
+            return self.items() == list(other.items())
+        except AttributeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return "VersionTable(" + repr(self.items()) + ")"
+
 class DummyAsset(object):
     def __init__(self, name):
         self.name = name
@@ -107,13 +714,13 @@ class DummyAsset(object):
         return 2
 
 class Asset(object):
-    def __init__(self, path, atype):
+    def __init__(self, path, atype, versions=None, fileinfo=None):
         # Data name
         self.name = ""
 
         # "Version" : Identifier
         # "MASTER" : (pointer version if matches)
-        self.versions = OrderedDict()
+        self.versions = VersionTable()
 
         # Latest version by number
         #   003, 004, *005*
@@ -125,40 +732,19 @@ class Asset(object):
         # Status of master
         self._masterstatus = None
 
+        # Pointer and mtimes from the asset index (if any)
+        self._fileinfo = fileinfo
+
         # Assign name from path
         self.name = os.path.basename(path)
 
-        # list scene files
-        files = sorted(os.listdir(path))
-
-        # add corresponding files to list
-        scenes = []
-
-        for file in files:
-            if file.startswith(self.name) and file.endswith(".ma"):
-                scenes.append(file)
-
-        # split name into variables
-        for scene in scenes:
-            # remove the file extension
-            filename = os.path.splitext(scene)[0]
-
-            # split into vars
-            attrs = filename.split('_')
+        # list scene files (unless the directory was already scanned)
+        if versions is None:
+            versions = scanVersions(path, (atype,))[atype]
+        elif not isinstance(versions, VersionTable):
+            versions = VersionTable(versions.iteritems())
 
-            # skip if not right type
-            if attrs[1] != self.atype:
-                continue
-
-            if len(attrs) == 2:
-                # MASTER scene
-                self.versions["MASTER"] = ""
-            elif len(attrs) == 3:
-                # Scene with no description
-                self.versions[attrs[2]] = ""
-            elif len(attrs) == 4:
-                # Scene with description
-                self.versions[attrs[2]] = attrs[3]
+        self.versions = versions
 
         self._setLatest()
 
@@ -168,29 +754,10 @@ class Asset(object):
         Returns list of version numbers (in order),
         not including MASTER
         """
-
-        verstrings = self.versions.keys()
-        vernums = []
-
-        for verstring in verstrings:
-            if verstring != "MASTER":
-                vernums.append(int(verstring))
-
-        vernums.sort()
-
-        return vernums
+        return list(self.versions.numbers)
 
     def _setLatest(self):
-        vers = self.getVerNumbers()
-
-        if len(vers) > 1:
-            last = vers[-1]
-        elif len(vers) == 1:
-            last = vers[0]
-        elif len(vers) == 0:
-            return
-
-        self.latest = _addPadding(str(last))
+        self.latest = self.versions.latest
 
     def getPointerFile(self):
         # read pointer file
@@ -204,20 +771,25 @@ class Asset(object):
         return pointerpath
 
     def getPointedVersion(self):
-        pointerpath = self.getPointerFile()
+        if self._fileinfo:
+            return self._fileinfo.pointedver
 
-        if not pointerpath:
-            return
+        pointerfile = self.filenameFromVersion("MASTER", ".pointer")
+        pointedver = POINTER_CACHE.read(os.path.join(self.getBaseDir(), pointerfile))
 
-        with open(pointerpath, mode="r") as file:
-            pointedver = file.read()
+        if pointedver is None:
+            print "'" + self.name + "'" + " is missing a .pointer file"
 
         return pointedver
 
-    def getMasterStatus(self):
+    def getMasterStatus(self, deep=False):
         """
         Checks the status of the master scene
 
+        @PARAMS
+            deep: compare the contents of the master and pointed
+                  scenes instead of their dates (see deepcheck)
+
         @Returns:
             0 : No master file (or invalid)
             1 : Master file exists but not latest
@@ -225,7 +797,7 @@ class Asset(object):
         """
 
         # check if master exists
-        if not "MASTER" in self.versions.keys():
+        if not "MASTER" in self.versions:
             print "'" + self.name + "'" + " does not have a master"
             return 0
 
@@ -233,16 +805,21 @@ class Asset(object):
         pointedver = self.getPointedVersion()
 
         # check if exists in version array
-        if not pointedver in self.versions.keys():
+        if not pointedver in self.versions:
             # master points to a non-existing file
             print "'" + self.name + "'" + " does not point to an existing version"
             return 0
 
-        # check if master time is older
         masterfile = self.filenameFromVersion("MASTER")
         pointedfile = self.filenameFromVersion(pointedver)
 
-        if not compareDate(masterfile, pointedfile, path):
+        if deep:
+            # check if master is a copy of the pointed file
+            from snpPipeline.deepcheck import sameContents
+
+            if not sameContents(os.path.join(path, masterfile), os.path.join(path, pointedfile)):
+                return 1
+        elif not self._compareDate(masterfile, pointedfile, path):
             # master is older than the pointed file
             return 1
 
@@ -252,12 +829,23 @@ class Asset(object):
         else:
             return 1
 
+    def _compareDate(self, master, compared, path):
+        """
+        compareDate, but using the indexed mtimes if we have them
+        """
+        mtimes = self._fileinfo.mtimes if self._fileinfo else {}
+
+        if master in mtimes and compared in mtimes:
+            return mtimes[master] >= mtimes[compared]
+
+        return compareDate(master, compared, path)
+
     def fileFromVersion(self, version, isRelative=False):
         # checks
         if not version:
             print(str(self) + ": This asset is empty")
             return None
-        elif not (version in self.versions.keys()):
+        elif not (version in self.versions):
             cmds.error("Internal error: version does not exist")
 
         # put together the file name
@@ -272,24 +860,10 @@ class Asset(object):
         """
         Reconstructs the filename from the version
         """
-        if version == "MASTER":
-            filename = self.name + "_" + self.atype + ext
-        else:
-            """
-            # Check if we have that version
-            if not version in self.versions.keys():
-                return None
-            """
-            if descriptor == "/":
-                descriptor = self.versions[version]
-
-            # Check if we have a descriptor
-            if descriptor != "":
-                filename = self.name + "_" + self.atype + "_" + version + "_" + descriptor + ext
-            else:
-                filename = self.name + "_" + self.atype + "_" + version + ext
+        if version != "MASTER" and descriptor == "/":
+            descriptor = self.versions[version]
 
-        return filename
+        return sceneFilename(self.name, self.atype, version, descriptor, ext)
 
     def getBaseDir(self, isRelative=False):
         return os.path.join(pathOfAssetType(self.atype, named=self.name, isRelative=isRelative))
@@ -312,14 +886,105 @@ class Asset(object):
 
         return files
 
+    def archivedVersions(self):
+        """
+        Versions that were moved to the asset's archive
+        (read from the archive index)
+
+        @RETURNS
+            { version : descriptor }
+        """
+        from snpPipeline import archive
+
+        versions = archive.archivedVersions(self.getBaseDir(), self.name, self.atype)
+
+        # (extracted ones are back with the others)
+        return dict((v, d) for v, d in versions.iteritems() if v not in self.versions)
+
+    def extractVersion(self, version):
+        """
+        Bring an archived version back into the asset directory
+        """
+        from snpPipeline import archive
+
+        descriptor = self.archivedVersions()[version]
+        filename = sceneFilename(self.name, self.atype, version, descriptor)
+
+        archive.extractVersion(self.getBaseDir(), filename)
+        self.versions.add(version, descriptor)
+        self._setLatest()
+
+        return os.path.join(self.getBaseDir(), filename)
+
+    def storedVersions(self):
+        """
+        Versions kept in the asset's delta store
+
+        @RETURNS
+            { version : descriptor }
+        """
+        from snpPipeline import deltastore
+
+        store = deltastore.VersionStore(self.getBaseDir(), self.name, self.atype)
+        return dict((v, d) for v, d in store.versions().iteritems() if v not in self.versions)
+
+    def unstoreVersion(self, version):
+        """
+        Put a copy of a version from the delta store back
+        into the asset directory (it stays in the store)
+        """
+        from snpPipeline import deltastore
+        from snpPipeline.copyengine import copyFile
+
+        descriptor = self.storedVersions()[version]
+        path = os.path.join(self.getBaseDir(), sceneFilename(self.name, self.atype, version, descriptor))
+
+        store = deltastore.VersionStore(self.getBaseDir(), self.name, self.atype)
+        copyFile(store.materialize(version), path)
+
+        # (with the time it had, like extractVersion)
+        mtime = store.entries[store._find(version)]["mtime"]
+        os.utime(path, (os.path.getatime(path), mtime))
+
+        self.versions.add(version, descriptor)
+        self._setLatest()
+
+        return path
+
+    def _sceneFor(self, version, isRelative=False, cached=False):
+        """
+        Path of a version's scene, brought back into the asset
+        directory from the archive or the delta store if
+        that's where it is
+
+        @PARAMS
+            cached: read a stored version from the delta
+                    store's cache instead (which gets trimmed,
+                    so only for reading it once, like importing)
+        """
+        if version not in self.versions and version in self.archivedVersions():
+            self.extractVersion(version)
+
+        if version not in self.versions and version in self.storedVersions():
+            if cached:
+                from snpPipeline import deltastore
+
+                store = deltastore.VersionStore(self.getBaseDir(), self.name, self.atype)
+                return store.materialize(version)
+
+            self.unstoreVersion(version)
+
+        return self.fileFromVersion(version, isRelative)
+
     def openVersion(self, version):
-        path = self.fileFromVersion(version)
+        path = self._sceneFor(version)
         # let's open
         cmds.file(new=True, force=True)
         cmds.file(path, open=True)
 
     def importVersion(self, version, toNamespace=None, asReference=False):
-        path = self.fileFromVersion(version, isRelative=True)
+        # (a reference keeps pointing at the file, so not at the cache)
+        path = self._sceneFor(version, isRelative=True, cached=not asReference)
 
         if not toNamespace:
             toNamespace = self.name
@@ -332,7 +997,7 @@ class Asset(object):
 
     def saveNewVersion(self, descriptor):
         # get file name
-        newver = _addPadding(str(int(self.latest) + 1))
+        newver = _addPadding(str(self.versions.latestNumber + 1))
         filename = self.filenameFromVersion(newver, descriptor=descriptor.upper())
 
         # get asset base path
@@ -347,7 +1012,8 @@ class Asset(object):
 
     @property
     def masterstatus(self):
-        if self._masterstatus:
+        # (0 is a status too, None is "not worked out yet")
+        if self._masterstatus is not None:
             return self._masterstatus
         else:
             self._masterstatus = self.getMasterStatus()
@@ -355,7 +1021,7 @@ class Asset(object):
 
 
 class Shot(object):
-    def __init__(self, path):
+    def __init__(self, path, tables=None, fileinfos=None):
         # Assign name from path
         self.name = os.path.basename(path)
 
@@ -365,10 +1031,17 @@ class Shot(object):
         # All assets
         self.shotstages = {}
 
+        # List the shot directory once for all of the stages
+        if tables is None:
+            tables = scanVersions(path, SHOT_STAGE_TYPES.keys())
+
+        if fileinfos is None:
+            fileinfos = {}
+
         # Create Asset objects for each process of a shot
-        self.shotstages["Layout"] = Asset(path, "1-LO")
-        self.shotstages["Animation"] = Asset(path, "2-anim")
-        self.shotstages["Lighting"] = Asset(path, "3-lighting")
+        for atype, shotstage in SHOT_STAGE_TYPES.iteritems():
+            self.shotstages[shotstage] = Asset(path, atype, tables[atype],
+                                               fileinfos.get(atype))
 
         # Bind the method from a shotstage so as to be DRY
         self.getBaseDir = self.shotstages["Layout"].getBaseDir
@@ -455,3 +1128,62 @@ class Shot(object):
             cmds.lookThru(currentcam)
 
         mel.eval("print \"Playblast: " + file + "\"")
+
+
+class _LazyProxy(object):
+    """
+    Stands in for an Asset or Shot, only holding its name
+    and path until anything else about it is asked for
+    (at which point the real object gets made)
+    """
+    def __init__(self, path, loader):
+        self.name = os.path.basename(path)
+        self.path = path
+
+        self._loader = loader
+        self._target = None
+
+    @property
+    def isLoaded(self):
+        return self._target is not None
+
+    def load(self):
+        if self._target is None:
+            self._target = self._loader()
+
+        return self._target
+
+    def __getattr__(self, attr):
+        # (only called for attributes the proxy doesn't have itself)
+        if attr.startswith("__") or attr in ("_loader", "_target"):
+            raise AttributeError(attr)
+
+        return getattr(self.load(), attr)
+
+
+class LazyAsset(_LazyProxy):
+    """
+    Asset that is only parsed on first use
+
+    'loader' makes the real object from (path, atype),
+    it defaults to Asset
+    """
+    def __init__(self, path, atype, loader=None):
+        loader = loader if loader else Asset
+        super(LazyAsset, self).__init__(path, lambda: loader(path, atype))
+
+        self.atype = atype
+
+
+class LazyShot(_LazyProxy):
+    """
+    Shot that is only parsed on first use
+
+    'loader' makes the real object from (path, "shot"),
+    it defaults to Shot
+    """
+    def __init__(self, path, loader=None):
+        loader = loader if loader else (lambda path, atype: Shot(path))
+        super(LazyShot, self).__init__(path, lambda: loader(path, "shot"))
+
+        self.atype = "shot"
@@ -0,0 +1,119 @@
+"""
+Content hashes for the "deep check" of master scenes
+
+Digests are streamed through a fixed-size buffer and kept
+in a sidecar next to each file ([file].md5), which is
+reused for as long as the file's size and mtime stay the
+same, so re-checking mostly costs a stat per file
+"""
+import os
+import mmap
+import hashlib
+
+from snpPipeline.dataTypes import mtimeNs
+from snpPipeline.copyengine import replaceFile
+
+HASH_NAME = "md5"
+SIDECAR_EXT = "." + HASH_NAME
+
+# Read buffer size for hashing
+CHUNK_SIZE = 1024 * 1024
+
+# Files at least this big get hashed through mmap
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+def fileDigest(path, usemmap=None):
+    """
+    Hex digest of a file's contents
+
+    @PARAMS
+        usemmap: hash through mmap instead of a read buffer
+                 (None to decide on the file size)
+    """
+    h = hashlib.new(HASH_NAME)
+
+    with open(path, mode="rb") as file:
+        size = os.fstat(file.fileno()).st_size
+
+        if usemmap is None:
+            usemmap = size >= MMAP_THRESHOLD
+
+        if usemmap and size > 0:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, size, CHUNK_SIZE):
+                    h.update(mapped[offset:offset + CHUNK_SIZE])
+            finally:
+                mapped.close()
+        else:
+            buf = bytearray(CHUNK_SIZE)
+            view = memoryview(buf)
+
+            while True:
+                count = file.readinto(buf)
+                if not count:
+                    break
+
+                h.update(view[:count])
+
+    return h.hexdigest()
+
+
+def sidecarFor(path):
+    return path + SIDECAR_EXT
+
+
+def _readSidecar(path):
+    """
+    (digest, size, mtime_ns) from a sidecar, or None
+    """
+    try:
+        with open(sidecarFor(path), mode="r") as file:
+            digest, size, mtime = file.read().split()
+    except (IOError, ValueError):
+        return None
+
+    return digest, int(size), int(mtime)
+
+
+def _writeSidecar(path, digest, st):
+    sidecar = sidecarFor(path)
+    temp = sidecar + ".tmp"
+
+    with open(temp, mode="w") as file:
+        file.write(" ".join([digest, str(st.st_size), str(mtimeNs(st))]) + "\n")
+
+    replaceFile(temp, sidecar)
+
+
+def cachedDigest(path):
+    """
+    Digest of a file, only hashing it (and updating its
+    sidecar) if its size or mtime changed since last time
+    """
+    st = os.stat(path)
+    cached = _readSidecar(path)
+
+    if cached and cached[1] == st.st_size and cached[2] == mtimeNs(st):
+        return cached[0]
+
+    digest = fileDigest(path)
+
+    try:
+        _writeSidecar(path, digest, st)
+    except (IOError, OSError):
+        # (read-only share, we just won't have a sidecar)
+        pass
+
+    return digest
+
+
+def sameContents(path, other):
+    """
+    Whether two files have the same contents
+    """
+    if os.path.getsize(path) != os.path.getsize(other):
+        return False
+
+    return cachedDigest(path) == cachedDigest(other)
@@ -0,0 +1,350 @@
+"""
+Delta-compressed store for old scene versions
+
+Successive Maya ASCII versions of an asset are mostly the
+same lines, so instead of a full copy per version the store
+keeps every so often a full (compressed) version and
+line-level deltas from the version before in between:
+
+    Archive/[name]_[atype].store/
+        index.json
+        [version].full.z
+        [version].delta.z
+
+Versions are rebuilt on demand into ROOT_DIR/_temp/version_cache
+(keeping the MAX_CACHED most recently used ones) for opening
+or importing. Versions are only ever rebuilt from the store
+(a chain of deltas always starts at a full version in it),
+the cache just saves rebuilding them again
+"""
+import os
+import json
+import zlib
+import hashlib
+import difflib
+
+import snpPipeline.dataTypes as dty
+from snpPipeline.archive import ARCHIVE_DIR
+from snpPipeline.copyengine import replaceFile
+
+INDEX_FILENAME = "index.json"
+
+# Store a full version at least every so many versions
+# (so rebuilding one never applies more deltas than this)
+KEYFRAME_INTERVAL = 10
+
+# Store a full version instead if the delta would be bigger than this
+# fraction of it
+MAX_DELTA_RATIO = 0.5
+
+# Rebuilt versions to keep in the cache
+MAX_CACHED = 20
+
+COMPRESS_LEVEL = 6
+
+
+def encodeDelta(old, new):
+    """
+    Line delta turning the lines 'old' into 'new'
+
+    Made of "C start end" (copy old[start:end]) and
+    "I count" (followed by 'count' new lines) records
+    """
+    # (lines are compared as ids, which is a lot faster than strings)
+    ids = {}
+    a = [ids.setdefault(x, len(ids)) for x in old]
+    b = [ids.setdefault(x, len(ids)) for x in new]
+
+    out = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b).get_opcodes():
+        if tag == "equal":
+            out.append(b"C %d %d\n" % (i1, i2))
+        elif j2 > j1:
+            out.append(b"I %d\n" % (j2 - j1))
+            out.extend(new[j1:j2])
+
+    return b"".join(out)
+
+
+def applyDelta(old, delta):
+    """
+    Lines of the version 'delta' was made against 'old'
+    """
+    lines = delta.splitlines(True)
+    new = []
+
+    i = 0
+    while i < len(lines):
+        op = lines[i].split()
+        i += 1
+
+        if op[0] == b"C":
+            new.extend(old[int(op[1]):int(op[2])])
+        else:
+            count = int(op[1])
+            new.extend(lines[i:i + count])
+            i += count
+
+    return new
+
+
+def storeDir(assetdir, name, atype):
+    return os.path.join(assetdir, ARCHIVE_DIR, name + "_" + atype + ".store")
+
+
+def cacheDir():
+    from snpPipeline import ROOT_DIR
+    return os.path.join(ROOT_DIR, "_temp", "version_cache")
+
+
+class VersionStore(object):
+    """
+    The delta store of one asset type in an asset directory
+    """
+    def __init__(self, assetdir, name, atype):
+        self.assetdir = assetdir
+        self.name = name
+        self.atype = atype
+        self.path = storeDir(assetdir, name, atype)
+
+        # [{ "version", "descriptor", "kind", "size", "mtime", "md5" }, ...]
+        # in the order they were stored (each delta is from the one before)
+        self.entries = []
+
+        try:
+            with open(os.path.join(self.path, INDEX_FILENAME), mode="r") as file:
+                self.entries = [dict((str(k), str(v) if isinstance(v, basestring) else v)
+                                     for k, v in x.iteritems())
+                                for x in json.load(file)]
+        except (IOError, ValueError):
+            pass
+
+        # (lines of the last entry, while adding a batch)
+        self._lastLines = None
+
+    def versions(self):
+        """
+        { version : descriptor } of the stored versions
+        """
+        return dict((x["version"], x["descriptor"]) for x in self.entries)
+
+    def _find(self, version):
+        for i, entry in enumerate(self.entries):
+            if entry["version"] == version:
+                return i
+
+        raise Exception("Version '" + version + "' of '" + self.name + "' is not in the store")
+
+    def _blobPath(self, entry):
+        return os.path.join(self.path, entry["version"] + "." + entry["kind"] + ".z")
+
+    def _readBlob(self, entry):
+        with open(self._blobPath(entry), mode="rb") as file:
+            return zlib.decompress(file.read())
+
+    def _writeBlob(self, entry, data):
+        path = self._blobPath(entry)
+        with open(path + ".tmp", mode="wb") as file:
+            file.write(zlib.compress(data, COMPRESS_LEVEL))
+
+        replaceFile(path + ".tmp", path)
+
+    def _writeIndex(self):
+        path = os.path.join(self.path, INDEX_FILENAME)
+        with open(path + ".tmp", mode="w") as file:
+            json.dump(self.entries, file, indent=1)
+
+        replaceFile(path + ".tmp", path)
+
+    def _keyframe(self, i):
+        """
+        Index of the full version the 'i'th entry is rebuilt from
+        """
+        while i >= 0 and self.entries[i]["kind"] != "full":
+            i -= 1
+
+        if i < 0:
+            raise Exception("The store of '" + self.name + "' has deltas without a full version")
+
+        return i
+
+    def lines(self, version):
+        """
+        Rebuild the lines of a stored version
+        """
+        i = self._find(version)
+
+        # back to the last full version
+        start = self._keyframe(i)
+
+        lines = self._readBlob(self.entries[start]).splitlines(True)
+        for entry in self.entries[start + 1:i + 1]:
+            lines = applyDelta(lines, self._readBlob(entry))
+
+        return lines
+
+    def add(self, path):
+        """
+        Put a version scene in the store (it isn't removed)
+        """
+        parsed = dty.parseSceneFilename(os.path.basename(path))
+
+        # (the deltas stored after it depend on it, so it can't be replaced)
+        if parsed.version in self.versions():
+            raise Exception("Version '" + parsed.version + "' of '" + self.name + "' is already stored")
+
+        with open(path, mode="rb") as file:
+            data = file.read()
+
+        st = os.stat(path)
+        entry = {"version": parsed.version,
+                 "descriptor": parsed.descriptor,
+                 "kind": "full",
+                 "size": st.st_size,
+                 "mtime": st.st_mtime,
+                 "md5": hashlib.md5(data).hexdigest()}
+
+        lines = data.splitlines(True)
+        blob = data
+
+        sincefull = 0
+        for x in reversed(self.entries):
+            if x["kind"] == "full":
+                break
+            sincefull += 1
+
+        # (only a delta if the full version it goes back to is in the store)
+        if (self.entries and sincefull + 1 < KEYFRAME_INTERVAL
+                and os.path.exists(self._blobPath(self.entries[self._keyframe(len(self.entries) - 1)]))):
+            if self._lastLines is None:
+                self._lastLines = self.lines(self.entries[-1]["version"])
+
+            delta = encodeDelta(self._lastLines, lines)
+
+            if len(delta) < len(data) * MAX_DELTA_RATIO:
+                entry["kind"] = "delta"
+                blob = delta
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self._writeBlob(entry, blob)
+        self.entries.append(entry)
+        self._writeIndex()
+
+        self._lastLines = lines
+
+    def materialize(self, version):
+        """
+        Path to a rebuilt copy of a stored version, in the cache
+        """
+        entry = self.entries[self._find(version)]
+        filename = dty.sceneFilename(self.name, self.atype, version, entry["descriptor"])
+
+        folder = os.path.join(cacheDir(), self.name)
+        path = os.path.join(folder, filename)
+
+        if os.path.exists(path) and os.path.getsize(path) == entry["size"]:
+            # (touch it, most recently used)
+            os.utime(path, None)
+            return path
+
+        data = b"".join(self.lines(version))
+
+        if hashlib.md5(data).hexdigest() != entry["md5"]:
+            raise Exception("Version '" + version + "' of '" + self.name + "' is corrupt in the store")
+
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        with open(path + ".tmp", mode="wb") as file:
+            file.write(data)
+
+        replaceFile(path + ".tmp", path)
+        trimCache()
+
+        return path
+
+
+def trimCache(maxCached=None):
+    """
+    Remove the least recently used rebuilt versions past
+    'maxCached' (MAX_CACHED)
+    """
+    maxCached = MAX_CACHED if maxCached is None else maxCached
+
+    cached = []
+    for root, _, files in os.walk(cacheDir()):
+        for filename in files:
+            path = os.path.join(root, filename)
+            cached.append((os.path.getmtime(path), path))
+
+    cached.sort()
+
+    for _, path in cached[:max(0, len(cached) - maxCached)]:
+        os.remove(path)
+
+
+def storeFiles(files):
+    """
+    Move version scenes into their asset's delta store
+    (oldest version first, so deltas follow the history)
+
+    @RETURNS
+        list of the files that were stored
+    """
+    stores = {}
+    for path in files:
+        parsed = dty.parseSceneFilename(os.path.basename(path))
+
+        if parsed is None or parsed.isMaster:
+            print "Not storing '" + os.path.basename(path) + "' (not a version scene)"
+            continue
+
+        key = (os.path.dirname(path), parsed.name, parsed.atype)
+        stores.setdefault(key, []).append((int(parsed.version), path))
+
+    stored = []
+    for key, paths in stores.iteritems():
+        store = VersionStore(*key)
+
+        for _, path in sorted(paths):
+            store.add(path)
+            os.remove(path)
+            stored.append(path)
+
+    return stored
+
+
+def storeVersions(asset, keep=None):
+    """
+    Move the old versions of an Asset (or every shot stage of
+    a Shot) into the delta store (see archive.oldVersions)
+    """
+    from snpPipeline import archive
+
+    keep = archive.KEEP_LATEST if keep is None else keep
+
+    # (LazyShots too)
+    if hasattr(asset, "shotstages"):
+        assets = asset.shotstages.values()
+    else:
+        assets = [asset]
+
+    files = []
+    for a in assets:
+        files += [a.fileFromVersion(ver) for ver in archive.oldVersions(a, keep)]
+
+    return storeFiles(files)
+
+
+def renameStores(assetdir, name, toName):
+    """
+    Make the delta stores of asset 'name' in 'assetdir' the
+    ones of 'toName' (when the asset gets renamed or duplicated)
+    """
+    for atype in dty.ASSET_TYPES:
+        path = storeDir(assetdir, name, atype)
+
+        if os.path.isdir(path):
+            os.rename(path, storeDir(assetdir, toName, atype))
@@ -0,0 +1,292 @@
+"""
+Project-wide graph of which scenes reference which
+
+Built from the headers of every .ma in the asset
+directories (see mafile.scanReferences) and cached under
+_temp, so a scene only gets read again when its mtime or
+size changes. Answers things like which shots have to be
+re-rendered after a rig is published, without opening
+anything in Maya
+
+The first update reads every scene of the project, so
+the asset manager does it in the background (see
+updateInBackground)
+"""
+import os
+import json
+import stat
+import threading
+from collections import deque
+
+import snpPipeline.dataTypes as dty
+import snpPipeline.mafile as mafile
+from snpPipeline.copyengine import replaceFile
+
+GRAPH_FILENAME = "depgraph.json"
+
+
+class DependencyGraph(object):
+    """
+    References between the project's scenes
+
+    Call update() to bring it up to date with the disk
+    """
+    def __init__(self, cachepath, root):
+        self.cachepath = cachepath
+        self.root = root
+
+        # Scenes read on the last update
+        self.scanned = 0
+
+        #   scene path : { "mtime_ns", "size", "refs" : [absolute paths] }
+        self._scenes = {}
+
+        # referenced path : set(scene paths) (built when needed)
+        self._dependents = None
+
+        # (one update at a time)
+        self._lock = threading.Lock()
+
+        try:
+            with open(cachepath, mode="r") as file:
+                self._scenes = json.load(file)
+        except (IOError, ValueError):
+            pass
+
+    def _save(self):
+        folder = os.path.dirname(self.cachepath)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        with open(self.cachepath + ".tmp", mode="w") as file:
+            json.dump(self._scenes, file)
+
+        replaceFile(self.cachepath + ".tmp", self.cachepath)
+
+    def _sceneFiles(self):
+        """
+        Yields (path, stat) of every .ma in the asset directories
+        """
+        categories = sorted(set(dty.pathOfAssetType(x) for x in dty.ASSET_TYPES))
+
+        for category in categories:
+            try:
+                names = dty.listSubdirs(category)
+            except OSError:
+                continue
+
+            for name in names:
+                assetdir = os.path.join(category, name)
+
+                try:
+                    entries = dty._listEntries(assetdir)
+                except OSError:
+                    continue
+
+                for filename, entry in entries.iteritems():
+                    if not filename.endswith(".ma"):
+                        continue
+
+                    path = os.path.join(assetdir, filename)
+
+                    try:
+                        st = entry.stat() if entry else os.stat(path)
+                    except OSError:
+                        continue
+
+                    if stat.S_ISREG(st.st_mode):
+                        yield path, st
+
+    def update(self):
+        """
+        Re-read the headers of the scenes that changed (and
+        forget the ones that are gone); every scene gets a
+        stat, only the changed ones get read
+
+        @RETURNS
+            number of scenes read
+        """
+        with self._lock:
+            scenes = {}
+            self.scanned = 0
+
+            for path, st in self._sceneFiles():
+                mtime = dty.mtimeNs(st)
+                old = self._scenes.get(path)
+
+                if old and old["mtime_ns"] == mtime and old["size"] == st.st_size:
+                    scenes[path] = old
+                    continue
+
+                try:
+                    refs = [mafile.resolvePath(x.path, self.root) for x in mafile.scanReferences(path)]
+                except IOError:
+                    continue
+
+                scenes[path] = {"mtime_ns": mtime, "size": st.st_size, "refs": refs}
+                self.scanned += 1
+
+            changed = self.scanned or len(scenes) != len(self._scenes)
+
+            self._scenes = scenes
+            self._dependents = None
+
+            if changed:
+                self._save()
+
+        return self.scanned
+
+    def scenes(self):
+        return self._scenes.keys()
+
+    def referencesOf(self, scene):
+        """
+        Scenes that 'scene' references itself
+        """
+        entry = self._scenes.get(os.path.normpath(scene))
+        return list(entry["refs"]) if entry else []
+
+    def dependentsOf(self, path, recursive=True):
+        """
+        Scenes that reference the scene at 'path' (and, if
+        recursive, the ones that reference those, and so on)
+        """
+        dependents = self._dependents
+        if dependents is None:
+            dependents = {}
+            for scene, entry in self._scenes.iteritems():
+                for ref in entry["refs"]:
+                    dependents.setdefault(ref, set()).add(scene)
+
+            self._dependents = dependents
+
+        found = set()
+        queue = deque([os.path.normpath(path)])
+
+        while queue:
+            for scene in dependents.get(queue.popleft(), ()):
+                if scene in found:
+                    continue
+
+                found.add(scene)
+                if recursive:
+                    queue.append(scene)
+
+        return found
+
+    def _currentScenes(self):
+        """
+        The MASTER and latest version scene of every asset
+        (older versions don't get rendered or referenced)
+        """
+        latest = {}
+        current = set()
+
+        for scene in self._scenes:
+            parsed = dty.parseSceneFilename(os.path.basename(scene))
+
+            if parsed is None:
+                continue
+
+            if parsed.isMaster:
+                current.add(scene)
+                continue
+
+            key = (os.path.dirname(scene), parsed.name, parsed.atype)
+            if key not in latest or int(parsed.version) > latest[key][0]:
+                latest[key] = (int(parsed.version), scene)
+
+        current.update(x[1] for x in latest.values())
+
+        return current
+
+    def shotsDependingOn(self, asset, stages=None, currentOnly=True):
+        """
+        Shots that use an asset, directly or through other
+        assets
+
+        @PARAMS
+            asset: Asset, or the path of a scene
+            stages: shot stage types to look at (like "3-lighting"),
+                    all of them by default
+            currentOnly: only look at the MASTER and latest
+                         version of each shot stage
+
+        @RETURNS
+            { shot name : sorted shot stage types }
+        """
+        if isinstance(asset, basestring):
+            targets = [asset]
+        else:
+            targets = [x for x in asset.getAllFiles(asFullpath=True) if x]
+
+        stages = stages or dty.SHOT_STAGE_TYPES.keys()
+        current = self._currentScenes() if currentOnly else None
+
+        scenes = set()
+        for target in targets:
+            scenes |= self.dependentsOf(target)
+
+        shots = {}
+        for scene in scenes:
+            if current is not None and scene not in current:
+                continue
+
+            parsed = dty.parseSceneFilename(os.path.basename(scene))
+
+            if parsed and parsed.atype in stages:
+                shots.setdefault(parsed.name, set()).add(parsed.atype)
+
+        return dict((name, sorted(x)) for name, x in shots.iteritems())
+
+
+_graph = None
+
+def getGraph(update=True):
+    """
+    The project's dependency graph (ROOT_DIR/_temp/depgraph.json),
+    brought up to date with the disk unless 'update' is False
+    """
+    from snpPipeline import ROOT_DIR
+    global _graph
+
+    cachepath = os.path.join(ROOT_DIR, "_temp", GRAPH_FILENAME)
+
+    if _graph is None or _graph.cachepath != cachepath:
+        _graph = DependencyGraph(cachepath, ROOT_DIR)
+
+    if update:
+        _graph.update()
+
+    return _graph
+
+
+def updateInBackground(callback=None):
+    """
+    Bring the project's dependency graph up to date in a
+    thread of its own (the first time reads every scene)
+
+    @PARAMS
+        callback: called with the graph when it's up to date
+                  (from that thread)
+
+    @RETURNS
+        the thread
+    """
+    graph = getGraph(update=False)
+
+    def run():
+        try:
+            graph.update()
+        except (IOError, OSError), e:
+            print "Could not update the dependency graph: " + str(e)
+            return
+
+        if callback:
+            callback(graph)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+    return thread
@@ -0,0 +1,166 @@
+"""
+Rendered frames on disk
+
+Indexes the frames of a render layer (3_Comp/[shot]/Footage/[layer])
+and tells the complete ones (fully written, newer than the
+scene they were rendered from) from the missing or stale
+ones, so an interrupted render can carry on from there
+"""
+import os
+import re
+
+# How the image formats end (a file cut short by a crash won't)
+TRAILERS = {
+    ".png": b"IEND\xaeB`\x82",
+    ".jpg": b"\xff\xd9",
+    ".jpeg": b"\xff\xd9",
+}
+
+# [name].[frame].[ext] (or [name]_[frame].[ext])
+_FRAME_RE = re.compile(r"^(.+?)[._](-?\d+)\.([^.]+)$")
+
+# Maya renders defaultRenderLayer into a folder with this name
+MASTER_LAYER = "masterLayer"
+
+
+def layerFolder(layer):
+    """
+    Name of the folder <RenderLayer> becomes for 'layer'
+    """
+    return MASTER_LAYER if layer == "defaultRenderLayer" else layer
+
+
+def frameNumber(filename):
+    """
+    Frame number in a frame's filename (None if there isn't one)
+    """
+    match = _FRAME_RE.match(os.path.basename(filename))
+    return int(match.group(2)) if match else None
+
+
+def extensionFor(filetype):
+    """
+    Extension of the frames Render -of 'filetype' writes
+    """
+    return "." + {"jpeg": "jpg"}.get(filetype.lower(), filetype.lower())
+
+
+def hasTrailer(path, size):
+    """
+    Does the image end the way its format should (formats
+    not in TRAILERS are taken as complete)
+    """
+    trailer = TRAILERS.get(os.path.splitext(path)[1].lower())
+    if trailer is None:
+        return True
+
+    with open(path, mode="rb") as file:
+        file.seek(max(0, size - 64))
+        tail = file.read()
+
+    # (some writers pad the end)
+    return tail.rstrip(b"\x00").endswith(trailer)
+
+
+def indexFrames(layer_dir, ext=None):
+    """
+    Frame files of a layer folder
+
+    @PARAMS
+        ext: only files with this extension (like ".png")
+
+    @RETURNS
+        { frame number : path } (empty if there's no folder)
+    """
+    frames = {}
+
+    try:
+        filenames = os.listdir(layer_dir)
+    except OSError:
+        return frames
+
+    for filename in filenames:
+        match = _FRAME_RE.match(filename)
+        if not match:
+            continue
+
+        if ext and "." + match.group(3).lower() != ext.lower():
+            continue
+
+        frames[int(match.group(2))] = os.path.join(layer_dir, filename)
+
+    return frames
+
+
+def completeFrames(layer_dir, ext=None, newerThan=None):
+    """
+    Frames of a layer folder that were written out whole
+    (not empty, with their format's trailer) and, if
+    'newerThan' is given, modified after that time
+
+    @RETURNS
+        set of frame numbers
+    """
+    complete = set()
+
+    for frame, path in indexFrames(layer_dir, ext).iteritems():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+
+        if st.st_size == 0:
+            continue
+
+        if newerThan is not None and st.st_mtime <= newerThan:
+            continue
+
+        try:
+            if hasTrailer(path, st.st_size):
+                complete.add(frame)
+        except IOError:
+            continue
+
+    return complete
+
+
+def missingRanges(start, end, complete):
+    """
+    Runs of frames from 'start' to 'end' (included) that
+    aren't in 'complete'
+
+    @RETURNS
+        list of (start, end)
+    """
+    ranges = []
+    first = None
+
+    for frame in range(start, end + 1):
+        if frame in complete:
+            if first is not None:
+                ranges.append((first, frame - 1))
+                first = None
+        elif first is None:
+            first = frame
+
+    if first is not None:
+        ranges.append((first, end))
+
+    return ranges
+
+
+def framesToRender(layer_dir, start, end, filetype, scene=None):
+    """
+    Ranges of a layer still to render: frames missing from
+    'layer_dir', cut short, or older than the 'scene' file
+
+    @RETURNS
+        list of (start, end)
+    """
+    newerThan = None
+    if scene and os.path.exists(scene):
+        newerThan = os.path.getmtime(scene)
+
+    complete = completeFrames(layer_dir, extensionFor(filetype), newerThan)
+
+    return missingRanges(start, end, complete)
@@ -1,6 +1,3 @@
-import assetManager
-import misc
-import renderManager
-reload(assetManager)
-reload(misc)
-reload(renderManager)
\ No newline at end of file
+"""
+Manager windows (import the one needed, see snpPipeline.load)
+"""
@@ -2,19 +2,28 @@
 UI Classes for Asset Manager (and Shot Manager)
 """
 import os
+import itertools
 import maya.cmds as cmds
+import maya.utils
 from collections import namedtuple
+from collections import deque
 
 import snpUtilities as su
 
 import misc
 import snpPipeline.core
 import snpPipeline.dataTypes
+import snpPipeline.watcher
+import snpPipeline.archive
+import snpPipeline.deltastore
+import snpPipeline.depgraph
 
 p = snpPipeline.core
 dty = snpPipeline.dataTypes
-
-reload(misc)
+watcher = snpPipeline.watcher
+archive = snpPipeline.archive
+deltastore = snpPipeline.deltastore
+depgraph = snpPipeline.depgraph
 
 # Status icons
 PROP_ICON = "polyCube.png"
@@ -27,29 +36,48 @@ OLD_BGC = (0.49, 0.482, 0.25)
 INVALID_BGC = (0.394, 0.188, 0.188)
 NEUTRAL_BGC = (0.23, 0.23, 0.23)
 
-def initAssets(atype):
-    # Get asset names from filesystem
-    assetNames = p.getAssets(atype)
+# Watch the asset folders so refreshing only re-parses what changed
+USE_WATCHER = True
+
+# Rows added at a time when streaming in the asset list
+# (the first page is drawn straight away, the rest when Maya is idle)
+PAGE_SIZE = 40
+
+def refreshAssets(atype, assets, changed):
+    """
+    Re-make only the assets whose directories are in
+    'changed', keeping the rest of 'assets' as they are
+
+    @PARAMS
+        assets: { name : Asset } that are currently loaded
+        changed: asset directories that changed on disk
+    """
+    assets = dict(assets)
+
+    for path in changed:
+        name = os.path.basename(path)
+        assets.pop(name, None)
+
+        if p.isAssetDirName(name) and os.path.isdir(path):
+            assets[name] = p.lazyAsset(path, atype)
 
-    # Make Asset objects for each asset
-    assets = []
-    if assetNames != None:
-        for name in assetNames:
-            if "_TEMP_" in name or name.startswith("_") or name.startswith("."):
-                continue
+    return [assets[name] for name in sorted(assets)]
 
-            path = dty.pathOfAssetType(atype, named=name)
+def versionItems(versions, hidden=None):
+    """
+    Every version but MASTER, in order, with the ones that
+    aren't in the asset's folder anymore
 
-            if not os.path.isdir(path):
-                # Don't try to make an asset based on a file
-                continue
+    @PARAMS
+        hidden: { version : (descriptor, where) } (see Manager.hiddenVersions)
 
-            if atype == "shot":
-                assets.append(dty.Shot(path))
-            else:
-                assets.append(dty.Asset(path, atype))
+    @RETURNS
+        [(version, descriptor, where or None), ...]
+    """
+    items = [(v, desc, None) for v, desc in versions.iteritems() if v != "MASTER"]
+    items += [(v, desc, where) for v, (desc, where) in (hidden or {}).iteritems()]
 
-    return assets
+    return sorted(items, key=lambda x: int(x[0]))
 
 class Manager(object):
     """
@@ -74,12 +102,26 @@ class Manager(object):
         #   name : object
         self.assets = {}
 
+        # Assets waiting for their status to be shown
+        self.pendingAssets = deque()
+
+        # Assets still to be added to the list (None once they all are)
+        self.assetStream = None
+
+        # Master status of every asset in the list
+        #   name : dty.MasterInfo (or { shotstage : dty.MasterInfo })
+        self.statuses = {}
+
+        # This manager's place in the filesystem watcher's changes
+        # (None to always re-read everything)
+        self.watcher = watcher.WatchCursor() if USE_WATCHER else None
+
         # Add callbacks
         self.addCallbacks()
 
         # Add stuff to UI
         self.ui.createUI()
-        self.loadUIWith(initAssets(self.atype))
+        self.loadUIWith(self.reloadAssets({}))
 
     def addCallbacks(self):
         self.ui.C_deleteAsset = self.deleteAsset
@@ -89,6 +131,8 @@ class Manager(object):
         self.ui.C_exploreAsset = self.exploreAsset
         self.ui.C_refreshUI = self.refreshUI
         self.ui.C_switchToAssetNamed = self.switchToAssetNamed
+        self.ui.C_archiveVersions = self.archiveVersions
+        self.ui.C_storeVersions = self.storeVersions
 
     def addAsset(self, asset):
         """
@@ -99,17 +143,88 @@ class Manager(object):
         """
         raise NotImplementedError
 
+    def updateAsset(self, asset):
+        """
+        Show the status of an Asset that was added to the list
+
+        @PARAMS
+            asset: Asset object to update
+        """
+        raise NotImplementedError
+
+    def hiddenVersions(self, asset):
+        """
+        Versions of an asset that were moved out of its
+        folder (opening one brings it back)
+
+        @RETURNS
+            { version : (descriptor, where it is) }
+        """
+        hidden = dict((v, (desc, "archived")) for v, desc in asset.archivedVersions().iteritems())
+        hidden.update((v, (desc, "stored")) for v, desc in asset.storedVersions().iteritems())
+
+        return hidden
+
+    def queueUpdateFor(self, asset):
+        """
+        Show the status of an asset once Maya is idle
+        (so the window comes up without parsing every asset)
+        """
+        queue = self.pendingAssets
+        queue.append(asset)
+
+        if len(queue) == 1:
+            cmds.evalDeferred(lambda: self._updateNextAsset(queue), lowestPriority=True)
+
+    def _updateNextAsset(self, queue):
+        # the UI was rebuilt since this was queued
+        if queue is not self.pendingAssets or not queue:
+            return
+
+        asset = queue.popleft()
+
+        if self.assets.get(asset.name) is asset:
+            self.updateAsset(asset)
+
+        if queue:
+            cmds.evalDeferred(lambda: self._updateNextAsset(queue), lowestPriority=True)
+
     def loadUIWith(self, assets):
         """
-        Populate assets
+        Populate assets, a page at a time
+
+        @PARAMS
+            assets: iterable of Assets (can be a generator,
+                    see core.iterAssets)
         """
-        if assets:
-            # Add assets
-            for asset in assets:
-                self.addAsset(asset)
+        stream = iter(assets)
+        self.assetStream = stream
+
+        self._addNextPage(stream)
+
+    def _addNextPage(self, stream):
+        # the UI was rebuilt since this was streamed
+        if stream is not self.assetStream:
+            return
+
+        page = list(itertools.islice(stream, PAGE_SIZE))
+
+        # (work out the page's statuses in one go, rather than asset by asset)
+        names = [x.name for x in page if x.name not in self.statuses]
+        if names:
+            self.statuses.update(p.masterStatuses(self.atype, names))
+
+        # Add assets
+        for asset in page:
+            self.addAsset(asset)
 
         # select an asset if it's currently open
-        self.switchToOpenAssetIn(assets)
+        self.switchToOpenAssetIn(page)
+
+        if len(page) == PAGE_SIZE:
+            cmds.evalDeferred(lambda: self._addNextPage(stream), lowestPriority=True)
+        else:
+            self.assetStream = None
 
     def switchToOpenAssetIn(self, assets):
         try:
@@ -123,13 +238,50 @@ class Manager(object):
                 self.sceneInfo = info
 
 
+    def reloadAssets(self, oldassets):
+        """
+        Get the Asset objects for the list, only
+        re-making the ones that changed on disk if
+        we have a watcher and 'oldassets'
+
+        @PARAMS
+            oldassets: { name : Asset } from before the refresh
+        """
+        changed = None
+        if self.watcher:
+            changed = self.watcher.popChanges(under=dty.pathOfAssetType(self.atype))
+
+        if not oldassets or changed is None:
+            # (statuses get worked out page by page as they're streamed in)
+            self.statuses = {}
+            return p.iterAssets(self.atype, lazy=True)
+
+        names = [os.path.basename(x) for x in changed]
+        for name in names:
+            self.statuses.pop(name, None)
+
+        self.statuses.update(p.masterStatuses(self.atype, names))
+
+        return refreshAssets(self.atype, oldassets, changed)
+
     def refreshUI(self, atype=None):
         if not atype:
             atype = self.atype
 
+        # keep the unchanged assets unless we're switching types
+        oldassets = dict(self.assets) if atype == self.atype else {}
+
+        # (stop streaming in the list, the rows it didn't get
+        #  to yet go in the refreshed one too)
+        stream, self.assetStream = self.assetStream, None
+        if stream is not None and oldassets:
+            for asset in stream:
+                oldassets.setdefault(asset.name, asset)
+
         self.atype = atype
 
         self.assets = {}
+        self.pendingAssets = deque()
         self.selectedAsset = None
         self.sceneInfo = None
         self.selectedVersion = None
@@ -137,7 +289,7 @@ class Manager(object):
         self.ui.atype = atype
         self.ui.createUI()
 
-        self.loadUIWith(initAssets(self.atype))
+        self.loadUIWith(self.reloadAssets(oldassets))
 
     def duplicateAsset(self):
         """
@@ -189,6 +341,47 @@ class Manager(object):
     def exploreAsset(self):
         p.exploreAsset(self.selectedAsset)
 
+    def archiveVersions(self):
+        """
+        Move the selected asset's old versions into its archive
+        """
+        if not self.selectedAsset:
+            return
+
+        def callback(text):
+            try:
+                keep = int(text)
+            except ValueError:
+                cmds.warning("'" + text + "' is not a number of versions")
+                return
+
+            archived = archive.archiveVersions(self.selectedAsset, keep)
+            print "Archived " + str(len(archived)) + " version(s) of '" + self.selectedAsset.name + "'"
+            self.refreshUI()
+
+        self.ui.ArchiveDialog(callback)
+
+    def storeVersions(self):
+        """
+        Move the selected asset's old versions into its
+        delta store (they can still be opened and imported)
+        """
+        if not self.selectedAsset:
+            return
+
+        def callback(text):
+            try:
+                keep = int(text)
+            except ValueError:
+                cmds.warning("'" + text + "' is not a number of versions")
+                return
+
+            stored = deltastore.storeVersions(self.selectedAsset, keep)
+            print "Stored " + str(len(stored)) + " version(s) of '" + self.selectedAsset.name + "'"
+            self.refreshUI()
+
+        self.ui.ArchiveDialog(callback, title="Compact Old Versions")
+
 
 class AssetManager(Manager):
     """
@@ -226,7 +419,23 @@ class AssetManager(Manager):
         """
         self.assets[asset.name] = asset
 
-        self.ui.addAssetInfo(asset.name,
+        info = self.statuses.get(asset.name)
+
+        if info:
+            self.ui.addAssetInfo(asset.name, info.status, info.pointedver, info.latest)
+        else:
+            self.ui.addAssetInfo(asset.name)
+            self.queueUpdateFor(asset)
+
+    #OVERRIDE
+    def updateAsset(self, asset):
+        """
+        Show the status of an Asset that was added to the list
+
+        @PARAMS
+            asset: Asset object to update
+        """
+        self.ui.updateAssetInfo(asset.name,
                             asset.masterstatus,
                             asset.getPointedVersion(),
                             asset.latest)
@@ -285,7 +494,8 @@ class AssetManager(Manager):
             self.selectedVersion = str(asset.latest)
 
         # add to gui
-        self.ui.addVersionsInfo(versions, pointedver, atVersion, self.selectedVersion)
+        self.ui.addVersionsInfo(versions, pointedver, atVersion, self.selectedVersion,
+                                self.hiddenVersions(asset))
 
     def versionListChanged(self, version):
         self.selectedVersion = version
@@ -327,8 +537,20 @@ class AssetManager(Manager):
         """
         if self.selectedVersion and self.selectedAsset:
             p.publishAsset(self.selectedAsset, self.selectedVersion)
+
             self.refreshUI()
 
+            # (from the scene headers, nothing gets opened; in the
+            #  background, the first time reads the whole project)
+            asset = self.selectedAsset
+
+            def report(graph):
+                shots = graph.shotsDependingOn(asset, stages=["3-lighting"])
+                if shots:
+                    print "Shots to re-render after publishing '" + asset.name + "': " + ", ".join(sorted(shots))
+
+            depgraph.updateInBackground(lambda graph: maya.utils.executeDeferred(report, graph))
+
     def saveNewVersion(self):
         """
         Save new version of asset from current scene
@@ -374,6 +596,8 @@ class ShotManager(Manager):
         super(ShotManager, self).addCallbacks()
 
         self.ui.C_switchToAssetNamed = self.switchToAssetNamed
+        self.ui.C_archiveVersions = self.archiveVersions
+        self.ui.C_storeVersions = self.storeVersions
 
         self.ui.C_openSelectedVersion = self.openSelectedVersion
         self.ui.C_versionListChanged = self.versionListChanged
@@ -399,6 +623,22 @@ class ShotManager(Manager):
 
         self.ui.addShotInfoFor(asset)
 
+        infos = self.statuses.get(asset.name)
+
+        if infos:
+            self.ui.updateShotInfoFor(asset, infos)
+        else:
+            self.queueUpdateFor(asset)
+
+    def updateAsset(self, asset):
+        """
+        Show the status of an Asset that was added to the list
+
+        @PARAMS
+            asset: Asset object to update
+        """
+        self.ui.updateShotInfoFor(asset)
+
     def publishSelectedVersion(self, shotstage):
         """
         Publishes the selected version for the selected asset
@@ -490,7 +730,8 @@ class ShotManager(Manager):
             self.selectedVersions[shotstage] = str(asset.latest)
 
         # add to gui
-        self.ui.addVersionsInfo(versions, pointedver, atVersion, currentStage, self.selectedVersions, shotstage)
+        self.ui.addVersionsInfo(versions, pointedver, atVersion, currentStage, self.selectedVersions, shotstage,
+                                self.hiddenVersions(asset))
 
 
     def switchToOpenAssetIn(self, assets):
@@ -628,12 +869,25 @@ class ManagerUI(object):
                     noLabel="Cancel",
                     yesAction=action)
 
+    def ArchiveDialog(self, action, title="Archive Old Versions"):
+        misc.DialogBoxUI(title,
+                    message="Versions to keep (the pointed one is always kept):",
+                    hasField=True,
+                    fieldText=str(archive.KEEP_LATEST),
+                    requireField=True,
+                    yesLabel="OK",
+                    noLabel="Cancel",
+                    yesAction=action)
+
     def createMenubar(self):
         # create menus
         self.ui["toolsMenu"] = cmds.menu(label="Tools")
         cmds.menuItem(label="Batch Publish...")
         cmds.menuItem(label="Export File List...")
-        cmds.menuItem(label="Archive Old Versions...")
+        cmds.menuItem(label="Archive Old Versions...",
+                      command=lambda _: self.C_archiveVersions())
+        cmds.menuItem(label="Compact Old Versions...",
+                      command=lambda _: self.C_storeVersions())
         self.ui["settingsMenu"] = cmds.menu(label="Settings")
         cmds.menuItem(label="Settings Manager...")
 
@@ -778,14 +1032,12 @@ class AssetManagerUI(ManagerUI):
         # Title of window
         self.windowTitle = "Asset Manager"
 
-    def addAssetInfo(self, name, status, pointedver, latest):
+    def addAssetInfo(self, name, status=None, pointedver=None, latest=None):
         """
         Add checkbox/list item for asset
+        (without a status it is shown as pending until updateAssetInfo)
         """
 
-        padlen = 30 - len(name)
-        pad = " " * padlen
-
         if self.atype == "rig":
             icon = RIG_ICON
         elif self.atype == "prop":
@@ -795,17 +1047,10 @@ class AssetManagerUI(ManagerUI):
         else:
             icon = SHOT_ICON
 
-        if status == 2:
-            color = LATEST_BGC
-            assetstatus = pad + "@MASTER -> " + pointedver
-        elif status == 1:
-            color = OLD_BGC
-            assetstatus = pad + "@MASTER -> " + pointedver + " (" + latest + ")"
-        elif status == 0:
-            color = INVALID_BGC
-            assetstatus = pad + "(" + latest + ")"
+        if status is None:
+            label, color = name, NEUTRAL_BGC
         else:
-            cmds.error("Invalid status")
+            label, color = self.assetInfoLabel(name, status, pointedver, latest)
 
 
         #color = su.multvec(color, (1.0,1.0,1.0))
@@ -824,32 +1069,67 @@ class AssetManagerUI(ManagerUI):
                 height=30,
                 style='iconAndTextHorizontal',
                 image1=icon,
-                label=name + assetstatus,
+                label=label,
                 parent=self.ui["assetList"],
                 bgc=color,
                 font="fixedWidthFont",
                 onCommand=lambda _, x=name: self.C_switchToAssetNamed(x),
                 offCommand=lambda _, x=name: self.selectAssetListItem(x))
 
-    def addVersionsInfo(self, versions, pointedVer, sceneVersion, selectedVersion):
+    def updateAssetInfo(self, name, status, pointedver, latest):
+        """
+        Show the status on an asset's checkbox/list item
+        """
+        if not cmds.iconTextCheckBox(name, exists=True):
+            return
+
+        label, color = self.assetInfoLabel(name, status, pointedver, latest)
+
+        cmds.iconTextCheckBox(name, e=True, label=label, bgc=color)
+
+    def assetInfoLabel(self, name, status, pointedver, latest):
+        """
+        Label and color for an asset's list item
+        """
+        padlen = 30 - len(name)
+        pad = " " * padlen
+
+        if status == 2:
+            color = LATEST_BGC
+            assetstatus = pad + "@MASTER -> " + pointedver
+        elif status == 1:
+            color = OLD_BGC
+            assetstatus = pad + "@MASTER -> " + pointedver + " (" + latest + ")"
+        elif status == 0:
+            color = INVALID_BGC
+            assetstatus = pad + "(" + latest + ")"
+        else:
+            cmds.error("Invalid status")
+
+        return name + assetstatus, color
+
+    def addVersionsInfo(self, versions, pointedVer, sceneVersion, selectedVersion, hidden=None):
         """
         Add items to versions scroll list
+        (and the 'hidden' ones, see Manager.hiddenVersions)
         """
-        for v, desc in versions.iteritems():
-            if v != "MASTER":
+        for v, desc, where in versionItems(versions, hidden):
+            pointed = ""
+            if v == pointedVer:
+                pointed = "@ "
 
-                pointed = ""
-                if v == pointedVer:
-                    pointed = "@ "
+            opened = ""
+            if v == sceneVersion:
+                opened = "   <-----"
 
-                opened = ""
-                if v == sceneVersion:
-                    opened = "   <-----"
+            moved = ""
+            if where:
+                moved = "   [" + where + "]"
 
-                cmds.textScrollList(self.ui["versionList"],
-                                    edit=True,
-                                    append=pointed + v + ": " + desc.lower() + opened,
-                                    uniqueTag=v)
+            cmds.textScrollList(self.ui["versionList"],
+                                edit=True,
+                                append=pointed + v + ": " + desc.lower() + moved + opened,
+                                uniqueTag=v)
 
         cmds.textScrollList(self.ui["versionList"],
                     edit=True,
@@ -957,83 +1237,103 @@ class ShotManagerUI(ManagerUI):
         self.createUI()
 
     def addShotInfoFor(self, shot):
-        padlen = 16 - len(shot.name)
-        pad = " " * padlen
-
-        sep = " | "
-        blank = "   "
-
+        """
+        Add checkbox/list item for shot
+        (shown as pending until updateShotInfoFor)
+        """
         image = SHOT_ICON
         color = NEUTRAL_BGC
         name = shot.name
 
-        if shot.shotstages["Layout"].masterstatus == 2:
-            layoutver = "MASTER"
-        else:
-            layoutver = shot.shotstages["Layout"].latest
-            layoutver = blank if not layoutver else layoutver
-
-        if shot.shotstages["Animation"].masterstatus == 2:
-            animationver = "MASTER"
-        else:
-            animationver = shot.shotstages["Animation"].latest
-            animationver = blank if not animationver else animationver
-
-        if shot.shotstages["Lighting"].masterstatus == 2:
-            lightingver = "MASTER"
-        else:
-            lightingver = shot.shotstages["Lighting"].latest
-            lightingver = blank if not lightingver else lightingver
-
         if self.lastwasdark:
             color = su.multvec(color, (1.3,1.3,1.3))
 
         self.lastwasdark = not self.lastwasdark
 
-        # C20    LO: MASTER | Anim: 004 | Light: 007
-
-        assetstatus = pad + "LO: " + layoutver + sep + "Anim: " + animationver + sep + "Light: " + lightingver
-
         cmds.iconTextCheckBox(
                 name,
                 width=490,
                 height=30,
                 style='iconAndTextHorizontal',
                 image1=image,
-                label=name + assetstatus,
+                label=name,
                 parent=self.ui["assetList"],
                 bgc=color,
                 font="fixedWidthFont",
                 onCommand=lambda _, x=name: self.C_switchToAssetNamed(x),
                 offCommand=lambda _, x=name: self.selectAssetListItem(x))
 
+    def updateShotInfoFor(self, shot, infos=None):
+        """
+        Show the status of each shot stage on a shot's checkbox/list item
+
+        @PARAMS
+            infos: { shotstage : dty.MasterInfo } if already worked out
+        """
+        if not cmds.iconTextCheckBox(shot.name, exists=True):
+            return
+
+        if not infos:
+            infos = {}
+            for shotstage, asset in shot.shotstages.iteritems():
+                infos[shotstage] = dty.MasterInfo(asset.masterstatus,
+                                                  None,
+                                                  asset.latest)
+
+        padlen = 16 - len(shot.name)
+        pad = " " * padlen
+
+        sep = " | "
+        blank = "   "
+
+        name = shot.name
+
+        def stageVer(info):
+            if info.status == 2:
+                return "MASTER"
+
+            return info.latest if info.latest else blank
+
+        layoutver = stageVer(infos["Layout"])
+        animationver = stageVer(infos["Animation"])
+        lightingver = stageVer(infos["Lighting"])
+
+        # C20    LO: MASTER | Anim: 004 | Light: 007
+
+        assetstatus = pad + "LO: " + layoutver + sep + "Anim: " + animationver + sep + "Light: " + lightingver
+
+        cmds.iconTextCheckBox(name, e=True, label=name + assetstatus)
 
     def clearVersionsList(self):
         cmds.textScrollList(self.ui["verList" + "Layout"], edit=True, removeAll=True)
         cmds.textScrollList(self.ui["verList" + "Animation"], edit=True, removeAll=True)
         cmds.textScrollList(self.ui["verList" + "Lighting"], edit=True, removeAll=True)
 
-    def addVersionsInfo(self, versions, pointedver, sceneVersion, sceneShotstage, selectedVersions, shotstage):
+    def addVersionsInfo(self, versions, pointedver, sceneVersion, sceneShotstage, selectedVersions, shotstage,
+                        hidden=None):
         """
         Add items to versions scroll list for the type of shot stage
+        (and the 'hidden' ones, see Manager.hiddenVersions)
         """
 
         # TODO: DRY
-        for v, desc in versions.iteritems():
-            if v != "MASTER":
-
-                pointed = ""
-                if v == pointedver:
-                    pointed = "@"
-
-                opened = ""
-                if v == sceneVersion and shotstage == sceneShotstage:
-                    opened = "   <-----"
-
-                cmds.textScrollList(self.ui["verList" + shotstage],
-                                    edit=True,
-                                    append=pointed + v + ": " + desc.lower() + opened,
-                                    uniqueTag=v)
+        for v, desc, where in versionItems(versions, hidden):
+            pointed = ""
+            if v == pointedver:
+                pointed = "@"
+
+            opened = ""
+            if v == sceneVersion and shotstage == sceneShotstage:
+                opened = "   <-----"
+
+            moved = ""
+            if where:
+                moved = "   [" + where + "]"
+
+            cmds.textScrollList(self.ui["verList" + shotstage],
+                                edit=True,
+                                append=pointed + v + ": " + desc.lower() + moved + opened,
+                                uniqueTag=v)
 
         cmds.textScrollList(self.ui["verList" + shotstage],
                             edit=True,
@@ -1,15 +1,21 @@
 import os
 import json
+import time
 from sets import Set
 
 import maya.cmds as cmds
+import maya.utils
 
 import snpPipeline.core as p
+import snpPipeline.rendercore as rendercore
+import snpPipeline.rendermetrics as rendermetrics
 import snpPipeline.seq_rendercore as rc
 import snpPipeline.blenderinterop as blender
 import snpPipeline.utilities as utilities
+import snpPipeline.mafile as mafile
 from snpPipeline import PROJECT_ROOT_VAR, ROOT_DIR, BLENDER_DIR
-from assetManager import initAssets, p, LATEST_BGC, OLD_BGC, NEUTRAL_BGC
+from assetManager import p, LATEST_BGC, OLD_BGC, NEUTRAL_BGC
+import misc
 
 import enoguRefreshShad as ers
 
@@ -82,6 +88,22 @@ def getRenderStatus(shot):
 
     return has, old
 
+def getSceneMetadata(shot):
+    """
+    Frame range, cameras and render layers of the shot's
+    latest Lighting scene, read straight from the file
+    (None if there isn't one)
+    """
+    asset = shot.shotstages["Lighting"]
+    if not asset.latest:
+        return None
+
+    try:
+        return mafile.getMetadataCache().get(asset.fileFromVersion(asset.latest))
+    except (IOError, OSError):
+        return None
+
+
 def initShadMap(shot):
     """
     Set up the shadow map for each Enogu material that has shadow map support
@@ -131,6 +153,13 @@ def sendToBlender(shot, update=False):
         cmds.warning("This shot has nothing in the lighting stage")
         return
 
+    # (cameras from references don't show up in the file, but
+    #  too many is already too many)
+    metadata = getSceneMetadata(shot)
+    if metadata and len(mafile.renderableCameras(metadata)) > 1:
+        cmds.warning("CAMERA ERROR: Too many cooks! (" + ", ".join(mafile.renderableCameras(metadata)) + ")")
+        return
+
     path = os.path.join(asset.getBaseDir(), "Blender")
     if not os.path.exists(path):
         os.makedirs(path)
@@ -221,13 +250,20 @@ def renderBlender(shots):
 
         blender_files.append(path)
 
-    blender.parallel_render(blender_files)
+    return blender.parallel_render(blender_files)
 
 
-def render(shots):
+def render(shots, background=False, resume=False):
     """
     Render out maya shots
+
+    @PARAMS
+        background: render each layer in its own background
+                    process, several at once (see seq_rendercore.renderSeqBackground)
+        resume: only render the frames missing from Footage
     """
+    queue = rc.newRenderQueue() if background else None
+
     for shot in shots:
         shot_asset = shot.shotstages["Lighting"]
         ver = shot_asset.latest
@@ -243,10 +279,19 @@ def render(shots):
         fixRenderSettings()
 
         # render
-        rc.renderSeq(shot.name, IMAGE_FORMAT)
+        if background:
+            rc.renderSeqBackground(shot.name, IMAGE_FORMAT, queue, resume=resume)
+        else:
+            rc.renderSeq(shot.name, IMAGE_FORMAT, resume=resume)
 
     utilities.newFile()
 
+    if background:
+        queue.start()
+        print(str(len(queue.jobs)) + " layers rendering in the background, logs in " + queue.logdir)
+
+    return queue
+
 
 class RenderManagerUI(object):
     def __init__(self):
@@ -256,8 +301,17 @@ class RenderManagerUI(object):
         self.scenes = {}
         self.b_scenes = {}
 
+        # Scene metadata of each shot's latest Lighting scene
+        #   name : mafile.SceneMetadata
+        self.metadata = {}
+
+        # Background renders started from here (see render)
+        self.queue = None
+        self._lastEtaUpdate = 0.0
+
         self.createUI()
         self.refresh()
+        self.recoverInterrupted()
 
     def getCheckedShots(self):
         shots = []
@@ -268,13 +322,118 @@ class RenderManagerUI(object):
         return shots
 
     def refresh(self):
-        assets = initAssets("shot")
+        # (every shot gets used, so parse them all in parallel)
+        assets = p.loadAssets("shot")
+
+        # (read from the scene files, without opening them)
+        metadata = p.parallelMap(getSceneMetadata, assets)
+        self.metadata = dict((x.name, m) for x, m in zip(assets, metadata))
+        mafile.getMetadataCache().save()
 
         for asset in assets:
             has_blender, update_blender = getBlenderStatus(asset)
             has_render, update_render = getRenderStatus(asset)
             self.createAssetBtn(asset, has_blender, update_blender, has_render, update_render)
 
+    def deepCheck(self):
+        """
+        Re-check every master against the contents of the
+        scene it points to, instead of the dates
+        """
+        statuses = p.masterStatuses("shot", deep=True)
+
+        for checkbox, shot in self.scenes.iteritems():
+            for shotstage, info in statuses.get(shot.name, {}).iteritems():
+                shot.shotstages[shotstage]._masterstatus = info.status
+
+            cmds.iconTextCheckBox(checkbox, e=True, label=shot.name + self.getShotStatus(shot))
+
+    def watchQueue(self, queue):
+        """
+        Show the progress and ETA of a background render
+        queue (updated as frames and jobs get done)
+        """
+        self.queue = queue
+        if queue is None:
+            return
+
+        collect = queue.onJobDone
+
+        def onJobDone(job):
+            if collect:
+                collect(job)
+            self._deferEtaUpdate(force=True)
+
+        queue.onJobDone = onJobDone
+        queue.onFrame = lambda job, record: self._deferEtaUpdate()
+
+        self.updateEta()
+
+    def _deferEtaUpdate(self, force=False):
+        # (called from the queue's threads, the UI has to be
+        #  touched from the main one; once a second at most)
+        now = time.time()
+        if not force and now - self._lastEtaUpdate < 1.0:
+            return
+
+        self._lastEtaUpdate = now
+        maya.utils.executeDeferred(self.updateEta)
+
+    def updateEta(self):
+        if not self.queue or not cmds.text(self.ui["etaText"], exists=True):
+            return
+
+        jobs = self.queue.jobs
+        done = len([x for x in jobs if x.endTime is not None])
+        label = "Rendering: " + str(done) + "/" + str(len(jobs)) + " jobs"
+
+        if self.queue.isFinished():
+            label += ", done" + (" (" + str(len(self.queue.failed())) + " failed)" if self.queue.failed() else "")
+        else:
+            eta, frames = rendermetrics.estimateRemaining(self.queue)
+            if frames:
+                label += ", " + str(frames) + " frames left"
+            if eta is not None:
+                label += ", ETA " + time.strftime("%H:%M:%S", time.gmtime(eta))
+
+        cmds.text(self.ui["etaText"], e=True, label=label)
+
+    def recoverInterrupted(self):
+        """
+        Offer to render again the jobs a crash (or reboot)
+        left unfinished, from the render journal
+        """
+        jobs = rendercore.interruptedRenders()
+        if not jobs:
+            return
+
+        def callback(*args):
+            self.watchQueue(rendercore.recoverRenders(jobs))
+
+        def dismiss(*args):
+            rendercore.dismissRenders(jobs)
+
+        misc.DialogBoxUI("Interrupted Renders",
+                         message=str(len(jobs)) + " render jobs didn't finish last time (" +
+                                 ", ".join(sorted(set(x.shot or x.name for x in jobs))) + ")",
+                         hasField=False,
+                         requireField=False,
+                         yesLabel="Render Them",
+                         noLabel="Dismiss",
+                         yesAction=callback,
+                         noAction=dismiss)
+
+    def renderBackground(self):
+        shots = self.getCheckedShots()
+        if not shots:
+            cmds.warning("No shots selected")
+            return
+
+        self.watchQueue(render(shots, background=True, resume=self.isResuming()))
+
+    def isResuming(self):
+        return bool(cmds.menuItem(self.ui["resumeItem"], q=True, checkBox=True))
+
     def getShotStatus(self, shot):
         padlen = 16 - len(shot.name)
         pad = " " * padlen
@@ -303,6 +462,16 @@ class RenderManagerUI(object):
             lightingver = blank if not lightingver else lightingver
 
         assetstatus = pad + "LO: " + layoutver + sep + "Anim: " + animationver + sep + "Light: " + lightingver
+
+        metadata = self.metadata.get(shot.name)
+        if metadata:
+            frames = mafile.frameRange(metadata)
+            if frames:
+                assetstatus += sep + str(frames[0]) + "-" + str(frames[1])
+
+            if len(mafile.renderableCameras(metadata)) > 1:
+                assetstatus += sep + "CAMS!"
+
         return assetstatus
 
     def createAssetBtn(self, shot, has_blender, update_blender, has_render, update_render):
@@ -383,6 +552,16 @@ class RenderManagerUI(object):
                                 maximizeButton=False,
                                 menuBar=True)
 
+        # menus
+        self.ui["statusMenu"] = cmds.menu(label="Status")
+        cmds.menuItem(label="Deep Check Masters (MD5)", command=lambda *_: self.deepCheck())
+
+        self.ui["renderMenu"] = cmds.menu(label="Render")
+        cmds.menuItem(label="Render Maya in Background (per layer)",
+                      command=lambda *_: self.renderBackground())
+        self.ui["resumeItem"] = cmds.menuItem(label="Resume (only missing or stale frames)",
+                                              checkBox=False)
+
         # create root layout
         self.root = cmds.columnLayout()
 
@@ -479,7 +658,7 @@ class RenderManagerUI(object):
             if not shots:
                 cmds.warning("No shots selected")
                 return
-            renderBlender(shots)
+            self.watchQueue(renderBlender(shots))
 
         self.ui["renderBtn"] = cmds.button(label="Render Blender",
                                            width=150,
@@ -492,7 +671,7 @@ class RenderManagerUI(object):
             if not shots:
                 cmds.warning("No shots selected")
                 return
-            render(shots)
+            render(shots, resume=self.isResuming())
 
         self.ui["renderBtn"] = cmds.button(label="Render Maya",
                                            width=150,
@@ -500,4 +679,7 @@ class RenderManagerUI(object):
                                            p=self.ui["btmToolbar"],
                                            command=renderCallback)
 
+        # background render progress (see watchQueue)
+        self.ui["etaText"] = cmds.text(label="", align="left", w=WIDTH, p=self.root)
+
         cmds.showWindow()
@@ -0,0 +1,103 @@
+"""
+Import-time breakdown
+
+Imports made inside timed() are timed module by module,
+including everything they import in turn (like
+python -X importtime, which Python 2 doesn't have)
+"""
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+# Modules in the order they finished importing
+#   name : (self seconds, total seconds, nesting depth)
+TIMES = OrderedDict()
+
+_state = {"depth": 0, "original": None}
+
+
+def _makeHook(original):
+    # one [time of nested imports, modules loaded] per import being timed
+    stack = []
+
+    # modules we've already accounted for (and how many
+    # sys.modules held then, failed imports take theirs out)
+    seen = set(sys.modules)
+    count = [len(sys.modules)]
+
+    def claim():
+        new = [x for x in sys.modules if x not in seen]
+        seen.update(new)
+        count[0] = len(sys.modules)
+
+        # (Python 2 puts None in for failed implicit relative imports)
+        return [x for x in new if sys.modules[x] is not None]
+
+    def hook(name, *args, **kwargs):
+        # (a module shows up in sys.modules before it runs, so whatever
+        #  appeared since belongs to the import that is running it)
+        if len(sys.modules) != count[0]:
+            loaded = claim()
+            if stack:
+                stack[-1][1].extend(loaded)
+
+        start = time.time()
+        stack.append([0.0, []])
+
+        try:
+            return original(name, *args, **kwargs)
+        finally:
+            total = time.time() - start
+            nested, loaded = stack.pop()
+
+            # (nothing new was loaded, by far the most common case)
+            if len(sys.modules) != count[0]:
+                loaded.extend(claim())
+
+            if stack:
+                stack[-1][0] += total
+
+            if loaded:
+                TIMES[", ".join(sorted(loaded))] = (total - nested, total, len(stack))
+
+    return hook
+
+
+@contextmanager
+def timed():
+    """
+    Time the imports made inside the 'with' block
+    """
+    if _state["depth"] == 0:
+        _state["original"] = builtins.__import__
+        builtins.__import__ = _makeHook(_state["original"])
+
+    _state["depth"] += 1
+
+    try:
+        yield
+    finally:
+        _state["depth"] -= 1
+
+        if _state["depth"] == 0:
+            builtins.__import__ = _state["original"]
+
+
+def report(out=None):
+    """
+    Print the times of everything imported through timed()
+    """
+    out = out or sys.stdout
+
+    out.write("%10s %10s  %s\n" % ("self ms", "total ms", "module"))
+
+    for name, (own, total, depth) in TIMES.iteritems():
+        out.write("%10.1f %10.1f  %s%s\n" % (own * 1000.0, total * 1000.0, "  " * depth, name))
+
+    out.write("%10.1f %21s\n" % (sum(x[0] for x in TIMES.itervalues()) * 1000.0, "(all)"))
@@ -0,0 +1,349 @@
+"""
+Reading bits of Maya ASCII (.ma) scenes without Maya
+
+References: the header of a .ma (everything before the first
+createNode) holds the 'file' commands of its references:
+
+    file -rdi 1 -ns "Bot" -rfn "BotRN" -typ "mayaAscii" "1_3DCG/Rigs/Bot/Bot_rig.ma";
+    file -r -ns "Bot" -dr 1 -rfn "BotRN" -typ "mayaAscii" "1_3DCG/Rigs/Bot/Bot_rig.ma";
+
+('-r' are the scene's own references, '-rdi' the ones
+nested in them)
+"""
+import os
+import re
+import json
+import mmap
+import threading
+from collections import namedtuple
+
+Reference = namedtuple("Reference", ["path", "namespace", "refnode", "deferred"])
+
+# a quoted MEL string (with escapes) or a bare word
+_TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+# copy number Maya adds to the path of the same file referenced twice
+_COPY_NUMBER_RE = re.compile(r"\{\d+\}$")
+
+
+def _tokens(statement):
+    tokens = []
+    for quoted, bare in _TOKEN_RE.findall(statement.rstrip().rstrip(";")):
+        if bare:
+            tokens.append(bare)
+        else:
+            tokens.append(quoted.replace('\\"', '"').replace("\\\\", "\\"))
+
+    return tokens
+
+
+def headerStatements(path):
+    """
+    Yields the MEL statements of a .ma's header (up to the
+    first createNode), reading no more of the file than that
+    """
+    with open(path, mode="r") as file:
+        statement = []
+
+        for line in file:
+            if line.startswith("createNode"):
+                return
+
+            if not statement and (line.startswith("//") or not line.strip()):
+                continue
+
+            statement.append(line.strip())
+
+            if line.rstrip().endswith(";"):
+                yield " ".join(statement)
+                statement = []
+
+
+def _parseFileCommand(statement):
+    tokens = _tokens(statement)
+
+    if tokens[0] != "file" or "-r" not in tokens:
+        return None
+
+    namespace = refnode = None
+    deferred = False
+
+    for i, token in enumerate(tokens[:-1]):
+        if token == "-ns":
+            namespace = tokens[i + 1]
+        elif token == "-rfn":
+            refnode = tokens[i + 1]
+        elif token == "-dr":
+            deferred = tokens[i + 1] == "1"
+
+    # (the path is the last argument)
+    return Reference(_COPY_NUMBER_RE.sub("", tokens[-1]), namespace, refnode, deferred)
+
+
+def scanReferences(path):
+    """
+    The references a .ma scene makes itself (not the ones
+    nested in those)
+
+    @RETURNS
+        list of Reference, paths as they are in the scene
+    """
+    references = []
+
+    for statement in headerStatements(path):
+        if not statement.startswith("file "):
+            continue
+
+        reference = _parseFileCommand(statement)
+        if reference:
+            references.append(reference)
+
+    return references
+
+
+def resolvePath(path, root):
+    """
+    Absolute path of a path from a scene (relative to the
+    project 'root', with environment variables, or absolute)
+    """
+    path = os.path.expandvars(path)
+
+    if not os.path.isabs(path):
+        path = os.path.join(root, path)
+
+    return os.path.normpath(path)
+
+
+# Render-related bits of a scene (see readMetadata)
+#   minTime, maxTime, animStart, animEnd: playbackOptions (None if not set)
+#   renderStart, renderEnd: frames the render settings render (None if not set)
+#   cameras: { camera shape : renderable }
+#   renderLayers: { layer : RenderLayer }
+SceneMetadata = namedtuple("SceneMetadata", ["minTime", "maxTime", "animStart", "animEnd",
+                                             "renderStart", "renderEnd", "cameras", "renderLayers"])
+
+RenderLayer = namedtuple("RenderLayer", ["renderable", "members"])
+
+# the time slider, kept in the sceneConfigurationScriptNode
+_PLAYBACK_RE = re.compile(br'playbackOptions((?: -\w+ [-0-9.e]+)+)')
+_PLAYBACK_FLAGS = {b"min": "minTime", b"max": "maxTime", b"ast": "animStart", b"aet": "animEnd"}
+
+# the render settings (the frame range Render goes over)
+_RENDER_GLOBALS_RE = re.compile(br'^select -ne :defaultRenderGlobals;', re.MULTILINE)
+_RENDER_FLAGS = {b"fs": "renderStart", b"ef": "renderEnd"}
+_RENDER_RANGE_RE = re.compile(br'setAttr "\.(fs|ef)" ([-0-9.e]+)')
+
+_NODE_RE = re.compile(br'^createNode (camera|renderLayer)\b([^;]*);', re.MULTILINE)
+_NAME_RE = re.compile(br'-n "([^"]+)"')
+_PARENT_RE = re.compile(br'-p "([^"]+)"')
+
+# (setAttr lines of a node are indented under its createNode)
+_BLOCK_END_RE = re.compile(br'\n[^\t]')
+_CAM_RENDERABLE_RE = re.compile(br'setAttr (?:-\w+ \w+ )*"\.(?:rnd|renderable)" (yes|no|1|0|true|false)')
+_LAYER_RENDERABLE_RE = re.compile(br'setAttr (?:-\w+ \w+ )*"\.(?:rndr|renderable)" (yes|no|1|0|true|false)')
+
+# legacy render layer membership: layer.renderInfo -> node.renderLayerInfo[n]
+_MEMBER_RE = re.compile(br'^connectAttr (?:-\w+ )*"([^"]+)\.ri" "([^"]+)\.rlio\[\d*\]"', re.MULTILINE)
+
+_TRUE = (b"yes", b"1", b"true")
+
+
+def _str(data):
+    return data if isinstance(data, str) else data.decode("utf8")
+
+
+def readMetadata(path):
+    """
+    Pull the frame ranges, cameras and render layers
+    out of a .ma without Maya (through mmap, so only the
+    pages the regexes go over are read)
+
+    Only sees what's created in the scene itself
+    (not cameras or layers inside references)
+
+    @RETURNS
+        SceneMetadata
+    """
+    ranges = dict.fromkeys(list(_PLAYBACK_FLAGS.values()) + list(_RENDER_FLAGS.values()))
+    cameras = {}
+    layers = {}
+
+    with open(path, mode="rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return SceneMetadata(cameras=cameras, renderLayers=layers, **ranges)
+
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            match = _PLAYBACK_RE.search(data)
+            if match:
+                flags = match.group(1).split()
+                for flag, value in zip(flags[::2], flags[1::2]):
+                    key = _PLAYBACK_FLAGS.get(flag.lstrip(b"-"))
+                    if key:
+                        ranges[key] = float(value)
+
+            match = _RENDER_GLOBALS_RE.search(data)
+            if match:
+                end = _BLOCK_END_RE.search(data, match.end())
+                block = data[match.end():end.start() if end else len(data)]
+
+                for flag, value in _RENDER_RANGE_RE.findall(block):
+                    ranges[_RENDER_FLAGS[flag]] = float(value)
+
+            for match in _NODE_RE.finditer(data):
+                nodetype, args = match.groups()
+
+                name = _NAME_RE.search(args)
+                if not name:
+                    continue
+                name = _str(name.group(1))
+
+                end = _BLOCK_END_RE.search(data, match.end())
+                block = data[match.end():end.start() if end else len(data)]
+
+                if nodetype == b"camera":
+                    parent = _PARENT_RE.search(args)
+                    if parent:
+                        name = _str(parent.group(1)) + "|" + name
+
+                    renderable = _CAM_RENDERABLE_RE.search(block)
+                    cameras[name] = renderable.group(1) in _TRUE if renderable else True
+                else:
+                    renderable = _LAYER_RENDERABLE_RE.search(block)
+                    layers[name] = RenderLayer(renderable.group(1) in _TRUE if renderable else True, [])
+
+            for match in _MEMBER_RE.finditer(data):
+                layer, member = _str(match.group(1)), _str(match.group(2))
+                if layer in layers:
+                    layers[layer].members.append(member)
+        finally:
+            data.close()
+
+    return SceneMetadata(cameras=cameras, renderLayers=layers, **ranges)
+
+
+def frameRange(metadata):
+    """
+    First and last frame a render of the scene goes over
+    (the render settings' range, or the time slider's if
+    they aren't in the file)
+
+    @RETURNS
+        (start, end) as ints, None if neither is there
+    """
+    if metadata.renderStart is not None and metadata.renderEnd is not None:
+        return int(round(metadata.renderStart)), int(round(metadata.renderEnd))
+
+    if metadata.minTime is not None and metadata.maxTime is not None:
+        return int(round(metadata.minTime)), int(round(metadata.maxTime))
+
+    return None
+
+
+def renderableCameras(metadata):
+    return sorted(x for x, renderable in metadata.cameras.iteritems() if renderable)
+
+
+def renderableLayers(metadata):
+    return sorted(x for x, layer in metadata.renderLayers.iteritems() if layer.renderable)
+
+
+class MetadataCache(object):
+    """
+    readMetadata results kept per file (and saved to
+    'cachepath' if given), only valid while the file's
+    (st_mtime_ns, st_size) stays the same
+    """
+    def __init__(self, cachepath=None):
+        self.cachepath = cachepath
+
+        #   path : ((mtime_ns, size), SceneMetadata)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        self.hits = 0
+        self.misses = 0
+
+        if cachepath:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.cachepath, mode="r") as file:
+                saved = json.load(file)
+        except (IOError, ValueError):
+            return
+
+        for path, (key, fields) in saved.iteritems():
+            # (saved before SceneMetadata got more fields, read the file again)
+            if set(fields) != set(SceneMetadata._fields):
+                continue
+
+            fields["renderLayers"] = dict((k, RenderLayer(*v)) for k, v in fields["renderLayers"].iteritems())
+            self._entries[path] = (tuple(key), SceneMetadata(**fields))
+
+    def save(self):
+        """
+        Write the cache out (if anything was read since)
+        """
+        if not self.cachepath or not self._dirty:
+            return
+
+        from snpPipeline.copyengine import replaceFile
+
+        with self._lock:
+            saved = dict((path, (key, metadata._asdict())) for path, (key, metadata) in self._entries.iteritems())
+            self._dirty = False
+
+        folder = os.path.dirname(self.cachepath)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        with open(self.cachepath + ".tmp", mode="w") as file:
+            json.dump(saved, file)
+
+        replaceFile(self.cachepath + ".tmp", self.cachepath)
+
+    def get(self, path):
+        from snpPipeline.dataTypes import mtimeNs
+
+        st = os.stat(path)
+        key = (mtimeNs(st), st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+
+            if entry and entry[0] == key:
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+
+        metadata = readMetadata(path)
+
+        with self._lock:
+            self._entries[path] = (key, metadata)
+            self._dirty = True
+
+        return metadata
+
+
+METADATA_FILENAME = "scene_metadata.json"
+
+_cache = None
+
+def getMetadataCache():
+    """
+    The project's scene metadata cache (ROOT_DIR/_temp/scene_metadata.json)
+    """
+    from snpPipeline import ROOT_DIR
+    global _cache
+
+    cachepath = os.path.join(ROOT_DIR, "_temp", METADATA_FILENAME)
+
+    if _cache is None or _cache.cachepath != cachepath:
+        _cache = MetadataCache(cachepath)
+
+    return _cache
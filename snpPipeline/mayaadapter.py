@@ -0,0 +1,47 @@
+"""
+Thin adapter over maya.cmds and maya.mel
+
+Modules that also have to work outside of Maya (asset
+scanning, status, publishing, archiving, backups) get
+cmds and mel from here instead of importing maya. Outside
+of Maya they are stand-ins: cmds.warning prints,
+cmds.error raises RuntimeError (like in Maya), and
+anything else raises MayaUnavailable when called
+"""
+
+class MayaUnavailable(RuntimeError):
+    """
+    A Maya command was called outside of Maya
+    """
+
+
+class _Unavailable(object):
+    def __init__(self, module):
+        self._module = module
+
+    def warning(self, *args, **kwargs):
+        print "Warning: " + " ".join(str(x) for x in args)
+
+    def error(self, *args, **kwargs):
+        raise RuntimeError(" ".join(str(x) for x in args))
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def unavailable(*args, **kwargs):
+            raise MayaUnavailable(self._module + "." + name + " needs Maya")
+
+        return unavailable
+
+
+try:
+    import maya.cmds as cmds
+    import maya.mel as mel
+
+    HAS_MAYA = True
+except ImportError:
+    cmds = _Unavailable("maya.cmds")
+    mel = _Unavailable("maya.mel")
+
+    HAS_MAYA = False
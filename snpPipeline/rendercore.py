@@ -2,34 +2,36 @@
 Module for internal render manager related tasks
 """
 import os
+import time
 import platform
 
 from snpPipeline import ROOT_DIR
 from snpPipeline.backupman import BACKUP_DIR
 from snpPipeline.shellinterop import *
+import snpPipeline.renderqueue as renderqueue
+import snpPipeline.renderjournal as renderjournal
+import snpPipeline.rendermetrics as rendermetrics
+import snpPipeline.mafile as mafile
+import snpPipeline.footage as footage
 
 # --
 # Platform-specifics
 if platform.system() == "Windows":
-    nl = "\r\n"
-    header = "@echo off\nset MAYA_VP2_DEVICE_OVERRIDE=VirtualDeviceDx11\n set MAYA_OGS_GPU_MEMORY_LIMIT=128\nset MAYA_NO_PARALLEL_DRAW=1\nset MAYA_NO_TBB=1\nset MAYA_NO_PARALLEL_MEMCPY=1"
     render_cmd = "\"C:\\Program Files\\Autodesk\\Maya2017\\bin\\render.exe\""
-    ext = ".bat"
-    last = ""
+    render_env = {"MAYA_VP2_DEVICE_OVERRIDE": "VirtualDeviceDx11", "MAYA_OGS_GPU_MEMORY_LIMIT": "128",
+                  "MAYA_NO_PARALLEL_DRAW": "1", "MAYA_NO_TBB": "1", "MAYA_NO_PARALLEL_MEMCPY": "1"}
 elif platform.system() == "Linux":
-    nl = "\n"
-    header = "#!/bin/sh"
     render_cmd = "Render"
-    ext = ".sh"
-    last = "read -p \"Press Return to continue...\""
+    render_env = {}
 elif platform.system() == "Darwin":
-    nl = "\n"
-    header = "#!/bin/sh"
     render_cmd = "/Applications/Autodesk/maya2017/Maya.app/Contents/bin/Render"
-    ext = ".sh"
-    last = "read -p \"Press Return to continue...\""
+    render_env = {}
 # --
 
+# Most frames one render job does (a long shot gets split over
+# several jobs, so it doesn't end up rendering alone at the end)
+CHUNK_FRAMES = 24
+
 
 def getCompDirFor(scene_name):
     return os.path.join(ROOT_DIR, "3_Comp", scene_name)
@@ -45,28 +47,250 @@ def createCompDirFor(scene_name):
     return shot_dir
 
 
-def formatRenderCommand(outputDir, filetype, mayaFile):
-    return "{render} -rd {outputDir} -im \"<RenderLayer>/<RenderLayer>\" -of {filetype} {mayaFile}".format(
-                            render=render_cmd, outputDir=outputDir, filetype=filetype, mayaFile=mayaFile)
+def formatRenderCommand(outputDir, filetype, mayaFile, start=None, end=None, layer=None, project=None):
+    flags = ""
+    if start is not None and end is not None:
+        flags += "-s {0} -e {1} ".format(start, end)
+    if layer:
+        flags += "-rl {0} ".format(layer)
+    if project:
+        flags += "-proj \"{0}\" ".format(project)
 
+    return "{render} -rd {outputDir} -im \"<RenderLayer>/<RenderLayer>\" -of {filetype} {flags}{mayaFile}".format(
+                            render=render_cmd, outputDir=outputDir, filetype=filetype, flags=flags, mayaFile=mayaFile)
 
-def scenesToShellScript(scenes_versions, filetype):
-    script = header + nl
-    for scene, ver in scenes_versions.iteritems():
-        render_dir = os.path.join(createCompDirFor(scene.name), "Footage")
-        script += formatRenderCommand(render_dir, filetype, scene.fileFromVersion(ver)) + nl
 
-    script += nl + last
+def sceneFrameRange(mayaFile):
+    """
+    Frames rendering 'mayaFile' goes over (read from the
+    file, see mafile.frameRange)
+
+    @RETURNS
+        (start, end), None if the file doesn't say
+    """
+    try:
+        return mafile.frameRange(mafile.getMetadataCache().get(mayaFile))
+    except (IOError, OSError):
+        return None
+
+
+def _badRange(scene, frames):
+    """
+    Whether the frame range of a shot can't be rendered
+    (says so, the shot gets left out of the batch)
+    """
+    if frames is None or frames[1] >= frames[0]:
+        return False
+
+    print("Skipping " + scene.name + ": its render range (" + str(frames[0]) + "-" + str(frames[1]) +
+          ") ends before it starts, check the render settings")
+
+    return True
+
+
+def sceneRenderLayers(mayaFile):
+    """
+    The render layers of 'mayaFile' that get rendered
+    (read from the file, the scene's own layers only)
+    """
+    try:
+        metadata = mafile.getMetadataCache().get(mayaFile)
+    except (IOError, OSError):
+        return []
+
+    layers = [x for x in mafile.renderableLayers(metadata) if ':' not in x]
+
+    # (a scene without render layers renders the default one)
+    return layers or ["defaultRenderLayer"]
+
+
+def resumeJobs(scene, ver, filetype, chunkSize=CHUNK_FRAMES):
+    """
+    Render jobs for only the frames of each layer that
+    aren't in the shot's Footage/[layer]/ folders yet (or
+    are incomplete or older than the scene)
+
+    @RETURNS
+        list of renderqueue.RenderJob, None if the scene
+        doesn't say which frames it renders
+    """
+    render_dir = os.path.join(createCompDirFor(scene.name), "Footage")
+    maya_file = scene.fileFromVersion(ver)
+
+    frames = sceneFrameRange(maya_file)
+    if frames is None:
+        return None
+
+    if _badRange(scene, frames):
+        return []
+
+    jobs = []
+    for layer in sceneRenderLayers(maya_file):
+        layer_dir = os.path.join(render_dir, footage.layerFolder(layer))
+
+        for first, last in footage.framesToRender(layer_dir, frames[0], frames[1], filetype, maya_file):
+            for start, end in renderqueue.frameChunks(first, last, chunkSize or (last - first + 1)):
+                command = formatRenderCommand(render_dir, filetype, maya_file, start, end, layer=layer)
+                jobs.append(renderqueue.RenderJob(scene.name + "_" + layer + "_" + str(start) + "-" + str(end),
+                                                  command, outputDir=render_dir, shot=scene.name,
+                                                  layer=layer, start=start, end=end))
+
+    return jobs
+
+
+def renderJobs(scene, ver, filetype, chunkSize=CHUNK_FRAMES, resume=False):
+    """
+    Render jobs for a version of a shot, one per chunk of
+    at most 'chunkSize' frames (all of them render into
+    the shot's Footage/[layer]/ folders)
+
+    @PARAMS
+        resume: only render the frames that aren't done yet
+                (see resumeJobs)
+
+    @RETURNS
+        list of renderqueue.RenderJob
+    """
+    if resume:
+        jobs = resumeJobs(scene, ver, filetype, chunkSize)
+        if jobs is not None:
+            return jobs
+
+        print("No frame range in " + scene.name + ", rendering all of it")
+
+    render_dir = os.path.join(createCompDirFor(scene.name), "Footage")
+    maya_file = scene.fileFromVersion(ver)
+
+    frames = sceneFrameRange(maya_file)
+    if _badRange(scene, frames):
+        return []
+
+    if frames is None or not chunkSize:
+        command = formatRenderCommand(render_dir, filetype, maya_file)
+        return [renderqueue.RenderJob(scene.name, command, outputDir=render_dir, shot=scene.name)]
+
+    jobs = []
+    for start, end in renderqueue.frameChunks(frames[0], frames[1], chunkSize):
+        command = formatRenderCommand(render_dir, filetype, maya_file, start, end)
+        jobs.append(renderqueue.RenderJob(scene.name + "_" + str(start) + "-" + str(end), command,
+                                          outputDir=render_dir, shot=scene.name, start=start, end=end))
+
+    return jobs
 
-    return script
 
+def newLogDir():
+    """
+    Folder for the logs of a new render batch
+    (ROOT_DIR/_temp/render_logs/[date-time])
+    """
+    return os.path.join(ROOT_DIR, "_temp", "render_logs", time.strftime("%Y%m%d-%H%M%S"))
+
+
+def getJournal():
+    """
+    The project's render journal (ROOT_DIR/_temp/render_journal.jsonl)
+    """
+    return renderjournal.RenderJournal(os.path.join(ROOT_DIR, "_temp", renderjournal.JOURNAL_FILENAME))
+
+
+def getMetricsRecorder():
+    """
+    Per-frame render metrics of the project (ROOT_DIR/_temp/render_metrics)
+    """
+    return rendermetrics.MetricsRecorder(os.path.join(ROOT_DIR, "_temp", rendermetrics.METRICS_DIR))
+
+
+def newRenderQueue(workers=None):
+    """
+    Render queue for a new batch (logging to a new
+    newLogDir(), the journal and the render metrics,
+    printing its report when done)
+    """
+    queue = renderqueue.RenderQueue(newLogDir(), workers=workers, env=render_env, journal=getJournal(),
+                                    metrics=getMetricsRecorder())
+    queue.onFinished = renderqueue.RenderQueue.report
+
+    return queue
+
+
+def interruptedRenders():
+    """
+    Render jobs that were queued or running when Maya (or
+    the machine) went down, from the journal (dropping the
+    jobs that are through from it first)
+    """
+    journal = getJournal()
+
+    try:
+        journal.compact()
+    except (IOError, OSError) as e:
+        print("Could not compact the render journal: " + str(e))
+
+    return journal.interruptedJobs()
+
+
+def dismissRenders(jobs):
+    """
+    Don't offer the interrupted render 'jobs' again
+    """
+    getJournal().dismiss(jobs)
+
+
+def recoverRenders(jobs=None, workers=None):
+    """
+    Queue the interrupted render jobs again (the ones that
+    finished before aren't) and start them
+
+    @PARAMS
+        jobs: the jobs to run again (interruptedRenders() by default)
+
+    @RETURNS
+        the RenderQueue, None if there was nothing to recover
+    """
+    jobs = interruptedRenders() if jobs is None else jobs
+    if not jobs:
+        return None
+
+    queue = newRenderQueue(workers)
+
+    if any(x.collect for x in jobs):
+        from snpPipeline.seq_rendercore import collectLayer
+        queue.onJobDone = collectLayer
+
+    for job in jobs:
+        queue.add(job)
+
+    queue.start()
+
+    return queue
+
+
+def renderOut(scenes_versions, filetype, workers=None, wait=False, chunkSize=CHUNK_FRAMES, resume=False):
+    """
+    Render scenes in the background, several at once
+    (see renderqueue)
+
+    @PARAMS
+        scenes_versions: { shot asset : version to render }
+        workers: renders at once (renderqueue.RENDER_WORKERS by default)
+        wait: block until the batch is done
+        chunkSize: most frames per job (None for whole scenes)
+        resume: only render what's missing from the Footage
+                folders (after a batch got interrupted)
+
+    @RETURNS
+        the RenderQueue (its report gets printed when done)
+    """
+    queue = newRenderQueue(workers)
+
+    for scene, ver in scenes_versions.iteritems():
+        for job in renderJobs(scene, ver, filetype, chunkSize, resume):
+            queue.add(job)
 
-def renderOut(scenes_versions, filetype):
-    script = scenesToShellScript(scenes_versions, filetype)
-    script_file = os.path.join(ROOT_DIR, "_temp", "render_script" + ext)
+    mafile.getMetadataCache().save()
+    queue.start()
 
-    with open(script_file, mode="w") as file:
-        file.write(script)
+    if wait:
+        queue.wait()
 
-    run(script_file, force_posix=False)
-    #os.remove(script_file)
+    return queue
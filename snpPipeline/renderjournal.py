@@ -0,0 +1,209 @@
+"""
+Render job journal
+
+What happens to every render job (queued, started,
+finished) gets appended to a JSON lines file under _temp,
+so what a batch was doing survives Maya crashing or the
+machine rebooting. interruptedJobs() gives back the jobs
+that were queued or running and never got through, to
+queue them again (the finished ones don't render twice)
+
+Jobs the user chose not to render again get a "dismissed"
+entry, and compact() drops the jobs that are through so
+the file doesn't keep growing
+"""
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import threading
+
+from snpPipeline.renderqueue import RenderJob, DONE, FAILED, CANCELLED
+from snpPipeline.copyengine import replaceFile
+
+JOURNAL_FILENAME = "render_journal.jsonl"
+
+# What's kept of a job when it's queued (enough to run it again)
+JOB_FIELDS = ("id", "name", "command", "outputDir", "shot", "layer", "start", "end", "collect", "frames")
+
+HOST = socket.gethostname()
+
+
+def _processAlive(pid):
+    if pid == os.getpid():
+        return True
+
+    if sys.platform == "win32":
+        # (os.kill would end the process on Windows)
+        import ctypes
+
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+
+        code = ctypes.c_ulong()
+        try:
+            ok = kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        finally:
+            kernel32.CloseHandle(handle)
+
+        return bool(ok) and code.value == STILL_ACTIVE
+
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+
+    return True
+
+
+def _isThrough(entry):
+    """
+    Whether a job's last entry means it won't run again
+    """
+    if entry["event"] == "dismissed":
+        return True
+
+    return entry["event"] == "finished" and entry["status"] in (DONE, FAILED, CANCELLED)
+
+
+class RenderJournal(object):
+    """
+    Log of render jobs at 'path', appended to as
+    they go (see RenderQueue's 'journal')
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, event, job):
+        """
+        Append what just happened to a job ("queued",
+        "started", "finished" or "dismissed")
+        """
+        entry = {"event": event, "id": job.id, "time": time.time(), "host": HOST, "pid": os.getpid()}
+
+        if event == "queued":
+            entry.update((x, getattr(job, x)) for x in JOB_FIELDS)
+        elif event == "started":
+            entry.update(attempt=job.attempts, logpath=job.logpath)
+        elif event == "finished":
+            entry.update(status=job.status, returncode=job.returncode,
+                         startTime=job.startTime, endTime=job.endTime)
+
+        line = json.dumps(entry) + "\n"
+
+        with self._lock:
+            folder = os.path.dirname(self.path)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+            with open(self.path, mode="a") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def entries(self):
+        """
+        Yields the journal's entries, oldest first
+        """
+        try:
+            file = open(self.path, mode="r")
+        except IOError:
+            return
+
+        with file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # (the last line, if writing it got cut short)
+                    continue
+
+    def dismiss(self, jobs):
+        """
+        Don't offer 'jobs' (interrupted ones) again
+        """
+        for job in jobs:
+            self.record("dismissed", job)
+
+    def jobs(self):
+        """
+        Where every job in the journal got to
+
+        @RETURNS
+            { job id : (its "queued" entry, its last entry) }
+        """
+        jobs = {}
+
+        for entry in self.entries():
+            if entry["event"] == "queued":
+                jobs[entry["id"]] = (entry, entry)
+            elif entry["id"] in jobs:
+                jobs[entry["id"]] = (jobs[entry["id"]][0], entry)
+
+        return jobs
+
+    def interruptedJobs(self):
+        """
+        Jobs queued on this machine that never finished, by
+        processes that aren't running anymore
+
+        @RETURNS
+            list of RenderJob (in the order they were queued),
+            ready to be queued again
+        """
+        interrupted = []
+
+        for queued, last in sorted(self.jobs().values(), key=lambda x: x[0]["time"]):
+            if _isThrough(last):
+                continue
+
+            if last["host"] != HOST or _processAlive(last["pid"]):
+                continue
+
+            job = RenderJob(queued["name"], queued["command"], outputDir=queued["outputDir"],
+                            shot=queued["shot"], layer=queued["layer"],
+                            start=queued["start"], end=queued["end"], collect=queued["collect"],
+                            frames=queued.get("frames"))
+            job.id = queued["id"]
+
+            interrupted.append(job)
+
+        return interrupted
+
+    def compact(self):
+        """
+        Rewrite the journal with only the entries of jobs
+        that aren't through yet (queued, running or
+        interrupted)
+
+        @RETURNS
+            the number of entries dropped
+        """
+        with self._lock:
+            keep = set(x[0]["id"] for x in self.jobs().values() if not _isThrough(x[1]))
+
+            entries = list(self.entries())
+            kept = [x for x in entries if x["id"] in keep]
+
+            if len(kept) == len(entries):
+                return 0
+
+            temp = self.path + ".tmp"
+            with open(temp, mode="w") as file:
+                for entry in kept:
+                    file.write(json.dumps(entry) + "\n")
+
+                file.flush()
+                os.fsync(file.fileno())
+
+            replaceFile(temp, self.path)
+
+        return len(entries) - len(kept)
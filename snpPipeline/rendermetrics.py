@@ -0,0 +1,284 @@
+"""
+Per-frame render telemetry
+
+Reads the output of renders as it comes (Maya's Render and
+Blender running snp_renderScene) for frames being written,
+and appends each frame's wall time, the render's peak
+memory so far and the frame's file size to a metrics file
+per shot and layer:
+
+    _temp/render_metrics/[shot]/[layer].jsonl
+
+Those (this batch's, or earlier ones') give the ETA of a
+render queue (see estimateRemaining)
+"""
+import os
+import re
+import json
+import time
+import socket
+import threading
+
+import snpPipeline.footage as footage
+
+# psutil is optional (only needed for memory outside of Linux)
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+METRICS_DIR = "render_metrics"
+
+_IMAGE = r"(?P<path>.+?\.(?:png|jpe?g|exr|tiff?|iff|tga|bmp))"
+
+# Lines that mean a frame was just written
+FRAME_DONE_RES = [
+    # Maya Software
+    re.compile(r"Finished Rendering " + _IMAGE, re.IGNORECASE),
+    # Maya Hardware 2.0 (and the other renderers' "Result:")
+    re.compile(r"^(?://\s*)?Result: " + _IMAGE, re.IGNORECASE),
+    # Blender ("Saved: /path Time: ..." or "Saved: '/path'")
+    re.compile(r"^Saved: '?" + _IMAGE, re.IGNORECASE),
+]
+
+HOST = socket.gethostname()
+
+
+def parseFrameDone(line):
+    """
+    Path of the frame a line of render output says was
+    written (None if it's about something else)
+    """
+    line = line.strip()
+
+    for regex in FRAME_DONE_RES:
+        match = regex.search(line)
+        if match:
+            return match.group("path").strip("'\"")
+
+    return None
+
+
+def _linuxTree(pid):
+    pids = [pid]
+
+    for pid in pids:
+        try:
+            for task in os.listdir("/proc/" + str(pid) + "/task"):
+                with open("/proc/" + str(pid) + "/task/" + task + "/children") as file:
+                    pids.extend(int(x) for x in file.read().split())
+        except (IOError, OSError):
+            continue
+
+    return pids
+
+
+def peakRss(pid):
+    """
+    Most memory (in bytes) the process 'pid' or any of its
+    children used so far, None if it can't be told
+    (the render runs under a shell, so it's a child)
+    """
+    if os.path.exists("/proc/" + str(pid) + "/status"):
+        peak = None
+
+        for child in _linuxTree(pid):
+            try:
+                with open("/proc/" + str(child) + "/status") as file:
+                    for line in file:
+                        if line.startswith("VmHWM:"):
+                            peak = max(peak, int(line.split()[1]) * 1024)
+            except (IOError, OSError, ValueError):
+                continue
+
+        return peak
+
+    if psutil is None:
+        return None
+
+    try:
+        process = psutil.Process(pid)
+        peak = None
+
+        for child in [process] + process.children(recursive=True):
+            memory = child.memory_info()
+            # (Windows keeps the peak, elsewhere it's what it uses now)
+            peak = max(peak, getattr(memory, "peak_wset", memory.rss))
+
+        return peak
+    except psutil.Error:
+        return None
+
+
+def shotAndLayer(path, job=None):
+    """
+    Shot and layer a frame belongs to (the job's if it
+    knows, else from the path: 3_Comp/[shot]/Footage/[layer]/)
+    """
+    parts = os.path.normpath(path).split(os.sep)
+
+    shot = job.shot if job is not None and job.shot else None
+    layer = job.layer if job is not None and job.layer else None
+
+    if shot is None and "3_Comp" in parts:
+        index = parts.index("3_Comp")
+        if index + 1 < len(parts):
+            shot = parts[index + 1]
+
+    if layer is None and len(parts) > 1:
+        layer = parts[-2]
+
+    return shot or "unknown", footage.layerFolder(layer) if layer else "unknown"
+
+
+class MetricsRecorder(object):
+    """
+    Turns render output into per-frame metrics, written
+    under 'folder' (see RenderQueue's 'metrics')
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+
+        # job id : (pid, time the last frame was done)
+        self._last = {}
+
+    def metricsPath(self, shot, layer):
+        return os.path.join(self.folder, shot, layer + ".jsonl")
+
+    def feed(self, job, process, line):
+        """
+        Look at a line a job's render printed
+
+        @RETURNS
+            the metrics written if a frame got done, None otherwise
+        """
+        path = parseFrameDone(line)
+        if path is None:
+            return None
+
+        now = time.time()
+
+        with self._lock:
+            pid, last = self._last.get(job.id, (None, None))
+
+            # (a new attempt starts over)
+            if pid != process.pid:
+                last = job.attemptStart or now
+
+            self._last[job.id] = (process.pid, now)
+
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+
+        shot, layer = shotAndLayer(path, job)
+
+        record = {"time": now, "host": HOST, "job": job.name, "frame": footage.frameNumber(path),
+                  "seconds": round(now - last, 3), "peakRss": peakRss(process.pid), "size": size,
+                  "path": path}
+
+        job.framesDone += 1
+        job.frameSeconds.append(record["seconds"])
+
+        metrics_path = self.metricsPath(shot, layer)
+
+        with self._lock:
+            folder = os.path.dirname(metrics_path)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+            with open(metrics_path, mode="a") as file:
+                file.write(json.dumps(record) + "\n")
+
+        return record
+
+    def readMetrics(self, shot, layer):
+        """
+        Every frame recorded for a shot's layer, oldest first
+        """
+        records = []
+
+        try:
+            file = open(self.metricsPath(shot, layer), mode="r")
+        except IOError:
+            return records
+
+        with file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+
+        return records
+
+    def averageFrameTime(self, shot, layer):
+        """
+        Mean seconds per frame of a shot's layer over the
+        renders recorded (None if none were)
+        """
+        seconds = [x["seconds"] for x in self.readMetrics(shot, layer) if x.get("seconds")]
+        return sum(seconds) / len(seconds) if seconds else None
+
+
+def estimateRemaining(queue):
+    """
+    Seconds left until a render queue is through, from the
+    frame times measured so far in this batch (per job,
+    else for the same shot and layer before, else the
+    batch's average)
+
+    @RETURNS
+        (seconds, frames left), seconds is None when there's
+        nothing to go by yet; jobs that don't know their
+        frame count aren't counted
+    """
+    from snpPipeline.renderqueue import WAITING, RUNNING
+
+    recorder = queue.metrics
+    measured = [s for job in queue.jobs for s in job.frameSeconds]
+    batch_average = sum(measured) / len(measured) if measured else None
+
+    history = {}
+    total = 0.0
+    frames_left = 0
+    known = True
+    jobs_left = 0
+
+    for job in queue.jobs:
+        if job.status not in (WAITING, RUNNING):
+            continue
+
+        jobs_left += 1
+
+        count = job.frameCount()
+        if count is None:
+            continue
+
+        left = max(0, count - job.framesDone)
+        frames_left += left
+
+        if job.frameSeconds:
+            average = sum(job.frameSeconds) / len(job.frameSeconds)
+        else:
+            key = (job.shot, footage.layerFolder(job.layer) if job.layer else None)
+            if key not in history:
+                history[key] = recorder.averageFrameTime(*key) if recorder and all(key) else None
+
+            average = history[key] or batch_average
+
+        if average is None:
+            known = False
+            continue
+
+        total += left * average
+
+    if not known or (frames_left and not total):
+        return None, frames_left
+
+    # (the jobs left share the worker slots)
+    slots = max(1, min(queue.workers, jobs_left))
+
+    return total / slots, frames_left
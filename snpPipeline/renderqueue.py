@@ -0,0 +1,408 @@
+"""
+Local render queue
+
+Runs render command lines (see rendercore.formatRenderCommand)
+as subprocesses over a number of worker slots, instead of one
+after the other in a single shell script. Each job's output
+(stdout and stderr) goes to its own log file and failed jobs
+are retried
+"""
+import os
+import time
+import uuid
+import shlex
+import signal
+import platform
+import threading
+import subprocess
+import multiprocessing
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# Renders running at once (a render uses more than one
+# thread itself, so not one per core)
+RENDER_WORKERS = max(1, multiprocessing.cpu_count() // 4)
+
+# Times a failed job is run again
+RETRIES = 1
+
+# Job statuses
+WAITING = "waiting"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+WINDOWS = platform.system() == "Windows"
+
+
+class RenderJob(object):
+    """
+    One render command line
+
+    @PARAMS
+        name: names the job's log file (unique in a queue)
+        command: command line to run
+        outputDir: where it renders to
+        shot, layer: what it renders (None for all of the layers)
+        start, end: frames it renders (None for the scene's range)
+        collect: move the frames to the shot's Footage folder
+                 when done (see seq_rendercore.collectLayer)
+        frames: how many frames it renders, when there's no
+                start and end but it's known (for the ETA)
+    """
+    def __init__(self, name, command, outputDir=None, shot=None, layer=None, start=None, end=None,
+                 collect=False, frames=None):
+        # (tells the job apart from others with the same name in the journal)
+        self.id = uuid.uuid4().hex
+
+        self.name = name
+        self.command = command
+        self.outputDir = outputDir
+        self.collect = collect
+
+        self.shot = shot
+        self.layer = layer
+        self.start = start
+        self.end = end
+        self.frames = frames
+
+        self.status = WAITING
+        self.returncode = None
+        self.attempts = 0
+        self.logpath = None
+        self.startTime = None
+        self.endTime = None
+        self.attemptStart = None
+
+        # Frames done in the current attempt (see rendermetrics)
+        self.framesDone = 0
+        self.frameSeconds = []
+
+    def __repr__(self):
+        return "RenderJob(" + self.name + ", " + self.status + ")"
+
+    def frameCount(self):
+        if self.start is None or self.end is None:
+            return self.frames
+
+        return self.end - self.start + 1
+
+    def duration(self):
+        if self.startTime is None:
+            return 0.0
+
+        return (self.endTime or time.time()) - self.startTime
+
+
+def frameChunks(start, end, size):
+    """
+    Split the frames from 'start' to 'end' (included) into
+    ranges of at most 'size' frames, the same length give
+    or take one
+
+    @RETURNS
+        list of (start, end)
+
+    Raises ValueError if 'end' comes before 'start'
+    """
+    count = end - start + 1
+    if count <= 0:
+        raise ValueError("Frame range " + str(start) + "-" + str(end) + " ends before it starts")
+
+    chunks = -(-count // max(1, size))
+    base, extra = divmod(count, chunks)
+
+    ranges = []
+    for i in range(chunks):
+        length = base + (1 if i < extra else 0)
+        ranges.append((start, start + length - 1))
+        start += length
+
+    return ranges
+
+
+def _logName(name):
+    return "".join(x if x.isalnum() or x in "-_." else "_" for x in name) + ".log"
+
+
+def commandArgs(command):
+    """
+    What to run for the command line 'command', without a
+    shell in between (Windows splits the line itself)
+    """
+    if WINDOWS:
+        return command
+
+    if isinstance(command, unicode):
+        command = command.encode("utf-8")
+
+    return shlex.split(command)
+
+
+def killTree(process):
+    """
+    Stop 'process' and every process it started (a render
+    runs in its own process group, see RenderQueue._execute)
+    """
+    if WINDOWS:
+        with open(os.devnull, mode="wb") as devnull:
+            subprocess.call(["taskkill", "/F", "/T", "/PID", str(process.pid)], stdout=devnull, stderr=devnull)
+    else:
+        os.killpg(process.pid, signal.SIGTERM)
+
+
+class RenderQueue(object):
+    """
+    Jobs run over 'workers' slots, logs written to 'logdir'
+
+    start() returns straight away (so Maya isn't blocked),
+    wait() blocks until every job is through; onJobDone
+    (if set) gets called with each job as it's through and
+    onFinished with the queue once they all are (both from
+    the worker threads)
+
+    With a 'journal' (renderjournal.RenderJournal) each job's
+    progress is written down as it goes, with 'metrics'
+    (rendermetrics.MetricsRecorder) the frames it renders;
+    onFrame (if set) gets called with the job and the
+    frame's metrics as each one is done
+    """
+    def __init__(self, logdir, workers=None, retries=RETRIES, env=None, journal=None, metrics=None):
+        self.logdir = logdir
+        self.journal = journal
+        self.metrics = metrics
+        self.workers = workers or RENDER_WORKERS
+        self.retries = retries
+        self.onJobDone = None
+        self.onFinished = None
+        self.onFrame = None
+
+        # (environment variables added to the renders' environment)
+        self.env = env
+
+        self.jobs = []
+
+        self._pending = queue.Queue()
+        self._threads = []
+        self._processes = {}
+        self._active = 0
+        self._lock = threading.Lock()
+        self._cancelled = False
+
+    def add(self, job):
+        self.jobs.append(job)
+        self._record("queued", job)
+        self._pending.put(job)
+
+        return job
+
+    def start(self):
+        """
+        Start running the waiting jobs
+        """
+        if not os.path.exists(self.logdir):
+            os.makedirs(self.logdir)
+
+        with self._lock:
+            self._threads = [x for x in self._threads if x.is_alive()]
+            slots = min(self.workers - len(self._threads), self._pending.qsize())
+
+            for i in range(slots):
+                self._active += 1
+
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+
+                self._threads.append(thread)
+
+    def wait(self):
+        """
+        Block until every job is done (or failed)
+
+        @RETURNS
+            True if all of them rendered
+        """
+        for thread in list(self._threads):
+            while thread.is_alive():
+                # (joining with a timeout keeps Ctrl+C working)
+                thread.join(0.5)
+
+        return not self.failed()
+
+    def cancel(self):
+        """
+        Drop the waiting jobs and stop the running ones
+        """
+        self._cancelled = True
+
+        with self._lock:
+            for process in self._processes.values():
+                try:
+                    killTree(process)
+                except OSError:
+                    pass
+
+    def running(self):
+        return [x for x in self.jobs if x.status == RUNNING]
+
+    def failed(self):
+        return [x for x in self.jobs if x.status in (FAILED, CANCELLED)]
+
+    def eta(self):
+        """
+        Seconds until every job is through (None if it
+        can't be told yet, see rendermetrics.estimateRemaining)
+        """
+        from snpPipeline.rendermetrics import estimateRemaining
+
+        return estimateRemaining(self)[0]
+
+    def isFinished(self):
+        return all(x.status in (DONE, FAILED, CANCELLED) for x in self.jobs)
+
+    def report(self):
+        """
+        Print the exit status of each job
+        """
+        for job in self.jobs:
+            print "%-8s %-30s exit %-5s tries %d  %7.1fs  %s" % (
+                job.status.upper(), job.name, job.returncode, job.attempts,
+                job.duration(), job.logpath)
+
+        failed = self.failed()
+        print str(len(self.jobs) - len(failed)) + " of " + str(len(self.jobs)) + " jobs rendered"
+
+    def _worker(self):
+        while True:
+            try:
+                job = self._pending.get_nowait()
+            except queue.Empty:
+                break
+
+            if self._cancelled:
+                job.status = CANCELLED
+                self._record("finished", job)
+                continue
+
+            try:
+                self._runJob(job)
+            except Exception, e:
+                # (so the job doesn't stay running and the queue still finishes)
+                print "Error rendering " + job.name + ": " + str(e)
+
+                job.status = FAILED
+                job.endTime = time.time()
+                self._record("finished", job)
+
+            if self.onJobDone:
+                try:
+                    self.onJobDone(job)
+                except Exception, e:
+                    print "Error after " + job.name + ": " + str(e)
+
+        with self._lock:
+            self._active -= 1
+            last = self._active == 0
+
+        if last and self.onFinished and self.isFinished():
+            self.onFinished(self)
+
+    def _frameOutput(self, job, process, line):
+        try:
+            record = self.metrics.feed(job, process, line)
+        except (IOError, OSError), e:
+            print "Could not write render metrics: " + str(e)
+            return
+
+        if record is not None and self.onFrame:
+            try:
+                self.onFrame(job, record)
+            except Exception, e:
+                print "Error after a frame of " + job.name + ": " + str(e)
+
+    def _record(self, event, job):
+        if self.journal is None:
+            return
+
+        try:
+            self.journal.record(event, job)
+        except (IOError, OSError), e:
+            print "Could not write to the render journal: " + str(e)
+
+    def _runJob(self, job):
+        job.status = RUNNING
+        job.startTime = time.time()
+        job.logpath = os.path.join(self.logdir, _logName(job.name))
+
+        while True:
+            job.attempts += 1
+            self._record("started", job)
+
+            job.returncode = self._execute(job)
+
+            if job.returncode == 0 or self._cancelled or job.attempts > self.retries:
+                break
+
+        job.endTime = time.time()
+
+        if job.returncode == 0:
+            job.status = DONE
+        elif self._cancelled:
+            job.status = CANCELLED
+        else:
+            job.status = FAILED
+
+        self._record("finished", job)
+
+    def _execute(self, job):
+        env = None
+        if self.env:
+            env = dict(os.environ)
+            env.update(self.env)
+
+        with open(job.logpath, mode="ab") as log:
+            log.write("# attempt " + str(job.attempts) + ": " + job.command + "\n")
+            log.flush()
+
+            job.attemptStart = time.time()
+            job.framesDone = 0
+            job.frameSeconds = []
+
+            # (in a process group of its own, so cancel() can stop it with
+            # whatever it starts)
+            if WINDOWS:
+                options = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+            else:
+                options = {"preexec_fn": os.setsid}
+
+            try:
+                process = subprocess.Popen(commandArgs(job.command), env=env, stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT, **options)
+            except (OSError, ValueError), e:
+                log.write("# could not start: " + str(e) + "\n")
+                return -1
+
+            with self._lock:
+                self._processes[job.name] = process
+
+            try:
+                for line in iter(process.stdout.readline, b""):
+                    log.write(line)
+                    log.flush()
+
+                    if self.metrics is not None:
+                        self._frameOutput(job, process, line)
+
+                returncode = process.wait()
+            finally:
+                with self._lock:
+                    del self._processes[job.name]
+
+            log.write("# exit " + str(returncode) + "\n")
+
+        return returncode
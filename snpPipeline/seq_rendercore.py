@@ -3,16 +3,24 @@ Module for rendering with Render Sequence
 """
 import os
 import shutil
-import maya.cmds as cmds
-import maya.mel as mel
+from snpPipeline.mayaadapter import cmds, mel
 
 from snpPipeline import ROOT_DIR
-from snpPipeline.rendercore import getCompDirFor, createCompDirFor
+from snpPipeline.rendercore import getCompDirFor, createCompDirFor, formatRenderCommand, newRenderQueue
+from snpPipeline.copyengine import replaceFile
+import snpPipeline.renderqueue as renderqueue
+import snpPipeline.footage as footage
 
 PROJ = os.path.join(ROOT_DIR, '_mayaproj')
 IMAGES = os.path.join(PROJ, 'images')
 IMAGES_TMP = os.path.join(IMAGES, 'tmp')
 
+# Background renders write here first, a folder per shot and layer
+BATCH_TMP = os.path.join(IMAGES, 'batch')
+
+# Scenes saved for the background renders to open
+RENDER_SCENES = os.path.join(ROOT_DIR, '_temp', 'render_scenes')
+
 def _setCorrectProject():
     """
     Set project to current snpPipeline project
@@ -65,10 +73,48 @@ def _getRenderedFramesFolder(layer_name):
         raise Exception("Could not locate the rendered frames for layer: " + layer_name)
 
 
-def renderSeq(shot_name, filetype):
+def _getFrameRange():
+    return (int(cmds.getAttr("defaultRenderGlobals.startFrame")),
+            int(cmds.getAttr("defaultRenderGlobals.endFrame")))
+
+
+def _setFrameRange(start, end):
+    cmds.setAttr("defaultRenderGlobals.startFrame", start)
+    cmds.setAttr("defaultRenderGlobals.endFrame", end)
+
+
+def _framesToRender(shot_name, layer, filetype):
+    """
+    Frame ranges of a layer not rendered (properly) into
+    its Footage folder since the open scene was saved
+    """
+    layer_dir = os.path.join(getCompDirFor(shot_name), 'Footage', layer)
+    start, end = _getFrameRange()
+
+    return footage.framesToRender(layer_dir, start, end, filetype,
+                                  cmds.file(q=True, sceneName=True))
+
+
+def _mergeFrames(src_dir, dest_dir):
+    """
+    Move the frames in 'src_dir' into 'dest_dir', replacing
+    the ones already there
+    """
+    if not os.path.exists(dest_dir):
+        os.makedirs(dest_dir)
+
+    for filename in os.listdir(src_dir):
+        replaceFile(os.path.join(src_dir, filename), os.path.join(dest_dir, filename))
+
+
+def renderSeq(shot_name, filetype, resume=False):
     """
     Renders with Render Sequence then copies
     to appropriate folder
+
+    With 'resume', only renders the frames of each layer
+    that are missing from the folder (or incomplete, or
+    older than the scene)
     """
     # sanity checks
     _setCorrectProject()
@@ -76,8 +122,17 @@ def renderSeq(shot_name, filetype):
 
     # get render layers
     layers = _getRenderLayers()
+    frame_range = _getFrameRange()
 
     for layer in layers:
+        dest_dir = os.path.join(createCompDirFor(shot_name), 'Footage', layer)
+
+        if resume:
+            ranges = _framesToRender(shot_name, layer, filetype)
+            if not ranges:
+                print(layer + " is already rendered, skipping")
+                continue
+
         # switch render layer and set the folder structure
         _switchLayer(layer)
 
@@ -85,15 +140,125 @@ def renderSeq(shot_name, filetype):
                      layer + '/' + layer,
                      type="string")
 
-        # render
-        _renderSeq()
+        if not resume:
+            # render
+            _renderSeq()
+
+            # move folder
+            layer_dir = _getRenderedFramesFolder(layer)
+
+            if os.path.exists(dest_dir):
+                shutil.rmtree(dest_dir)
+
+            shutil.copytree(layer_dir, dest_dir)
+            continue
+
+        for start, end in ranges:
+            _setFrameRange(start, end)
+            _renderSeq()
+
+            _mergeFrames(_getRenderedFramesFolder(layer), dest_dir)
+            _emptyImages()
+
+        _setFrameRange(*frame_range)
+
+
+def _saveRenderScene(shot_name):
+    """
+    Export a copy of the open scene, set up as it is for
+    rendering, for background renders to open (the open
+    scene keeps its name and its unsaved changes)
+    """
+    if not os.path.exists(RENDER_SCENES):
+        os.makedirs(RENDER_SCENES)
+
+    path = os.path.join(RENDER_SCENES, shot_name + '.ma')
+
+    cmds.file(path, exportAll=True, preserveReferences=True, type="mayaAscii", force=True)
 
-        # move folder
-        layer_dir = _getRenderedFramesFolder(layer)
-        footage_dir = createCompDirFor(shot_name)
-        dest_dir = os.path.join(footage_dir, 'footage', layer)
-        
+    return path
+
+
+def collectLayer(job):
+    """
+    Move a finished layer's frames from its own output
+    folder to the shot's Footage/[layer] folder (replacing
+    the folder, or only the frames for a range of frames)
+    """
+    if not job.collect or job.layer is None or job.status != renderqueue.DONE:
+        return
+
+    layer_dir = os.path.join(job.outputDir, job.layer)
+    if not os.path.exists(layer_dir):
+        print("Nothing rendered for " + job.name + " in " + job.outputDir)
+        return
+
+    dest_dir = os.path.join(createCompDirFor(job.shot), 'Footage', job.layer)
+
+    if job.start is not None:
+        _mergeFrames(layer_dir, dest_dir)
+    else:
         if os.path.exists(dest_dir):
             shutil.rmtree(dest_dir)
 
-        shutil.copytree(layer_dir, dest_dir)
+        shutil.move(layer_dir, dest_dir)
+
+    shutil.rmtree(job.outputDir, ignore_errors=True)
+
+    print("Collected " + job.name + " into " + dest_dir)
+
+
+def renderSeqBackground(shot_name, filetype, queue=None, resume=False):
+    """
+    Renders each render layer of the open scene in its
+    own background Render process (several at once, see
+    renderqueue), moving each layer to the shot's Footage
+    folder as it finishes. Maya stays usable meanwhile
+
+    @PARAMS
+        queue: RenderQueue to add the jobs to (the caller
+               starts it), a new one gets started if None
+        resume: only render the frames missing from the
+                Footage folders (see renderSeq)
+
+    @RETURNS
+        the RenderQueue
+    """
+    _setCorrectProject()
+
+    layers = _getRenderLayers()
+    frame_range = _getFrameRange()
+
+    ranges = dict((x, _framesToRender(shot_name, x, filetype)) for x in layers) if resume else {}
+
+    scene = _saveRenderScene(shot_name)
+
+    owns_queue = queue is None
+    if owns_queue:
+        queue = newRenderQueue()
+
+    queue.onJobDone = collectLayer
+
+    for layer in layers:
+        for start, end in ranges.get(layer, [(None, None)]):
+            name = shot_name + "_" + layer
+            if start is not None:
+                name += "_" + str(start) + "-" + str(end)
+
+            output_dir = os.path.join(BATCH_TMP, shot_name, name)
+
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+
+            command = formatRenderCommand(output_dir, filetype, scene, start, end, layer=layer, project=PROJ)
+            # (a range knows its own frame count)
+            frames = frame_range[1] - frame_range[0] + 1 if start is None else None
+
+            queue.add(renderqueue.RenderJob(name, command, outputDir=output_dir, shot=shot_name,
+                                            layer=layer, start=start, end=end, collect=True,
+                                            frames=frames))
+
+    if owns_queue:
+        queue.start()
+
+    return queue
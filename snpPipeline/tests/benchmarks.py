@@ -0,0 +1,172 @@
+"""
+Benchmarks for the filesystem side of the pipeline
+
+Run from mayapy (or the script editor) with the
+pipeline on the path:
+    mayapy benchmarks.py
+"""
+import os
+import time
+import shutil
+import tempfile
+
+import snpPipeline.dataTypes as dty
+
+SHOT_STAGES = ("1-LO", "2-anim", "3-lighting")
+
+
+def _timeit(func, repeat=3):
+    """
+    Best wall time of 'func' in seconds
+    """
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        func()
+        took = time.time() - start
+
+        if best is None or took < best:
+            best = took
+
+    return best
+
+
+def _report(label, seconds):
+    print(label.ljust(40) + ("%.2f ms" % (seconds * 1000.0)).rjust(12))
+
+
+def makeShotTree(root, numShots=500, versionsPerStage=10):
+    """
+    Generate a fake '1_3DCG/Scenes' folder with
+    'numShots' shots in it and return the shot paths
+    """
+    paths = []
+    for i in xrange(numShots):
+        name = "C" + str(i)
+        path = os.path.join(root, name)
+        os.mkdir(path)
+
+        for folder in ("LO", "Blasts", "Reference"):
+            os.mkdir(os.path.join(path, folder))
+
+        for atype in SHOT_STAGES:
+            files = [name + "_" + atype + ".ma", name + "_" + atype + ".pointer"]
+            for ver in xrange(1, versionsPerStage + 1):
+                files.append("_".join([name, atype, dty._addPadding(str(ver)), "DESC"]) + ".ma")
+
+            for filename in files:
+                open(os.path.join(path, filename), mode="w").close()
+
+        paths.append(path)
+
+    return paths
+
+
+def benchShotScan(numShots=500):
+    """
+    Listing each shot directory once for all of the
+    shot stages vs. once per shot stage
+    """
+    root = tempfile.mkdtemp(prefix="snpBench")
+
+    try:
+        paths = makeShotTree(root, numShots)
+
+        def perStage():
+            for path in paths:
+                for atype in SHOT_STAGES:
+                    dty.Asset(path, atype)
+
+        def singlePass():
+            for path in paths:
+                dty.Shot(path)
+
+        print("-- Shot scan (" + str(numShots) + " shots)")
+        _report("listing per shot stage", _timeit(perStage))
+        _report("single pass per shot", _timeit(singlePass))
+    finally:
+        shutil.rmtree(root)
+
+
+def benchVersionTable(numVersions=500, lookups=10000):
+    """
+    VersionTable vs. the old OrderedDict of version strings
+    (for assets with hundreds of iterations)
+    """
+    from collections import OrderedDict
+
+    items = [("MASTER", "")]
+    items += [(dty._addPadding(str(i)), "DESC") for i in xrange(1, numVersions + 1)]
+    probes = [dty._addPadding(str(i % (numVersions * 2))) for i in xrange(lookups)]
+
+    odict = OrderedDict(items)
+    table = dty.VersionTable(items)
+
+    def oldLatest():
+        for _ in xrange(100):
+            vernums = sorted(int(v) for v in odict.keys() if v != "MASTER")
+            dty._addPadding(str(vernums[-1]))
+
+    def newLatest():
+        for _ in xrange(100):
+            table.latest
+
+    def oldContains():
+        for probe in probes:
+            probe in odict.keys()
+
+    def newContains():
+        for probe in probes:
+            probe in table
+
+    print("-- Version table (" + str(numVersions) + " versions)")
+    _report("build OrderedDict", _timeit(lambda: OrderedDict(items)))
+    _report("build VersionTable", _timeit(lambda: dty.VersionTable(items)))
+    _report("latest x100 (re-sorted ints)", _timeit(oldLatest))
+    _report("latest x100 (VersionTable)", _timeit(newLatest))
+    _report("membership x" + str(lookups) + " (keys())", _timeit(oldContains))
+    _report("membership x" + str(lookups) + " (bisect)", _timeit(newContains))
+
+
+def benchFilenameParse(count=100000):
+    """
+    Compiled filename grammar vs. the old split('_') parsing
+    """
+    # (all different, 30 versions per shot stage)
+    filenames = []
+    for i in xrange(count):
+        name = "C" + str(i // 90)
+        atype = SHOT_STAGES[(i // 30) % 3]
+        ver = dty._addPadding(str(i % 30 + 1))
+
+        if i % 30 == 0:
+            filenames.append(name + "_" + atype + ".ma")
+        elif i % 2:
+            filenames.append("_".join([name, atype, ver, "DESC"]) + ".ma")
+        else:
+            filenames.append("_".join([name, atype, ver]) + ".ma")
+
+    def oldParse():
+        for filename in filenames:
+            attrs = os.path.splitext(filename)[0].split('_')
+            if len(attrs) == 2:
+                (attrs[0], attrs[1], "MASTER", "")
+            elif len(attrs) == 3:
+                (attrs[0], attrs[1], attrs[2], "")
+            elif len(attrs) == 4:
+                (attrs[0], attrs[1], attrs[2], attrs[3])
+
+    def newParse():
+        parse = dty.parseSceneFilename
+        for filename in filenames:
+            parse(filename)
+
+    print("-- Filename parsing (" + str(count) + " filenames)")
+    _report("split('_')", _timeit(oldParse))
+    _report("parseSceneFilename", _timeit(newParse))
+
+
+if __name__ == "__main__":
+    benchShotScan()
+    benchVersionTable()
+    benchFilenameParse()
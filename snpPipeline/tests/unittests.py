@@ -0,0 +1,1160 @@
+"""
+Unit tests for the filesystem side of the pipeline
+(no Maya needed)
+
+Run with the pipeline on the path:
+    python unittests.py
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import snpPipeline
+import snpPipeline.dataTypes as dty
+
+
+def _write(path, contents=""):
+    with open(path, mode="w") as file:
+        file.write(contents)
+
+
+def _touch(path, mtime):
+    os.utime(path, (mtime, mtime))
+
+
+class ProjectTestCase(unittest.TestCase):
+    """
+    Runs each test in an empty project (ROOT_DIR) of its own
+    """
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="snp_tests_")
+        self._oldRoot = snpPipeline.ROOT_DIR
+        snpPipeline.ROOT_DIR = self.root
+
+        for folder in set(dty.ASSET_TYPES.values()):
+            os.makedirs(os.path.join(self.root, "1_3DCG", folder))
+
+    def tearDown(self):
+        snpPipeline.ROOT_DIR = self._oldRoot
+        shutil.rmtree(self.root)
+
+    def makeAsset(self, name, atype, versions, pointed=None, master=True):
+        """
+        Make an asset directory with a scene per version
+        (an hour apart, oldest first) and a MASTER newer
+        than all of them
+
+        @RETURNS
+            the asset's path
+        """
+        path = dty.pathOfAssetType(atype, named=name)
+        os.mkdir(path)
+
+        now = time.time() - 3600 * (len(versions) + 1)
+        for ver in versions:
+            scene = os.path.join(path, dty.sceneFilename(name, atype, ver))
+            _write(scene, ver)
+            _touch(scene, now)
+            now += 3600
+
+        if master:
+            scene = os.path.join(path, dty.sceneFilename(name, atype, "MASTER"))
+            _write(scene, pointed)
+            _touch(scene, now)
+
+        if pointed:
+            _write(os.path.join(path, name + "_" + atype + ".pointer"), pointed)
+
+        return path
+
+
+class ParseSceneFilenameTest(unittest.TestCase):
+    def test_versions(self):
+        self.assertEqual(dty.parseSceneFilename("Foo_rig_003_blocking.ma"),
+                         ("Foo", "rig", "003", "blocking", ".ma"))
+        self.assertEqual(dty.parseSceneFilename("Foo_rig_003.ma"), ("Foo", "rig", "003", "", ".ma"))
+
+    def test_masterAndPointer(self):
+        self.assertTrue(dty.parseSceneFilename("Foo_rig.ma").isMaster)
+        self.assertEqual(dty.parseSceneFilename("Foo_rig.pointer").ext, ".pointer")
+
+    def test_invalid(self):
+        self.assertEqual(dty.parseSceneFilename("Foo.ma"), None)
+        self.assertEqual(dty.parseSceneFilename("Foo_rig_003_a_b.ma"), None)
+
+    def test_sidecars(self):
+        # (deepcheck's checksums next to the scenes)
+        self.assertEqual(dty.parseSceneFilename("Foo_rig.ma.md5"), None)
+        self.assertEqual(dty.parseSceneFilename("Foo_rig_003.ma.md5"), None)
+
+    def test_roundTrip(self):
+        for filename in ("Foo_rig.ma", "C20_3-lighting_012_final.ma", "Bar_env_001.ma"):
+            self.assertEqual(dty.parseSceneFilename(filename).filename(), filename)
+
+    def test_unicodeFilename(self):
+        # (Maya hands back unicode paths)
+        parsed = dty.parseSceneFilename(u"C20_3-lighting_004_final.ma")
+        self.assertEqual(parsed, ("C20", "3-lighting", "004", "final", ".ma"))
+
+        parsed = dty.parseSceneFilename(u"\u30c6\u30b9\u30c8_prop_001.ma")
+        self.assertEqual(parsed.name, u"\u30c6\u30b9\u30c8")
+        self.assertEqual(parsed.renamed(u"Hoge").name, "Hoge")
+
+
+class VersionTableTest(unittest.TestCase):
+    def test_orderAndLatest(self):
+        table = dty.VersionTable([("002", "B"), ("MASTER", ""), ("001", "A"), ("010", "")])
+
+        self.assertEqual(table.keys(), ["MASTER", "001", "002", "010"])
+        self.assertEqual(table.latest, "010")
+        self.assertEqual(table["001"], "A")
+        self.assertTrue("MASTER" in table)
+        self.assertFalse("003" in table)
+
+    def test_unpaddedSpellings(self):
+        table = dty.VersionTable([("12", ""), ("0042", "")])
+
+        self.assertTrue("12" in table)
+        self.assertFalse("012" in table)
+        self.assertEqual(table.keys(), ["12", "0042"])
+
+    def test_spellingsOfTheSameNumber(self):
+        table = dty.VersionTable([("001", "A"), ("0001", "B"), ("002", "")])
+
+        self.assertEqual(table.items(), [("0001", "B"), ("001", "A"), ("002", "")])
+        self.assertEqual(table.neighbours("001"), (None, "002"))
+        self.assertEqual(table.neighbours("002"), ("001", None))
+
+        table["001"] = "C"
+        self.assertEqual(table.items(), [("0001", "B"), ("001", "C"), ("002", "")])
+
+    def test_largeNumbers(self):
+        table = dty.VersionTable([("001", ""), ("70000", ""), ("20261018", "")])
+
+        self.assertEqual(table.keys(), ["001", "70000", "20261018"])
+        self.assertEqual(table.latest, "20261018")
+
+    def test_unicodeDescriptors(self):
+        # (Maya hands back unicode paths)
+        table = dty.VersionTable([(u"001", u"blocking"), (u"002", u"\u30c6\u30b9\u30c8")])
+
+        self.assertEqual(table["001"], "blocking")
+        self.assertEqual(table["002"], u"\u30c6\u30b9\u30c8")
+        self.assertEqual(table.latest, "002")
+
+
+class AssetScanTest(ProjectTestCase):
+    def test_strayFiles(self):
+        path = self.makeAsset("Bot", "rig", ["001", "0001", "002"], pointed="002")
+        _write(os.path.join(path, "Bot_rig_70000.ma"))
+
+        asset = dty.Asset(path, "rig")
+
+        self.assertEqual(asset.versions.keys(), ["MASTER", "0001", "001", "002", "70000"])
+        self.assertEqual(asset.latest, "70000")
+
+
+class WatcherTest(ProjectTestCase):
+    def setUp(self):
+        ProjectTestCase.setUp(self)
+
+        import snpPipeline.watcher as watcher
+        self.watcher = watcher
+
+        self.rig = self.makeAsset("Bot", "rig", ["001"], pointed="001")
+        self.rigs = dty.pathOfAssetType("rig")
+
+    def watchers(self):
+        watchers = [self.watcher.PollingWatcher(self.watcher.categoryDirs())]
+
+        try:
+            watchers.append(self.watcher.InotifyWatcher(self.watcher.categoryDirs()))
+        except (OSError, AttributeError):
+            pass
+
+        return watchers
+
+    def test_everyCursorSeesTheChanges(self):
+        for i, watcher in enumerate(self.watchers()):
+            first, second = watcher.cursor(), watcher.cursor()
+
+            # (the first time, everything has to be read)
+            self.assertEqual(first.popChanges(self.rigs), None)
+            self.assertEqual(second.popChanges(self.rigs), None)
+
+            _write(os.path.join(self.rig, "Bot_rig_00" + str(i + 2) + ".ma"))
+            other = self.makeAsset("Car" + "AB"[i], "rig", ["001"], pointed="001")
+
+            self.assertEqual(first.popChanges(self.rigs), set([self.rig, other]))
+            self.assertEqual(first.popChanges(self.rigs), set())
+            self.assertEqual(second.popChanges(self.rigs), set([self.rig, other]))
+
+            watcher.close()
+
+    def test_pollingSeesScenesSavedOverInPlace(self):
+        watcher = self.watcher.PollingWatcher(self.watcher.categoryDirs())
+        cursor = watcher.cursor()
+        cursor.popChanges(self.rigs)
+
+        # (another machine saving over the MASTER and the pointed
+        #  scene, the directory's mtime stays the same)
+        mtime = os.path.getmtime(self.rig)
+        _write(os.path.join(self.rig, "Bot_rig.ma"), "published again")
+        _write(os.path.join(self.rig, "Bot_rig_001.ma"), "saved over")
+        _touch(self.rig, mtime)
+
+        self.assertEqual(cursor.popChanges(self.rigs), set([self.rig]))
+        self.assertEqual(cursor.popChanges(self.rigs), set())
+
+    def test_categoryTypes(self):
+        self.assertEqual(self.watcher.categoryTypes(self.rigs), ["rig"])
+        self.assertEqual(self.watcher.categoryTypes(dty.pathOfAssetType("shot")), ["1-LO", "2-anim", "3-lighting"])
+
+
+class AssetIndexTest(ProjectTestCase):
+    def setUp(self):
+        ProjectTestCase.setUp(self)
+
+        import snpPipeline.assetindex as assetindex
+        self.index = assetindex.AssetIndex(os.path.join(self.root, "_temp", assetindex.INDEX_FILENAME))
+
+    def test_servesUnchangedDirectories(self):
+        path = self.makeAsset("Foo", "rig", ["001", "002"], pointed="002")
+
+        self.assertEqual(self.index.load(path, "rig").getMasterStatus(), 2)
+        self.assertEqual(self.index.load(path, "rig").getMasterStatus(), 2)
+        self.assertEqual((self.index.misses, self.index.hits), (1, 1))
+
+    def test_sceneSavedInPlace(self):
+        path = self.makeAsset("Foo", "rig", ["001", "002"], pointed="002")
+        self.assertEqual(self.index.load(path, "rig").getMasterStatus(), 2)
+
+        # (saving over the pointed scene leaves the directory's mtime alone)
+        dirMtime = os.stat(path).st_mtime
+        _touch(os.path.join(path, "Foo_rig_002.ma"), time.time() + 60)
+        self.assertEqual(os.stat(path).st_mtime, dirMtime)
+
+        self.assertEqual(dty.Asset(path, "rig").getMasterStatus(), 1)
+        self.assertEqual(self.index.load(path, "rig").getMasterStatus(), 1)
+
+    def test_keepsAStatusOfZero(self):
+        path = self.makeAsset("Foo", "rig", ["001", "002"], pointed="002")
+        asset = self.index.load(path, "rig")
+
+        # (like RenderManagerUI.deepCheck does)
+        asset._masterstatus = 0
+        self.assertEqual(asset.masterstatus, 0)
+
+    def test_pointerSavedInPlace(self):
+        path = self.makeAsset("Foo", "rig", ["001", "002"], pointed="002")
+        self.assertEqual(self.index.load(path, "rig").getMasterStatus(), 2)
+
+        _write(os.path.join(path, "Foo_rig.pointer"), "001")
+
+        self.assertEqual(self.index.load(path, "rig").getPointedVersion(), "001")
+
+    def test_corruptDatabase(self):
+        import snpPipeline.assetindex as assetindex
+
+        path = self.makeAsset("Foo", "rig", ["001", "002"], pointed="002")
+        dbpath = os.path.join(self.root, "_temp", "corrupt.db")
+        _write(dbpath, "not a database" * 100)
+
+        index = assetindex.AssetIndex(dbpath)
+        self.assertEqual(index.load(path, "rig").getMasterStatus(), 2)
+        self.assertEqual(index.load(path, "rig").getMasterStatus(), 2)
+
+    def test_lockedDatabase(self):
+        import sqlite3
+        import snpPipeline.assetindex as assetindex
+
+        path = self.makeAsset("Foo", "rig", ["001", "002"], pointed="002")
+        self.assertEqual(self.index.load(path, "rig").getMasterStatus(), 2)
+
+        # (another artist's session holding the write lock)
+        other = sqlite3.connect(self.index.dbpath)
+        other.execute("BEGIN EXCLUSIVE")
+        try:
+            _touch(os.path.join(path, "Foo_rig_002.ma"), time.time() + 60)
+            index = assetindex.AssetIndex(self.index.dbpath)
+            self.assertEqual(index.load(path, "rig").getMasterStatus(), 1)
+        finally:
+            other.rollback()
+            other.close()
+
+
+class ScanCategoriesTest(ProjectTestCase):
+    def test_warnsFromTheCallingThread(self):
+        import threading
+        import snpPipeline.core as core
+
+        self.makeAsset("Foo", "rig", ["001"], pointed="001")
+        shutil.rmtree(os.path.join(self.root, "1_3DCG", "Props"))
+
+        warnings = []
+
+        class Cmds(object):
+            def warning(self, message):
+                warnings.append((message, threading.current_thread()))
+
+        oldCmds = core.cmds
+        core.cmds = Cmds()
+        try:
+            names = core.scanCategories(("rig", "prop", "env"), workers=3)
+        finally:
+            core.cmds = oldCmds
+
+        self.assertEqual(names, {"rig": ["Foo"], "prop": None, "env": []})
+        self.assertEqual(warnings, [("No assets", threading.current_thread())])
+
+
+class OpenAssetInfoTest(ProjectTestCase):
+    def test_unicodeScenePath(self):
+        import snpPipeline.core as core
+
+        path = self.makeAsset("C20", "3-lighting", ["001", "002"], pointed="002")
+        scenepath = unicode(os.path.join(path, "C20_3-lighting_002.ma"))
+
+        class Cmds(object):
+            def file(self, **kwargs):
+                return scenepath
+
+        oldCmds = core.cmds
+        core.cmds = Cmds()
+        try:
+            info = core.getOpenAssetInfo()
+        finally:
+            core.cmds = oldCmds
+
+        self.assertEqual(info, ("C20", "002", "shot", "Lighting"))
+
+
+class RenameAssetTest(ProjectTestCase):
+    def test_sidecarsGoWithTheScenes(self):
+        import snpPipeline.core as core
+        import snpPipeline.deepcheck as deepcheck
+
+        path = self.makeAsset("Foo", "prop", ["001", "002"], pointed="002")
+        digests = dict((x, deepcheck.cachedDigest(os.path.join(path, "Foo_prop_" + x + ".ma")))
+                       for x in ("001", "002"))
+
+        # (a sidecar left over from a scene that was deleted)
+        _write(os.path.join(path, "Foo_prop_000.ma" + deepcheck.SIDECAR_EXT), "0 0 0\n")
+
+        core.renameAsset(dty.Asset(path, "prop"), "Bar")
+
+        newpath = dty.pathOfAssetType("prop", named="Bar")
+        sidecars = sorted(x for x in os.listdir(newpath) if x.endswith(deepcheck.SIDECAR_EXT))
+        self.assertEqual(sidecars, ["Bar_prop_001.ma" + deepcheck.SIDECAR_EXT,
+                                    "Bar_prop_002.ma" + deepcheck.SIDECAR_EXT])
+
+        for ver, digest in digests.items():
+            scene = os.path.join(newpath, "Bar_prop_" + ver + ".ma")
+            self.assertEqual(deepcheck._readSidecar(scene)[0], digest)
+            self.assertEqual(deepcheck.cachedDigest(scene), digest)
+
+
+class DuplicateAssetTest(ProjectTestCase):
+    def test_duplicate(self):
+        import threading
+        import snpPipeline.core as core
+
+        path = self.makeAsset("Foo", "prop", ["001", "002"], pointed="002")
+        os.mkdir(os.path.join(path, "Textures"))
+        os.mkdir(os.path.join(path, "Reference"))
+        for i in xrange(40):
+            _write(os.path.join(path, "Textures", "tex" + str(i) + ".png"), "texture")
+        _write(os.path.join(path, "Reference", "board.jpg"), "board")
+
+        calls = []
+        def progress(done, total):
+            calls.append((done, total, threading.current_thread()))
+
+        dup = core.duplicateAsset(dty.Asset(path, "prop"), "Bar", progress=progress, workers=2)
+
+        self.assertEqual(dup.name, "Bar")
+        self.assertEqual(list(dup.versions), ["MASTER", "001", "002"])
+        self.assertEqual(dup.getMasterStatus(), 2)
+
+        # (reported from this thread, ending with everything done)
+        self.assertEqual(calls[-1][:2], (45, 45))
+        self.assertTrue(all(x[2] is threading.current_thread() for x in calls))
+
+        # (editing the duplicate's textures leaves the original's alone)
+        _write(os.path.join(dup.getBaseDir(), "Textures", "tex0.png"), "edited")
+        with open(os.path.join(path, "Textures", "tex0.png")) as file:
+            self.assertEqual(file.read(), "texture")
+
+
+class ArchiveTest(ProjectTestCase):
+    def setUp(self):
+        ProjectTestCase.setUp(self)
+
+        import snpPipeline.archive as archive
+        self.archive = archive
+
+    def test_archiveAndExtract(self):
+        path = self.makeAsset("Foo", "prop", ["001", "002", "003"], pointed="003")
+        asset = dty.Asset(path, "prop")
+        mtime = os.path.getmtime(asset.fileFromVersion("001"))
+
+        archived = self.archive.archiveVersions(asset, keep=1)
+
+        self.assertEqual(sorted(os.path.basename(x) for x in archived), ["Foo_prop_001.ma", "Foo_prop_002.ma"])
+        self.assertFalse(os.path.exists(os.path.join(path, "Foo_prop_001.ma")))
+
+        asset = dty.Asset(path, "prop")
+        self.assertEqual(asset.archivedVersions(), {"001": "", "002": ""})
+
+        restored = asset.extractVersion("001")
+        with open(restored) as file:
+            self.assertEqual(file.read(), "001")
+        self.assertAlmostEqual(os.path.getmtime(restored), mtime, delta=0.001)
+        self.assertEqual(asset.archivedVersions(), {"002": ""})
+
+    def test_lazyShot(self):
+        import snpPipeline.core as core
+
+        path = self.makeAsset("C20", "1-LO", ["001", "002", "003"], pointed="003")
+        shot = core.lazyAsset(path, "shot")
+
+        archived = self.archive.archiveVersions(shot, keep=1)
+
+        self.assertEqual(len(archived), 2)
+
+    def test_renameKeepsArchive(self):
+        import snpPipeline.core as core
+
+        path = self.makeAsset("Foo", "prop", ["001", "002", "003"], pointed="003")
+        self.archive.archiveVersions(dty.Asset(path, "prop"), keep=1)
+
+        core.renameAsset(dty.Asset(path, "prop"), "Bar")
+
+        asset = dty.Asset(dty.pathOfAssetType("prop", named="Bar"), "prop")
+        self.assertEqual(asset.archivedVersions(), {"001": "", "002": ""})
+
+        restored = asset.extractVersion("002")
+        self.assertEqual(os.path.basename(restored), "Bar_prop_002.ma")
+        with open(restored) as file:
+            self.assertEqual(file.read(), "002")
+
+        # (archived again unchanged, it still comes out of the old member)
+        self.archive.archiveFiles([restored])
+        restored = dty.Asset(asset.getBaseDir(), "prop").extractVersion("002")
+        with open(restored) as file:
+            self.assertEqual(file.read(), "002")
+
+    def test_duplicateKeepsArchive(self):
+        import snpPipeline.core as core
+
+        path = self.makeAsset("Foo", "prop", ["001", "002", "003"], pointed="003")
+        self.archive.archiveVersions(dty.Asset(path, "prop"), keep=1)
+
+        linked = []
+        linkFile = core.copyengine.linkFile
+        def link(src, dst, hardlink=False):
+            linked.append((os.path.relpath(src, path).split(os.sep)[0], hardlink))
+            linkFile(src, dst, hardlink=hardlink)
+
+        core.copyengine.linkFile = link
+        try:
+            dup = core.duplicateAsset(dty.Asset(path, "prop"), "Bar")
+        finally:
+            core.copyengine.linkFile = linkFile
+
+        self.assertEqual(dup.archivedVersions(), {"001": "", "002": ""})
+        self.assertEqual(dty.Asset(path, "prop").archivedVersions(), {"001": "", "002": ""})
+
+        # (reflinked rather than copied, never hardlinked)
+        self.assertTrue(linked)
+        self.assertEqual(set(linked), set([(self.archive.ARCHIVE_DIR, False)]))
+
+    def test_publishArchivedVersion(self):
+        import snpPipeline.core as core
+
+        path = self.makeAsset("Foo", "prop", ["001", "002", "003"], pointed="003")
+        self.archive.archiveVersions(dty.Asset(path, "prop"), keep=1)
+
+        core.publishAsset(dty.Asset(path, "prop"), "001")
+
+        with open(os.path.join(path, "Foo_prop.ma")) as file:
+            self.assertEqual(file.read(), "001")
+
+
+class DeltaStoreTest(ProjectTestCase):
+    def setUp(self):
+        ProjectTestCase.setUp(self)
+
+        import snpPipeline.deltastore as deltastore
+        self.deltastore = deltastore
+
+    def makeVersions(self, name, atype, count):
+        """
+        An asset whose versions each add a line to the last one
+        """
+        path = self.makeAsset(name, atype, [dty._addPadding(str(i)) for i in xrange(1, count + 1)],
+                              pointed=dty._addPadding(str(count)))
+
+        contents = {}
+        lines = ["//Maya ASCII 2017 scene\n"] + ["createNode transform -n \"node%d\";\n" % i for i in xrange(200)]
+        for i in xrange(1, count + 1):
+            ver = dty._addPadding(str(i))
+            lines.append("setAttr \".tx\" %d;\n" % i)
+            contents[ver] = "".join(lines)
+
+            scene = os.path.join(path, dty.sceneFilename(name, atype, ver))
+            mtime = os.path.getmtime(scene)
+            _write(scene, contents[ver])
+            _touch(scene, mtime)
+
+        return path, contents
+
+    def test_delta(self):
+        old = ["a\n", "b\n", "c\n"]
+        new = ["a\n", "x\n", "c\n", "d\n"]
+
+        self.assertEqual(self.deltastore.applyDelta(old, self.deltastore.encodeDelta(old, new)), new)
+
+    def test_rebuildsWithoutTheCache(self):
+        path, contents = self.makeVersions("Foo", "prop", 25)
+        stored = self.deltastore.storeVersions(dty.Asset(path, "prop"), keep=1)
+        self.assertEqual(len(stored), 24)
+
+        store = self.deltastore.VersionStore(path, "Foo", "prop")
+        kinds = [x["kind"] for x in store.entries]
+        self.assertEqual(kinds[0], "full")
+        self.assertTrue("delta" in kinds)
+
+        for ver in sorted(store.versions()):
+            # (nothing cached, so every version comes from the store)
+            self.deltastore.trimCache(0)
+
+            with open(store.materialize(ver)) as file:
+                self.assertEqual(file.read(), contents[ver])
+
+    def test_keyframeInterval(self):
+        path, contents = self.makeVersions("Foo", "prop", 25)
+        self.deltastore.storeVersions(dty.Asset(path, "prop"), keep=1)
+
+        store = self.deltastore.VersionStore(path, "Foo", "prop")
+        for i in xrange(len(store.entries)):
+            self.assertTrue(i - store._keyframe(i) < self.deltastore.KEYFRAME_INTERVAL)
+
+    def test_lazyShot(self):
+        import snpPipeline.core as core
+
+        path, contents = self.makeVersions("C20", "2-anim", 4)
+        stored = self.deltastore.storeVersions(core.lazyAsset(path, "shot"), keep=1)
+
+        self.assertEqual(len(stored), 3)
+
+    def test_renameKeepsStore(self):
+        import snpPipeline.core as core
+
+        path, contents = self.makeVersions("Foo", "prop", 5)
+        self.deltastore.storeVersions(dty.Asset(path, "prop"), keep=1)
+
+        core.renameAsset(dty.Asset(path, "prop"), "Bar")
+
+        asset = dty.Asset(dty.pathOfAssetType("prop", named="Bar"), "prop")
+        self.assertEqual(sorted(asset.storedVersions()), ["001", "002", "003", "004"])
+
+        with open(asset._sceneFor("002")) as file:
+            self.assertEqual(file.read(), contents["002"])
+
+    def test_publishStoredVersion(self):
+        import snpPipeline.core as core
+
+        path, contents = self.makeVersions("Foo", "prop", 5)
+        self.deltastore.storeVersions(dty.Asset(path, "prop"), keep=1)
+
+        asset = dty.Asset(path, "prop")
+        core.publishAsset(asset, "002")
+
+        with open(os.path.join(path, "Foo_prop.ma")) as file:
+            self.assertEqual(file.read(), contents["002"])
+        self.assertEqual(dty.Asset(path, "prop").getPointedVersion(), "002")
+        self.assertTrue("002" in dty.Asset(path, "prop").versions)
+
+    def test_referenceStoredVersion(self):
+        import snpPipeline
+
+        path, contents = self.makeVersions("Foo", "prop", 5)
+        self.deltastore.storeVersions(dty.Asset(path, "prop"), keep=1)
+
+        calls = []
+
+        class Cmds(object):
+            def file(self, path, **kwargs):
+                calls.append((path, kwargs))
+
+        oldCmds = dty.cmds
+        dty.cmds = Cmds()
+        try:
+            asset = dty.Asset(path, "prop")
+            asset.importVersion("002", asReference=True)
+            asset.importVersion("003")
+        finally:
+            dty.cmds = oldCmds
+
+        # (the reference goes to the asset directory, through the project variable)
+        self.assertEqual(calls[0], (os.path.join("$" + snpPipeline.PROJECT_ROOT_VAR, "1_3DCG", "Props", "Foo",
+                                                 "Foo_prop_002.ma"), {"r": True, "namespace": "Foo"}))
+        with open(os.path.join(path, "Foo_prop_002.ma")) as file:
+            self.assertEqual(file.read(), contents["002"])
+
+        # (importing reads it from the cache, it stays stored)
+        self.assertEqual(calls[1][1], {"i": True, "namespace": "Foo"})
+        self.assertFalse(os.path.exists(os.path.join(path, "Foo_prop_003.ma")))
+
+
+class DependencyGraphTest(ProjectTestCase):
+    def setUp(self):
+        ProjectTestCase.setUp(self)
+
+        import snpPipeline.depgraph as depgraph
+        depgraph._graph = None
+        self.depgraph = depgraph
+
+        self.rig = self.makeAsset("Bot", "rig", ["001"], pointed="001")
+        self.shot = self.makeAsset("C20", "3-lighting", ["001"], pointed="001")
+        self.reference(os.path.join(self.shot, "C20_3-lighting_001.ma"), "1_3DCG/Rigs/Bot/Bot_rig.ma")
+
+    def reference(self, scene, path):
+        mtime = os.path.getmtime(scene)
+        _write(scene, '//Maya ASCII 2017 scene\n'
+                      'file -r -ns "Bot" -dr 1 -rfn "BotRN" -typ "mayaAscii" "' + path + '";\n'
+                      'createNode transform -n "root";\n')
+        _touch(scene, mtime)
+
+    def test_shotsDependingOn(self):
+        graph = self.depgraph.getGraph()
+
+        self.assertEqual(graph.shotsDependingOn(dty.Asset(self.rig, "rig")), {"C20": ["3-lighting"]})
+        self.assertEqual(graph.referencesOf(os.path.join(self.shot, "C20_3-lighting_001.ma")),
+                         [os.path.join(self.rig, "Bot_rig.ma")])
+
+    def test_updateFindsNewShotScenes(self):
+        graph = self.depgraph.getGraph()
+
+        # (a shot saved since, and a new version of the rig)
+        other = self.makeAsset("C30", "3-lighting", ["001"], pointed="001")
+        self.reference(os.path.join(other, "C30_3-lighting_001.ma"), "1_3DCG/Rigs/Bot/Bot_rig.ma")
+        _write(os.path.join(self.rig, "Bot_rig_002.ma"), "002")
+
+        graph = self.depgraph.getGraph()
+
+        # (only the new scenes get read, C30's MASTER and version and the rig's version)
+        self.assertEqual(graph.scanned, 3)
+        self.assertEqual(sorted(graph.shotsDependingOn(dty.Asset(self.rig, "rig"))), ["C20", "C30"])
+
+        self.assertEqual(self.depgraph.getGraph().scanned, 0)
+
+    def test_updateInBackground(self):
+        graphs = []
+
+        self.depgraph.updateInBackground(graphs.append).join()
+
+        self.assertEqual(graphs, [self.depgraph.getGraph(update=False)])
+        self.assertEqual(graphs[0].shotsDependingOn(dty.Asset(self.rig, "rig")), {"C20": ["3-lighting"]})
+        self.assertTrue(os.path.exists(graphs[0].cachepath))
+
+
+class RenderTestCase(ProjectTestCase):
+    """
+    Project with a 3_Comp folder for the renders to go to
+    """
+    def setUp(self):
+        ProjectTestCase.setUp(self)
+
+        import snpPipeline.rendercore as rendercore
+        self.rendercore = rendercore
+        self._oldRenderRoot = rendercore.ROOT_DIR
+        rendercore.ROOT_DIR = self.root
+        os.mkdir(os.path.join(self.root, "3_Comp"))
+
+    def tearDown(self):
+        self.rendercore.ROOT_DIR = self._oldRenderRoot
+        ProjectTestCase.tearDown(self)
+
+    def shot(self, start, end):
+        path = self.makeAsset("C40", "3-lighting", ["001"], pointed="001")
+        _write(os.path.join(path, "C40_3-lighting_001.ma"),
+               'select -ne :defaultRenderGlobals;\n\tsetAttr ".fs" %d;\n\tsetAttr ".ef" %d;\n' % (start, end))
+
+        return dty.Asset(path, "3-lighting")
+
+
+class RenderJobsTest(RenderTestCase):
+    def test_frameChunks(self):
+        import snpPipeline.renderqueue as renderqueue
+
+        self.assertEqual(renderqueue.frameChunks(1, 50, 24), [(1, 17), (18, 34), (35, 50)])
+        self.assertEqual(renderqueue.frameChunks(5, 5, 24), [(5, 5)])
+        self.assertRaises(ValueError, renderqueue.frameChunks, 10, 1, 24)
+
+    def test_chunksTheRenderRange(self):
+        jobs = self.rendercore.renderJobs(self.shot(1, 30), "001", "png", chunkSize=10)
+
+        self.assertEqual([(x.start, x.end) for x in jobs], [(1, 10), (11, 20), (21, 30)])
+
+    def test_skipsABackwardsRange(self):
+        scene = self.shot(20, 10)
+
+        self.assertEqual(self.rendercore.renderJobs(scene, "001", "png"), [])
+        self.assertEqual(self.rendercore.renderJobs(scene, "001", "png", resume=True), [])
+
+
+class RenderSeqBackgroundTest(RenderTestCase):
+    def setUp(self):
+        RenderTestCase.setUp(self)
+
+        import snpPipeline.renderqueue as renderqueue
+        import snpPipeline.seq_rendercore as seq_rendercore
+        self.seq = seq_rendercore
+
+        root = self.root
+        started = self.started = []
+
+        class Queue(renderqueue.RenderQueue):
+            def start(self):
+                started.append(self)
+
+        class Cmds(object):
+            def ls(self, **kwargs):
+                return ["defaultRenderLayer", "bg", "ref:fg"]
+
+            def getAttr(self, attr):
+                return 1 if attr.endswith("startFrame") else 10
+
+            def file(self, path=None, **kwargs):
+                if kwargs.get("q"):
+                    return os.path.join(root, "C40_3-lighting_001.ma")
+
+                self.exported = kwargs
+                _write(path)
+
+        class Mel(object):
+            def eval(self, command):
+                pass
+
+        self.cmds = Cmds()
+        self._old = dict((x, getattr(seq_rendercore, x)) for x in
+                         ("cmds", "mel", "newRenderQueue", "RENDER_SCENES", "BATCH_TMP"))
+
+        seq_rendercore.cmds = self.cmds
+        seq_rendercore.mel = Mel()
+        seq_rendercore.newRenderQueue = lambda: Queue(os.path.join(root, "logs"))
+        seq_rendercore.RENDER_SCENES = os.path.join(root, "render_scenes")
+        seq_rendercore.BATCH_TMP = os.path.join(root, "batch")
+
+    def tearDown(self):
+        for name, value in self._old.items():
+            setattr(self.seq, name, value)
+
+        RenderTestCase.tearDown(self)
+
+    def test_startsTheQueueItMakes(self):
+        queue = self.seq.renderSeqBackground("C40", "png")
+
+        self.assertEqual(self.started, [queue])
+        self.assertEqual([(x.layer, x.start, x.frames) for x in queue.jobs], [("bg", None, 10)])
+        self.assertTrue(self.cmds.exported["exportAll"])
+
+    def test_leavesAQueueGivenToTheCaller(self):
+        import snpPipeline.renderqueue as renderqueue
+
+        queue = renderqueue.RenderQueue(os.path.join(self.root, "logs"))
+        self.assertTrue(self.seq.renderSeqBackground("C40", "png", queue=queue) is queue)
+        self.assertEqual(self.started, [])
+
+    def test_resumedRangesCountTheirOwnFrames(self):
+        queue = self.seq.renderSeqBackground("C40", "png", resume=True)
+
+        self.assertEqual(self.started, [queue])
+        self.assertEqual([(x.start, x.end, x.frames, x.frameCount()) for x in queue.jobs], [(1, 10, None, 10)])
+
+
+class RenderQueueTest(unittest.TestCase):
+    def setUp(self):
+        import snpPipeline.renderqueue as renderqueue
+        import snpPipeline.renderjournal as renderjournal
+
+        self.renderqueue = renderqueue
+        self.folder = tempfile.mkdtemp(prefix="snp_tests_")
+        self.journal = renderjournal.RenderJournal(os.path.join(self.folder, renderjournal.JOURNAL_FILENAME))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_jobThatRaises(self):
+        renderqueue = self.renderqueue
+        finished = []
+
+        class Queue(renderqueue.RenderQueue):
+            def _execute(self, job):
+                if job.name == "C10":
+                    raise RuntimeError("no render license")
+
+                return 0
+
+        queue = Queue(os.path.join(self.folder, "logs"), workers=1, journal=self.journal)
+        queue.onFinished = finished.append
+        jobs = [queue.add(renderqueue.RenderJob(x, "render " + x)) for x in ("C10", "C20")]
+
+        queue.start()
+        self.assertFalse(queue.wait())
+
+        self.assertEqual([x.status for x in jobs], [renderqueue.FAILED, renderqueue.DONE])
+        self.assertEqual(finished, [queue])
+        self.assertEqual(self.journal.interruptedJobs(), [])
+
+    def test_cancelStopsWhatTheRenderStarted(self):
+        import platform
+
+        renderqueue = self.renderqueue
+        if platform.system() == "Windows":
+            return
+
+        # (a render whose own child process keeps the output open)
+        queue = renderqueue.RenderQueue(os.path.join(self.folder, "logs"), retries=0)
+        job = queue.add(renderqueue.RenderJob("C10", "sh -c 'sleep 30; true'"))
+
+        queue.start()
+        while not queue._processes:
+            time.sleep(0.05)
+
+        started = time.time()
+        queue.cancel()
+        queue.wait()
+
+        self.assertLess(time.time() - started, 10)
+        self.assertEqual(job.status, renderqueue.CANCELLED)
+
+
+class RenderJournalTest(unittest.TestCase):
+    def setUp(self):
+        import sys
+        import subprocess
+        import snpPipeline.renderjournal as renderjournal
+
+        self.renderjournal = renderjournal
+        self.folder = tempfile.mkdtemp(prefix="snp_tests_")
+        self.journal = renderjournal.RenderJournal(os.path.join(self.folder, renderjournal.JOURNAL_FILENAME))
+
+        # (a process that isn't running anymore)
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        self.deadPid = process.pid
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def crash(self):
+        """
+        Make the journal look written by a process that died
+        """
+        import json
+
+        entries = list(self.journal.entries())
+        with open(self.journal.path, mode="w") as file:
+            for entry in entries:
+                entry["pid"] = self.deadPid
+                file.write(json.dumps(entry) + "\n")
+
+    def batch(self):
+        import snpPipeline.renderqueue as renderqueue
+
+        jobs = [renderqueue.RenderJob("C10_" + str(x), "render " + str(x), shot="C10", start=x, end=x + 9)
+                for x in (1, 11, 21)]
+
+        for job in jobs:
+            self.journal.record("queued", job)
+
+        jobs[0].status = renderqueue.DONE
+        self.journal.record("started", jobs[0])
+        self.journal.record("finished", jobs[0])
+        self.journal.record("started", jobs[1])
+
+        return jobs
+
+    def test_interruptedJobs(self):
+        jobs = self.batch()
+
+        # (the process that queued them is still running)
+        self.assertEqual(self.journal.interruptedJobs(), [])
+
+        self.crash()
+        interrupted = self.journal.interruptedJobs()
+
+        self.assertEqual([x.id for x in interrupted], [jobs[1].id, jobs[2].id])
+        self.assertEqual((interrupted[1].command, interrupted[1].start, interrupted[1].end), ("render 21", 21, 30))
+
+    def test_dismissedJobsArentOfferedAgain(self):
+        jobs = self.batch()
+        self.crash()
+
+        self.journal.dismiss(self.journal.interruptedJobs()[:1])
+        self.crash()
+
+        self.assertEqual([x.id for x in self.journal.interruptedJobs()], [jobs[2].id])
+
+    def test_compactDropsJobsThatAreThrough(self):
+        jobs = self.batch()
+        self.crash()
+        self.journal.dismiss([jobs[2]])
+
+        self.assertEqual(self.journal.compact(), 5)
+        self.assertEqual(sorted(set(x["id"] for x in self.journal.entries())), [jobs[1].id])
+        self.assertEqual(self.journal.compact(), 0)
+
+        self.crash()
+        self.assertEqual([x.id for x in self.journal.interruptedJobs()], [jobs[1].id])
+
+
+class CopyEngineTest(unittest.TestCase):
+    def setUp(self):
+        import snpPipeline.copyengine as copyengine
+
+        self.copyengine = copyengine
+        self.folder = tempfile.mkdtemp(prefix="snp_tests_")
+
+        self.src = os.path.join(self.folder, "src.ma")
+        _write(self.src, "scene " * 100000)
+        _touch(self.src, time.time() - 3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read(self, path):
+        with open(path, mode="rb") as file:
+            return file.read()
+
+    def test_everyMethodCopies(self):
+        for name, method in self.copyengine.METHODS:
+            dst = os.path.join(self.folder, name + ".ma")
+
+            try:
+                self.assertEqual(self.copyengine.copyFile(self.src, dst, [(name, method)]), name)
+            except self.copyengine.CopyUnsupported:
+                continue
+
+            self.assertEqual(self.read(dst), self.read(self.src))
+
+    def test_replacesAndKeepsStat(self):
+        dst = os.path.join(self.folder, "dst.ma")
+        _write(dst, "old")
+
+        self.copyengine.copyFile(self.src, dst, keepStat=True)
+
+        self.assertEqual(self.read(dst), self.read(self.src))
+        self.assertAlmostEqual(os.path.getmtime(dst), os.path.getmtime(self.src), delta=0.001)
+        self.assertEqual(sorted(os.listdir(self.folder)), ["dst.ma", "src.ma"])
+
+    def test_failedCopyLeavesNothingBehind(self):
+        dst = os.path.join(self.folder, "dst.ma")
+        _write(dst, "old")
+
+        def broken(infd, outfd, size):
+            os.write(outfd, b"half")
+            raise IOError(5, "Input/output error")
+
+        self.assertRaises(IOError, self.copyengine.copyFile, self.src, dst, [("broken", broken)])
+        self.assertEqual(self.read(dst), b"old")
+        self.assertEqual(sorted(os.listdir(self.folder)), ["dst.ma", "src.ma"])
+
+    def test_linkWithoutHardlinkIsSeparate(self):
+        dst = os.path.join(self.folder, "dst.ma")
+
+        self.assertNotEqual(self.copyengine.linkFile(self.src, dst, hardlink=False), "hardlink")
+
+        _write(dst, "edited")
+        self.assertEqual(self.read(self.src), b"scene " * 100000)
+
+
+class FootageTest(unittest.TestCase):
+    def setUp(self):
+        import snpPipeline.footage as footage
+
+        self.footage = footage
+        self.folder = tempfile.mkdtemp(prefix="snp_tests_")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def frame(self, number, contents=b"\x89PNG" + b"IEND\xaeB`\x82", ext=".png"):
+        path = os.path.join(self.folder, "bg.%04d%s" % (number, ext))
+        with open(path, mode="wb") as file:
+            file.write(contents)
+
+        return path
+
+    def test_missingRanges(self):
+        missingRanges = self.footage.missingRanges
+
+        self.assertEqual(missingRanges(1, 10, set()), [(1, 10)])
+        self.assertEqual(missingRanges(1, 10, set(range(1, 11))), [])
+        self.assertEqual(missingRanges(1, 10, set([1, 2, 5, 6, 10])), [(3, 4), (7, 9)])
+        self.assertEqual(missingRanges(-2, 2, set([0])), [(-2, -1), (1, 2)])
+
+    def test_completeFrames(self):
+        for frame in (1, 2, 3, 4):
+            self.frame(frame)
+
+        # (cut short, empty, padded, another format)
+        self.frame(2, b"\x89PNG")
+        self.frame(3, b"")
+        self.frame(4, b"\x89PNG" + b"IEND\xaeB`\x82" + b"\x00" * 16)
+        self.frame(5, ext=".exr")
+
+        self.assertEqual(self.footage.completeFrames(self.folder, ".png"), set([1, 4]))
+        self.assertEqual(self.footage.completeFrames(self.folder), set([1, 4, 5]))
+
+    def test_framesToRender(self):
+        scene = os.path.join(self.folder, "scene.ma")
+        _write(scene)
+
+        for frame in range(1, 11):
+            self.frame(frame)
+
+        _touch(self.frame(4), time.time() - 3600)
+        _touch(scene, time.time() - 60)
+
+        self.assertEqual(self.footage.framesToRender(self.folder, 1, 12, "png", scene), [(4, 4), (11, 12)])
+
+
+class ParseFrameDoneTest(unittest.TestCase):
+    def test_renderers(self):
+        from snpPipeline.rendermetrics import parseFrameDone
+
+        self.assertEqual(parseFrameDone("Finished Rendering /proj/images/bg/bg.0001.png.\n"),
+                         "/proj/images/bg/bg.0001.png")
+        self.assertEqual(parseFrameDone("// Result: C:/proj/images/bg/bg.0012.exr\r\n"),
+                         "C:/proj/images/bg/bg.0012.exr")
+        self.assertEqual(parseFrameDone("Saved: '/tmp/C10/fg/fg_0003.png'\n"), "/tmp/C10/fg/fg_0003.png")
+        self.assertEqual(parseFrameDone("Saved: /tmp/C10/fg/fg_0004.jpg Time: 00:01.20 (Saving: 00:00.10)"),
+                         "/tmp/C10/fg/fg_0004.jpg")
+
+    def test_otherOutput(self):
+        from snpPipeline.rendermetrics import parseFrameDone
+
+        self.assertEqual(parseFrameDone("Starting Rendering /proj/images/bg/bg.0001.png\n"), None)
+        self.assertEqual(parseFrameDone("Result: 1"), None)
+        self.assertEqual(parseFrameDone(""), None)
+
+
+HEADER = '''//Maya ASCII 2017 scene
+requires maya "2017";
+file -r -ns "Bot" -dr 1 -rfn "BotRN" -typ "mayaAscii" "1_3DCG/Rigs/Bot/Bot_rig.ma";
+currentUnit -l centimeter -a degree -t film;
+'''
+
+PLAYBACK = '''createNode script -n "sceneConfigurationScriptNode";
+\tsetAttr ".b" -type "string" "playbackOptions -min 1 -max 120 -ast 1 -aet 200 ";
+\tsetAttr ".st" 6;
+'''
+
+NODES = '''createNode transform -n "shotCam";
+createNode camera -n "shotCamShape" -p "shotCam";
+\tsetAttr -k off ".v";
+\tsetAttr ".rnd" yes;
+createNode camera -n "perspShape" -p "persp";
+\tsetAttr ".rnd" no;
+createNode renderLayer -n "bg";
+\tsetAttr ".rndr" yes;
+createNode renderLayer -n "fg";
+\tsetAttr ".rndr" no;
+'''
+
+RENDER_GLOBALS = '''select -ne :defaultRenderGlobals;
+\tsetAttr ".fs" 10;
+\tsetAttr ".ef" 50;
+select -ne :defaultResolution;
+\tsetAttr ".w" 1920;
+'''
+
+MEMBERS = '''connectAttr "bg.ri" "pCube1.rlio[0]";
+connectAttr "fg.ri" "pSphere1.rlio[1]";
+'''
+
+
+class MaFileTest(unittest.TestCase):
+    def setUp(self):
+        import snpPipeline.mafile as mafile
+
+        self.mafile = mafile
+        self.folder = tempfile.mkdtemp(prefix="snp_tests_")
+        self.path = os.path.join(self.folder, "C10_3-lighting_001.ma")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def scene(self, *parts):
+        _write(self.path, "".join(parts))
+        return self.mafile.readMetadata(self.path)
+
+    def test_wholeScene(self):
+        metadata = self.scene(HEADER, NODES, PLAYBACK, RENDER_GLOBALS, MEMBERS)
+
+        self.assertEqual((metadata.minTime, metadata.maxTime, metadata.animStart, metadata.animEnd),
+                         (1, 120, 1, 200))
+        self.assertEqual((metadata.renderStart, metadata.renderEnd), (10, 50))
+        self.assertEqual(self.mafile.frameRange(metadata), (10, 50))
+
+        self.assertEqual(self.mafile.renderableCameras(metadata), ["shotCam|shotCamShape"])
+        self.assertEqual(self.mafile.renderableLayers(metadata), ["bg"])
+        self.assertEqual(metadata.renderLayers["fg"].members, ["pSphere1"])
+
+    def test_onlyTheTimeSlider(self):
+        metadata = self.scene(HEADER, NODES, PLAYBACK)
+
+        self.assertEqual((metadata.renderStart, metadata.renderEnd), (None, None))
+        self.assertEqual(self.mafile.frameRange(metadata), (1, 120))
+
+    def test_noFrameRange(self):
+        metadata = self.scene(HEADER, NODES)
+
+        self.assertEqual(metadata.minTime, None)
+        self.assertEqual(self.mafile.frameRange(metadata), None)
+
+        self.assertEqual(self.mafile.frameRange(self.scene()), None)
+
+    def test_truncatedHeader(self):
+        # (a copy that stopped halfway through the header)
+        self.scene(HEADER, 'file -r -ns "Car" -dr 1 -rfn "CarRN" -typ "mayaAscii" "1_3DCG/Prop')
+
+        self.assertEqual([x.namespace for x in self.mafile.scanReferences(self.path)], ["Bot"])
+
+        metadata = self.scene(HEADER, 'createNode camera -n "shotCamShape" -p "sho')
+        self.assertEqual(metadata.cameras, {})
+        self.assertEqual(self.mafile.frameRange(metadata), None)
+
+        metadata = self.scene(HEADER, RENDER_GLOBALS[:RENDER_GLOBALS.index("50")])
+        self.assertEqual((metadata.renderStart, metadata.renderEnd), (10, None))
+        self.assertEqual(self.mafile.frameRange(metadata), None)
+
+    def test_staleCacheEntry(self):
+        cachepath = os.path.join(self.folder, "_temp", self.mafile.METADATA_FILENAME)
+
+        cache = self.mafile.MetadataCache(cachepath)
+        self.scene(HEADER, PLAYBACK)
+        _touch(self.path, time.time() - 60)
+        self.assertEqual(self.mafile.frameRange(cache.get(self.path)), (1, 120))
+        cache.save()
+
+        # (the render range set and the scene saved again)
+        self.scene(HEADER, PLAYBACK, RENDER_GLOBALS)
+        self.assertEqual(self.mafile.frameRange(cache.get(self.path)), (10, 50))
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+        # (the saved entry is as stale as the one in memory was)
+        cache = self.mafile.MetadataCache(cachepath)
+        self.assertEqual(self.mafile.frameRange(cache.get(self.path)), (10, 50))
+        self.assertEqual(self.mafile.frameRange(cache.get(self.path)), (10, 50))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
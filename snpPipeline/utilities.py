@@ -1,4 +1,4 @@
-import maya.cmds as cmds
+from snpPipeline.mayaadapter import cmds
 
 def saveFile():
 	cmds.file(save=True, type="mayaAscii")
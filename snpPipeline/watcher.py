@@ -0,0 +1,427 @@
+"""
+Filesystem watcher for the asset directories
+
+Keeps a log of the asset directories (1_3DCG/*/*) that
+changed, so that managers only have to re-parse those on
+refresh. Each manager reads it through a WatchCursor of its
+own, so one manager asking doesn't hide changes from another.
+
+Uses inotify on Linux, otherwise (or when the project is on
+a network share, where inotify doesn't see what other
+machines write) falls back to polling.
+"""
+import os
+import errno
+import struct
+import ctypes
+import ctypes.util
+import platform
+from collections import deque
+
+import snpPipeline.dataTypes as dty
+import snpPipeline.assetindex as assetindex
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")
+
+# Events we care about in a category directory (assets coming and going)
+CATEGORY_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+# Events we care about in an asset directory (scenes and pointers changing)
+ASSET_MASK = CATEGORY_MASK | IN_CLOSE_WRITE
+
+# Files in an asset directory that make it dirty
+WATCHED_EXTS = (".ma", ".pointer")
+
+
+# Changes kept for the cursors (a cursor further behind
+# than that re-reads everything)
+MAX_CHANGES = 10000
+
+# Filesystems other machines write to (see /proc/mounts)
+NETWORK_FS = ("nfs", "nfs4", "cifs", "smb", "smbfs", "smb3", "afs", "ncpfs", "9p",
+              "fuse.sshfs", "glusterfs", "ceph", "lustre")
+
+
+def categoryDirs():
+    """
+    All of the existing asset category directories (1_3DCG/*)
+    """
+    paths = set(dty.pathOfAssetType(atype) for atype in dty.ASSET_TYPES)
+    return sorted(x for x in paths if os.path.isdir(x))
+
+
+def categoryTypes(root):
+    """
+    Asset types kept in a category directory (the shot
+    stages for Scenes)
+    """
+    return sorted(x for x in dty.ASSET_TYPES if x != "shot" and dty.pathOfAssetType(x) == root)
+
+
+def mountType(path):
+    """
+    Filesystem type 'path' is on (Linux only, None elsewhere)
+    """
+    path = os.path.realpath(path)
+    best, fstype = None, None
+
+    try:
+        with open("/proc/mounts", mode="r") as file:
+            lines = file.readlines()
+    except IOError:
+        return None
+
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+
+        mount = fields[1].replace("\\040", " ")
+
+        if path != mount and not path.startswith(mount.rstrip("/") + "/"):
+            continue
+
+        if best is None or len(mount) > len(best):
+            best, fstype = mount, fields[2]
+
+    return fstype
+
+
+def isNetworkPath(path):
+    return mountType(path) in NETWORK_FS
+
+
+class Watcher(object):
+    """
+    Base watcher
+
+    Subclasses implement _collect(), which logs the changed
+    asset directories with _add() (and categories it lost
+    track of with _lose())
+    """
+    def __init__(self, roots):
+        # Category directories being watched
+        self.roots = roots
+
+        # (serial, path, lost) of every change, oldest first; a
+        # lost category directory has everything in it re-read
+        self._log = deque()
+        self._serial = 0
+
+        # Serial of the newest change dropped from the log
+        self._forgotten = 0
+
+        # Category directories it can't tell the changes of
+        self._blind = set()
+
+    def _add(self, path, lost=False):
+        self._serial += 1
+        self._log.append((self._serial, path, lost))
+
+        if len(self._log) > MAX_CHANGES:
+            self._forgotten = self._log.popleft()[0]
+
+    def _lose(self, root):
+        self._add(root, lost=True)
+
+    def _collect(self, under):
+        raise NotImplementedError
+
+    def changesSince(self, serial, under):
+        """
+        The asset directories in the category directory
+        'under' that changed after the change 'serial'
+
+        @RETURNS
+            (set of paths or None if everything should be
+            re-read, serial of the latest change)
+        """
+        self._collect(under)
+
+        if serial is None or serial < self._forgotten or under not in self.roots or under in self._blind:
+            return None, self._serial
+
+        changed = set()
+        for number, path, lost in reversed(self._log):
+            if number <= serial:
+                break
+
+            if lost and path == under:
+                return None, self._serial
+
+            if not lost and os.path.dirname(path) == under:
+                changed.add(path)
+
+        return changed, self._serial
+
+    def cursor(self):
+        return WatchCursor(self)
+
+    def close(self):
+        pass
+
+
+class WatchCursor(object):
+    """
+    One consumer's place in a watcher's changes (the
+    shared one, see getWatcher, unless it's given one)
+    """
+    def __init__(self, watcher=None):
+        # (None follows the shared watcher, even when it's made again)
+        self._fixed = watcher
+        self.watcher = watcher
+
+        # category directory : serial of the last change seen there
+        self._seen = {}
+
+    def popChanges(self, under):
+        """
+        Returns the asset directories in the category
+        directory 'under' that changed since the last call,
+        or None if everything should be re-read (the first
+        time, or if the watcher was made again)
+        """
+        watcher = self._fixed or getWatcher()
+
+        if watcher is not self.watcher:
+            self.watcher = watcher
+            self._seen = {}
+
+        changed, self._seen[under] = watcher.changesSince(self._seen.get(under), under)
+
+        return changed
+
+
+class InotifyWatcher(Watcher):
+    """
+    Watcher using inotify (Linux only)
+
+    Events are read without blocking whenever changes are
+    asked for, so no thread is needed
+    """
+    def __init__(self, roots):
+        super(InotifyWatcher, self).__init__(roots)
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # watch descriptor : path
+        self._watches = {}
+
+        for root in roots:
+            self._watch(root, CATEGORY_MASK)
+
+            for name in dty.listSubdirs(root):
+                self._watch(os.path.join(root, name), ASSET_MASK)
+
+    def _watch(self, path, mask):
+        bpath = path if isinstance(path, bytes) else path.encode("utf8")
+
+        wd = self._libc.inotify_add_watch(self._fd, bpath, mask)
+
+        if wd < 0:
+            # (out of watches or the directory went away, either way
+            #  we can't tell what changes in this category)
+            self._blind.add(path if mask == CATEGORY_MASK else os.path.dirname(path))
+            return
+
+        self._watches[wd] = path
+
+    def _events(self):
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+
+                yield wd, mask, name
+
+    def _collect(self, under):
+        for wd, mask, name in self._events():
+            if mask & IN_Q_OVERFLOW:
+                for root in self.roots:
+                    self._lose(root)
+                continue
+
+            path = self._watches.get(wd)
+
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+
+            if path is None:
+                continue
+
+            if not isinstance(name, str):
+                name = name.decode("utf8")
+
+            if path in self.roots:
+                # an asset directory was added, removed or renamed
+                if not mask & IN_ISDIR:
+                    continue
+
+                assetdir = os.path.join(path, name)
+                self._add(assetdir)
+
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch(assetdir, ASSET_MASK)
+            elif name.endswith(WATCHED_EXTS):
+                # a scene or pointer changed inside an asset directory
+                self._add(path)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher(Watcher):
+    """
+    Watcher that compares the mtimes of the directories and
+    the (mtime, size) of the files each asset's master status
+    depends on (its pointers, MASTER and pointed scenes, see
+    assetindex.scanDir), which can be saved over in place
+    without the directory changing
+
+    Costs a few stats per asset directory of a category when
+    its changes are asked for (the first time, it lists them
+    all). Sees what other machines write on a network share
+    """
+    def __init__(self, roots):
+        super(PollingWatcher, self).__init__(roots)
+
+        # category directory : st_mtime_ns
+        self._mtimes = {}
+
+        # category directory : { asset directory : (st_mtime_ns, stamps) }
+        self._assets = {}
+
+    def _stat(self, path):
+        try:
+            return dty.mtimeNs(os.stat(path))
+        except OSError:
+            return None
+
+    def _state(self, path, atypes):
+        # (the directory's mtime first, so a write while scanning shows up next time)
+        mtime = self._stat(path)
+        if mtime is None:
+            return None
+
+        try:
+            return mtime, assetindex.scanDir(path, atypes)["stamps"]
+        except OSError:
+            return None
+
+    def _baseline(self, root):
+        self._mtimes[root] = self._stat(root)
+        self._assets[root] = {}
+
+        atypes = categoryTypes(root)
+
+        for name in dty.listSubdirs(root):
+            path = os.path.join(root, name)
+            self._assets[root][path] = self._state(path, atypes)
+
+    def _collect(self, under):
+        if under not in self.roots:
+            return
+
+        if under not in self._mtimes:
+            try:
+                self._baseline(under)
+            except OSError:
+                self._mtimes.pop(under, None)
+                self._lose(under)
+            return
+
+        mtime = self._stat(under)
+
+        if mtime is None:
+            self._lose(under)
+            return
+
+        assets = self._assets[under]
+        atypes = categoryTypes(under)
+
+        # assets were added, removed or renamed
+        if mtime != self._mtimes[under]:
+            self._mtimes[under] = mtime
+
+            for name in dty.listSubdirs(under):
+                assets.setdefault(os.path.join(under, name), None)
+
+        for path, state in list(assets.items()):
+            if state is not None and self._stat(path) == state[0] and assetindex.stampsCurrent(path, state[1]):
+                continue
+
+            newstate = self._state(path, atypes)
+
+            if newstate is None:
+                del assets[path]
+            else:
+                assets[path] = newstate
+
+            if newstate is not None or state is not None:
+                self._add(path)
+
+
+def createWatcher():
+    """
+    Make a watcher over all of the category directories,
+    using inotify where we can (on Linux, when the project
+    is on a local disk)
+    """
+    roots = categoryDirs()
+
+    if platform.system() == "Linux" and not any(isNetworkPath(x) for x in roots):
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError):
+            # (no inotify in this libc)
+            pass
+
+    return PollingWatcher(roots)
+
+
+_watcher = None
+
+def getWatcher():
+    """
+    The watcher shared by all of the managers
+    """
+    global _watcher
+
+    if _watcher is None or _watcher.roots != categoryDirs():
+        if _watcher:
+            _watcher.close()
+
+        _watcher = createWatcher()
+
+    return _watcher